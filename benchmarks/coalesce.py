@@ -0,0 +1,114 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import re
+from threading import Thread
+
+from aiohttp import web
+
+from datalad_fuse.coalesce import DEFAULT_COALESCE_GAP, multirange_support
+from datalad_fuse.fsspec import get_client
+from datalad_fuse.httpfile import AnnexHTTPFileSystem
+
+FILE_SIZE = 64 * 1024 * 1024
+READ_SIZE = 4096
+READS = 64
+#: Simulated latency of each request (as to a remote host), in seconds
+LATENCY = 0.05
+CONTENT = bytes(range(256)) * (FILE_SIZE // 256)
+BOUNDARY = "BENCHMARK_BOUNDARY"
+#: Distance between the starts of successive reads for each access pattern
+STRIDES = {"nearby": 16 * 1024, "scattered": FILE_SIZE // READS}
+
+
+@contextmanager
+def range_server():
+    """Serve ``CONTENT`` at ``/data.bin`` over HTTP/1.1 with aiohttp, answering
+    requests for single and multiple ranges"""
+
+    async def handler(request):
+        await asyncio.sleep(LATENCY)
+        ranges = [
+            (int(a), int(b) + 1)
+            for a, b in re.findall(r"(\d+)-(\d+)", request.headers.get("Range", ""))
+        ]
+        if not ranges:
+            return web.Response(body=CONTENT)
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            return web.Response(
+                status=206,
+                body=CONTENT[start:end],
+                headers={"Content-Range": f"bytes {start}-{end - 1}/{FILE_SIZE}"},
+            )
+        body = b"".join(
+            f"--{BOUNDARY}\r\nContent-Range: bytes {start}-{end - 1}/{FILE_SIZE}"
+            "\r\n\r\n".encode() + CONTENT[start:end] + b"\r\n"
+            for start, end in ranges
+        )
+        return web.Response(
+            status=206,
+            body=body + f"--{BOUNDARY}--\r\n".encode(),
+            headers={"Content-Type": f"multipart/byteranges; boundary={BOUNDARY}"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/data.bin", handler)
+    runner = web.AppRunner(app)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{port}/data.bin"
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+class SparseReadBenchmarks:
+    """Concurrent small reads of one file, as made by several threads of a
+    program reading scattered records from a mounted file"""
+
+    params = (["per-read", "coalesced"], list(STRIDES))
+    param_names = ["mode", "pattern"]
+    timeout = 300
+
+    def setup(self, mode, pattern):
+        multirange_support.clear()
+        self.server = range_server()
+        url = self.server.__enter__()
+        self.fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+        self.fp = self.fs.open(
+            url,
+            size=FILE_SIZE,
+            coalesce_gap=DEFAULT_COALESCE_GAP if mode == "coalesced" else None,
+        )
+        self.offsets = [i * STRIDES[pattern] for i in range(READS)]
+        self.pool = ThreadPoolExecutor(max_workers=READS)
+        # Establish connections before timing:
+        self.fs.cat_file(url, start=0, end=1)
+
+    def time_sparse_reads(self, _mode, _pattern):
+        list(self.pool.map(lambda o: self.fp.pread(o, READ_SIZE), self.offsets))
+
+    def track_sparse_read_throughput(self, mode, pattern):
+        """Bytes per second read by `time_sparse_reads()`"""
+        loop = self.fs.loop
+        start = loop.time()
+        self.time_sparse_reads(mode, pattern)
+        return READS * READ_SIZE / (loop.time() - start)
+
+    track_sparse_read_throughput.unit = "bytes/s"
+
+    def teardown(self, _mode, _pattern):
+        self.pool.shutdown()
+        self.fp.close()
+        if self.fs._session is not None:
+            self.fs.close_session(self.fs.loop, self.fs._session)
+        self.server.__exit__(None, None, None)
@@ -0,0 +1,114 @@
+import asyncio
+from contextlib import ExitStack, contextmanager
+import re
+from threading import Thread
+
+from aiohttp import web
+
+from datalad_fuse.fsspec import get_client
+from datalad_fuse.httpfile import AnnexHTTPFileSystem
+from datalad_fuse.transport import HTTP2Session, PoolConfig, new_http2_client
+
+FILE_SIZE = 16 * 1024 * 1024
+READ_SIZE = 4096
+READS = 256
+#: Simulated latency of each request (as to a remote host), in seconds
+LATENCY = 0.05
+CONTENT = bytes(range(256)) * (FILE_SIZE // 256)
+
+
+@contextmanager
+def http1_server():
+    """Serve ``CONTENT`` at ``/data.bin`` over HTTP/1.1 with aiohttp"""
+
+    async def handler(request):
+        await asyncio.sleep(LATENCY)
+        m = re.fullmatch(r"bytes=(\d+)-(\d+)", request.headers.get("Range", ""))
+        if m is None:
+            return web.Response(body=CONTENT)
+        start, end = int(m[1]), int(m[2]) + 1
+        return web.Response(
+            status=206,
+            body=CONTENT[start:end],
+            headers={"Content-Range": f"bytes {start}-{end - 1}/{FILE_SIZE}"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/data.bin", handler)
+    runner = web.AppRunner(app)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{port}/data.bin"
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+@contextmanager
+def http2_server():
+    """Serve ``CONTENT`` at ``/data.bin`` over cleartext HTTP/2"""
+    from datalad_fuse.tests.h2server import h2_server
+
+    with h2_server() as server:
+        server.files["/data.bin"] = CONTENT
+        server.delays["/data.bin"] = LATENCY
+        yield f"{server.url}/data.bin"
+
+
+async def get_http2_client(**_kwargs):
+    return HTTP2Session(new_http2_client(PoolConfig(), http1=False))
+
+
+class SmallReadBenchmarks:
+    """Many concurrent small range reads from one host, as made by random
+    access to a mounted file"""
+
+    params = ["http/1.1", "http/2"]
+    param_names = ["protocol"]
+    timeout = 300
+
+    def setup(self, protocol):
+        self.stack = ExitStack()
+        if protocol == "http/2":
+            try:
+                self.url = self.stack.enter_context(http2_server())
+            except ImportError:
+                raise NotImplementedError("httpx[http2] is not installed")
+            self.fs = AnnexHTTPFileSystem(
+                get_client=get_http2_client, skip_instance_cache=True
+            )
+        else:
+            self.url = self.stack.enter_context(http1_server())
+            self.fs = AnnexHTTPFileSystem(
+                get_client=get_client, skip_instance_cache=True
+            )
+        step = FILE_SIZE // READS
+        self.starts = [i * step for i in range(READS)]
+        self.ends = [s + READ_SIZE for s in self.starts]
+        # Establish connections before timing:
+        self.fs.cat_file(self.url, start=0, end=1)
+
+    def time_small_reads(self, _protocol):
+        self.fs.cat_ranges([self.url] * READS, self.starts, self.ends, batch_size=READS)
+
+    def track_small_read_throughput(self, protocol):
+        """Bytes per second read by `time_small_reads()`"""
+        loop = self.fs.loop
+        start = loop.time()
+        self.time_small_reads(protocol)
+        return READS * READ_SIZE / (loop.time() - start)
+
+    track_small_read_throughput.unit = "bytes/s"
+
+    def teardown(self, _protocol):
+        if self.fs._session is not None:
+            self.fs.close_session(self.fs.loop, self.fs._session)
+        self.stack.close()
@@ -0,0 +1,144 @@
+import asyncio
+from contextlib import contextmanager
+import re
+from threading import Thread
+
+from aiohttp import web
+
+from datalad_fuse.fsspec import get_client
+from datalad_fuse.httpfile import AnnexHTTPFileSystem
+from datalad_fuse.readahead import DEFAULT_SEGMENT_SIZE
+
+FILE_SIZE = 64 * 1024 * 1024
+#: Size of the reads made by the kernel through a FUSE mount
+READ_SIZE = 128 * 1024
+#: Bandwidth (in bytes per second) of each response, as with a single stream
+#: from S3
+STREAM_RATE = 32 * 1024 * 1024
+CHUNK_SIZE = 256 * 1024
+#: Time (in seconds) to the first byte of each response in
+#: `StreamingReadBenchmarks`, as from a remote host
+LATENCY = 0.05
+CONTENT = bytes(range(256)) * (FILE_SIZE // 256)
+
+
+@contextmanager
+def throttled_server(latency=0.0):
+    """Serve ``CONTENT`` at ``/data.bin`` over HTTP/1.1 with aiohttp, sending
+    each response after ``latency`` seconds at no more than ``STREAM_RATE``"""
+
+    async def handler(request):
+        await asyncio.sleep(latency)
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", request.headers.get("Range", ""))
+        if m is None:
+            start, end = 0, FILE_SIZE
+        else:
+            start, end = int(m[1]), int(m[2]) + 1 if m[2] else FILE_SIZE
+        response = web.StreamResponse(
+            status=206 if m else 200,
+            headers={
+                "Content-Length": str(end - start),
+                "Content-Range": f"bytes {start}-{end - 1}/{FILE_SIZE}",
+            },
+        )
+        await response.prepare(request)
+        for pos in range(start, end, CHUNK_SIZE):
+            chunk = CONTENT[pos : min(pos + CHUNK_SIZE, end)]
+            await asyncio.sleep(len(chunk) / STREAM_RATE)
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/data.bin", handler)
+    runner = web.AppRunner(app)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{port}/data.bin"
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+
+class SequentialReadBenchmarks:
+    """A sequential scan of a large file (e.g., ``cp`` from a mount), read
+    in the kernel's read size through the block cache alone or with
+    segments fetched ahead concurrently"""
+
+    params = [0, 2, 4, 8]
+    param_names = ["segments"]
+    timeout = 300
+
+    def setup(self, _segments):
+        self.server = throttled_server()
+        self.url = self.server.__enter__()
+        self.fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+        # Establish a connection before timing:
+        self.fs.cat_file(self.url, start=0, end=1)
+
+    def time_scan(self, segments):
+        with self.fs.open(
+            self.url,
+            size=FILE_SIZE,
+            block_size=DEFAULT_SEGMENT_SIZE,
+            readahead_segments=segments,
+        ) as fp:
+            while fp.read(READ_SIZE):
+                pass
+
+    def track_scan_throughput(self, segments):
+        """Bytes per second read by `time_scan()`"""
+        loop = self.fs.loop
+        start = loop.time()
+        self.time_scan(segments)
+        return FILE_SIZE / (loop.time() - start)
+
+    track_scan_throughput.unit = "bytes/s"
+
+    def teardown(self, _segments):
+        if self.fs._session is not None:
+            self.fs.close_session(self.fs.loop, self.fs._session)
+        self.server.__exit__(None, None, None)
+
+
+class StreamingReadBenchmarks:
+    """A sequential scan of a large file from a remote host, read through
+    the block cache (a request per block) or from a single streaming GET"""
+
+    params = ["blocks", "stream"]
+    param_names = ["mode"]
+    timeout = 300
+
+    def setup(self, _mode):
+        self.server = throttled_server(latency=LATENCY)
+        self.url = self.server.__enter__()
+        self.fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+        # Establish a connection before timing:
+        self.fs.cat_file(self.url, start=0, end=1)
+
+    def time_scan(self, mode):
+        with self.fs.open(self.url, size=FILE_SIZE, stream=mode == "stream") as fp:
+            while fp.read(READ_SIZE):
+                pass
+
+    def track_scan_throughput(self, mode):
+        """Bytes per second read by `time_scan()`"""
+        loop = self.fs.loop
+        start = loop.time()
+        self.time_scan(mode)
+        return FILE_SIZE / (loop.time() - start)
+
+    track_scan_throughput.unit = "bytes/s"
+
+    def teardown(self, _mode):
+        if self.fs._session is not None:
+            self.fs.close_session(self.fs.loop, self.fs._session)
+        self.server.__exit__(None, None, None)
@@ -37,6 +37,18 @@ command_suite = (
             "fusefs",
         ),
         ("datalad_fuse.fsspec_head", "FsspecHead", "fsspec-head", "fsspec_head"),
+        (
+            "datalad_fuse.fsspec_explain",
+            "FsspecExplain",
+            "fsspec-explain",
+            "fsspec_explain",
+        ),
+        (
+            "datalad_fuse.fsspec_profile",
+            "FsspecProfile",
+            "fsspec-profile",
+            "fsspec_profile",
+        ),
         (
             "datalad_fuse.fsspec_cache_clear",
             "FsspecCacheClear",
@@ -96,6 +108,13 @@ class FuseFS(Interface):
             default="none",
             doc="Whether to cache fsspec'ed files on disk on not at all",
         ),
+        "offline": Parameter(
+            args=("--offline",),
+            action="store_true",
+            doc="""Only serve content that is available locally or completely
+            in the on-disk cache; opening anything else fails immediately
+            instead of accessing the network""",
+        ),
         # TODO: (might better become config vars?)
         # --cache=persist
         # --recursive=follow,get - encountering submodule might install it first
@@ -112,6 +131,7 @@ class FuseFS(Interface):
         mode_transparent: bool = False,
         allow_other: bool = False,
         caching: str | None = None,
+        offline: bool = False,
     ) -> Iterator[Dict[str, Any]]:
         from fuse import FUSE
 
@@ -133,6 +153,7 @@ class FuseFS(Interface):
                 ds.path,
                 mode_transparent=mode_transparent,
                 caching=caching == "ondisk",
+                offline=offline,
             ),
             mount_path,
             foreground=foreground,
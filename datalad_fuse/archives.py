@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import io
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import struct
+import tarfile
+from threading import Lock
+from typing import IO, Any, Callable, NamedTuple, Optional
+from urllib.parse import parse_qs, unquote
+import zipfile
+
+lgr = logging.getLogger("datalad.fuse.archives")
+
+#: Size of the fixed part of a zip local file header
+ZIP_LOCAL_HEADER_SIZE = 30
+
+
+class ArchiveMember(NamedTuple):
+    #: Annex key of the archive
+    archive_key: str
+    #: Path of the member within the archive
+    path: str
+    size: Optional[int] = None
+
+
+def is_archive_url(s: str) -> bool:
+    return s.startswith("dl+archive:")
+
+
+def parse_archive_url(url: str) -> ArchiveMember:
+    """Parse a ``dl+archive:<key>#path=<path>[&size=<size>]`` URL as
+    registered by the datalad-archives special remote"""
+    if not is_archive_url(url):
+        raise ValueError(f"Not a dl+archive URL: {url!r}")
+    key, _, fragment = url[len("dl+archive:") :].partition("#")
+    params = parse_qs(fragment)
+    try:
+        path = params["path"][0]
+    except KeyError:
+        # Older URLs have the bare member path as the fragment
+        path = unquote(fragment)
+    if not key or not path:
+        raise ValueError(f"Invalid dl+archive URL: {url!r}")
+    size: Optional[int]
+    try:
+        size = int(params["size"][0])
+    except (KeyError, ValueError):
+        size = None
+    return ArchiveMember(key, path.lstrip("/"), size)
+
+
+class MemberFile(io.RawIOBase):
+    """Read-only file object for a member of an archive.
+
+    Reads are served from ``fileobj`` -- either the archive file itself,
+    with the member stored uncompressed at ``offset``, in which case only
+    the requested byte ranges are read, or a stream that decompresses the
+    member.  Closing the member file closes the archive file as well.
+    """
+
+    def __init__(
+        self,
+        fileobj: IO[bytes],
+        size: int,
+        name: str,
+        offset: Optional[int] = None,
+        archive: Optional[IO[bytes]] = None,
+    ) -> None:
+        super().__init__()
+        self._fileobj = fileobj
+        self._offset = offset
+        self._archive = archive
+        self.size = size
+        self.name = name
+        self.pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self.pos + offset
+        elif whence == os.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence!r}")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self.pos = pos
+        return pos
+
+    def readinto(self, b: Any) -> int:
+        n = max(0, min(len(b), self.size - self.pos))
+        if n == 0:
+            return 0
+        if self._offset is not None:
+            self._fileobj.seek(self._offset + self.pos)
+        else:
+            self._fileobj.seek(self.pos)
+        data = self._fileobj.read(n)
+        b[: len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+    def info(self) -> dict[str, Any]:
+        return {"name": self.name, "size": self.size, "type": "file"}
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                self._fileobj.close()
+                if self._archive is not None:
+                    self._archive.close()
+            finally:
+                super().close()
+
+
+class ArchiveIndex:
+    """Persistent index of where the uncompressed members of archives start.
+
+    Archives are identified by their annex keys, so entries never go stale.
+    The index is stored in an SQLite database; if it cannot be created
+    (e.g., read-only dataset), an in-memory database is used instead.
+    """
+
+    def __init__(self, path: str | Path | None) -> None:
+        self.path = Path(path) if path is not None else None
+        self._lock = Lock()
+        self._db = self._connect()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS archives ("
+                " archive TEXT PRIMARY KEY,"
+                " format TEXT NOT NULL"
+                ")"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS members ("
+                " archive TEXT NOT NULL,"
+                " path TEXT NOT NULL,"
+                " offset INTEGER NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " PRIMARY KEY (archive, path)"
+                ")"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.path is not None:
+            try:
+                os.makedirs(self.path.parent, exist_ok=True)
+                return sqlite3.connect(
+                    str(self.path), timeout=10, check_same_thread=False
+                )
+            except (OSError, sqlite3.Error) as e:
+                lgr.warning(
+                    "Could not open archive index at %s: %s; using in-memory index",
+                    self.path,
+                    e,
+                )
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def get_format(self, archive: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT format FROM archives WHERE archive = ?", (archive,)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def get_member(self, archive: str, path: str) -> Optional[tuple[int, int]]:
+        """Return the offset & size of uncompressed member ``path`` of
+        ``archive``"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT offset, size FROM members WHERE archive = ? AND path = ?",
+                (archive, path),
+            ).fetchone()
+        return (row[0], row[1]) if row is not None else None
+
+    def store(
+        self, archive: str, fmt: str, members: list[tuple[str, int, int]]
+    ) -> None:
+        """Record the format of ``archive`` and its uncompressed members as
+        ``(path, offset, size)`` triples"""
+        lgr.debug("Indexing %d members of %s archive %s", len(members), fmt, archive)
+        try:
+            with self._lock, self._db:
+                self._db.execute("DELETE FROM members WHERE archive = ?", (archive,))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO members (archive, path, offset, size)"
+                    " VALUES (?, ?, ?, ?)",
+                    [(archive, p, off, size) for p, off, size in members],
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO archives (archive, format) VALUES (?, ?)",
+                    (archive, fmt),
+                )
+        except sqlite3.Error as e:
+            lgr.debug("Failed to index archive %s: %s", archive, e)
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM archives")
+            self._db.execute("DELETE FROM members")
+
+
+def detect_format(f: IO[bytes]) -> str:
+    """Return ``"zip"``, ``"tar"`` (uncompressed), or ``"compressed"`` (any
+    other archive that `tarfile` may be able to stream)"""
+    f.seek(0)
+    magic = f.read(4)
+    if magic.startswith(b"PK"):
+        return "zip"
+    f.seek(257)
+    if f.read(5) == b"ustar":
+        return "tar"
+    return "compressed"
+
+
+def index_zip(f: IO[bytes]) -> tuple[zipfile.ZipFile, list[tuple[str, int, int]]]:
+    """Read the central directory of a zip file (which `zipfile` locates by
+    reading the end of the file) and return the `~zipfile.ZipFile` along
+    with the offsets of its stored (uncompressed, unencrypted) members"""
+    zf = zipfile.ZipFile(f)
+    members = []
+    for info in zf.infolist():
+        if (
+            info.is_dir()
+            or info.compress_type != zipfile.ZIP_STORED
+            or info.flag_bits & 0x1
+        ):
+            continue
+        f.seek(info.header_offset)
+        header = f.read(ZIP_LOCAL_HEADER_SIZE)
+        name_len, extra_len = struct.unpack("<2H", header[26:30])
+        offset = info.header_offset + ZIP_LOCAL_HEADER_SIZE + name_len + extra_len
+        members.append((info.filename, offset, info.file_size))
+    return (zf, members)
+
+
+def index_tar(f: IO[bytes]) -> list[tuple[str, int, int]]:
+    """Read the member headers of an uncompressed tar file, skipping over
+    member data, and return the offsets of its regular files"""
+    f.seek(0)
+    with tarfile.open(fileobj=f, mode="r:") as tf:
+        return [(ti.name, ti.offset_data, ti.size) for ti in tf if ti.isreg()]
+
+
+def open_member(
+    f: IO[bytes],
+    member: ArchiveMember,
+    index: ArchiveIndex,
+    name: str,
+    download: Optional[Callable[[IO[bytes]], IO[bytes]]] = None,
+) -> MemberFile:
+    """Open ``member`` of the archive opened as ``f``.
+
+    Uncompressed members of zip and uncompressed tar files are read directly
+    from their byte ranges in the archive, looked up in ``index`` or --
+    on first access to the archive -- by indexing it.  Compressed members
+    (and members of compressed tarballs) are decompressed as a stream.
+
+    A compressed tarball can only be decompressed from its start, for
+    finding the member as well as for every backward seek, so it is read
+    from the copy returned by ``download(f)`` (if given) instead, which
+    should be local.
+
+    Raises `FileNotFoundError` if the archive has no such member.
+    """
+    fmt = index.get_format(member.archive_key)
+    if fmt is not None and fmt != "compressed":
+        if (loc := index.get_member(member.archive_key, member.path)) is not None:
+            offset, size = loc
+            return MemberFile(f, size, name, offset=offset)
+    zf: Optional[zipfile.ZipFile] = None
+    if fmt is None:
+        fmt = detect_format(f)
+        if fmt == "zip":
+            zf, members = index_zip(f)
+        elif fmt == "tar":
+            members = index_tar(f)
+        else:
+            members = []
+        index.store(member.archive_key, fmt, members)
+        for path, offset, size in members:
+            if path == member.path:
+                return MemberFile(f, size, name, offset=offset)
+    if fmt == "zip":
+        if zf is None:
+            zf = zipfile.ZipFile(f)
+        try:
+            info = zf.getinfo(member.path)
+        except KeyError:
+            raise FileNotFoundError(f"{member.path} not found in {member.archive_key}")
+        lgr.debug("%s is compressed; decompressing as a stream", member.path)
+        return MemberFile(zf.open(info), info.file_size, name, archive=f)
+    elif fmt == "compressed":
+        lgr.debug(
+            "%s is a compressed archive; decompressing as a stream",
+            member.archive_key,
+        )
+        if download is not None:
+            local = download(f)
+            if local is not f:
+                f.close()
+                f = local
+        f.seek(0)
+        tf = tarfile.open(fileobj=f, mode="r:*")
+        try:
+            ti = tf.getmember(member.path)
+        except KeyError:
+            raise FileNotFoundError(f"{member.path} not found in {member.archive_key}")
+        stream = tf.extractfile(ti)
+        if stream is None:
+            raise FileNotFoundError(f"{member.path} is not a regular file")
+        return MemberFile(stream, ti.size, name, archive=f)
+    raise FileNotFoundError(f"{member.path} not found in {member.archive_key}")
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+import io
+import logging
+import os
+from threading import Lock
+from typing import IO, Any, NamedTuple, Optional
+
+from .utils import AnnexKey
+
+lgr = logging.getLogger("datalad.fuse.chunks")
+
+#: Default number of chunks that are fetched concurrently
+DEFAULT_CHUNK_WORKERS = 4
+
+#: Default number of chunks of a file that are kept open at a time
+DEFAULT_OPEN_CHUNKS = 8
+
+
+class ChunkLayout(NamedTuple):
+    chunk_size: int
+    chunk_count: int
+
+
+def parse_chunk_log(text: str) -> dict[str, list[ChunkLayout]]:
+    """Parse a git-annex chunk log (``<key>.log.cnk`` on the git-annex
+    branch) into a `dict` mapping remote UUIDs to the chunk layouts in which
+    they currently store the key, most recently recorded first"""
+    latest: dict[tuple[str, int], tuple[float, int]] = {}
+    for line in text.splitlines():
+        try:
+            ts, remote, count = line.split()
+            uuid, _, chunk_size = remote.rpartition(":")
+            timestamp = float(ts.rstrip("s"))
+            entry = (uuid, int(chunk_size))
+            n = int(count)
+        except ValueError:
+            continue
+        if entry not in latest or latest[entry][0] <= timestamp:
+            latest[entry] = (timestamp, n)
+    layouts: dict[str, list[tuple[float, ChunkLayout]]] = {}
+    for (uuid, size), (timestamp, n) in latest.items():
+        # A count of zero records that the chunks were removed
+        if n > 0:
+            layouts.setdefault(uuid, []).append((timestamp, ChunkLayout(size, n)))
+    return {
+        uuid: [lay for _, lay in sorted(lays, key=lambda p: p[0], reverse=True)]
+        for uuid, lays in layouts.items()
+    }
+
+
+def chunk_key(key: AnnexKey, chunk_size: int, number: int) -> AnnexKey:
+    """Return the key of the ``number``-th (1-based) chunk of ``key``"""
+    return replace(key, chunk_size=chunk_size, chunk_number=number)
+
+
+class ChunkedFile(io.RawIOBase):
+    """Read-only file object for content stored in chunks on a remote.
+
+    Read offsets are mapped to chunks, each of which is opened on first use
+    with ``open_chunk(number)`` (1-based) and kept open for reuse, so each
+    chunk is cached on its own by the underlying file system; only the
+    ``max_open`` most recently used chunks are kept open.  A read that spans
+    several chunks fetches their parts concurrently, and opening a chunk for
+    a read starts fetching the beginning of the next one in the background.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        chunk_size: int,
+        open_chunk: Callable[[int], IO[bytes]],
+        name: str,
+        max_workers: int = DEFAULT_CHUNK_WORKERS,
+        max_open: int = DEFAULT_OPEN_CHUNKS,
+    ) -> None:
+        super().__init__()
+        self.size = size
+        self.chunk_size = chunk_size
+        self.name = name
+        self.max_open = max_open
+        self.pos = 0
+        self._open_chunk = open_chunk
+        #: Open chunks, least recently used first
+        self._chunks: OrderedDict[int, Future[IO[bytes]]] = OrderedDict()
+        self._chunk_locks: dict[int, Lock] = {}
+        self._lock = Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="datalad-fuse-chunk"
+        )
+
+    @property
+    def chunk_count(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            pos = offset
+        elif whence == os.SEEK_CUR:
+            pos = self.pos + offset
+        elif whence == os.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence!r}")
+        if pos < 0:
+            raise ValueError("Negative seek position")
+        self.pos = pos
+        return pos
+
+    def _get_chunk(self, number: int, prefetch: bool = True) -> tuple[IO[bytes], Lock]:
+        with self._lock:
+            try:
+                fut = self._chunks[number]
+            except KeyError:
+                fut = self._chunks[number] = Future()
+                lock = self._chunk_locks[number] = Lock()
+                opener = True
+            else:
+                self._chunks.move_to_end(number)
+                lock = self._chunk_locks[number]
+                opener = False
+        if opener:
+            lgr.debug("%s: opening chunk %d", self.name, number)
+            try:
+                fut.set_result(self._open_chunk(number))
+            except BaseException as e:
+                with self._lock:
+                    del self._chunks[number]
+                    del self._chunk_locks[number]
+                fut.set_exception(e)
+                raise
+            self._evict(number)
+            if prefetch and number < self.chunk_count:
+                self._pool.submit(self._prefetch, number + 1)
+        return (fut.result(), lock)
+
+    def _evict(self, keep: int) -> None:
+        """Close the least recently used chunks (other than ``keep`` and those
+        still being opened) beyond ``max_open``"""
+        evicted = []
+        with self._lock:
+            excess = len(self._chunks) - self.max_open
+            for number, fut in list(self._chunks.items()):
+                if excess <= 0:
+                    break
+                if number != keep and fut.done():
+                    del self._chunks[number]
+                    evicted.append((number, fut, self._chunk_locks.pop(number)))
+                    excess -= 1
+        for number, fut, lock in evicted:
+            lgr.debug("%s: closing chunk %d", self.name, number)
+            with lock:
+                fut.result().close()
+
+    def _prefetch(self, number: int) -> None:
+        try:
+            self._read_chunk(number, 0, 1, prefetch=False)
+        except Exception as e:
+            lgr.debug("%s: prefetching chunk %d failed: %s", self.name, number, e)
+
+    def _read_chunk(
+        self, number: int, offset: int, length: int, prefetch: bool = True
+    ) -> bytes:
+        while True:
+            f, lock = self._get_chunk(number, prefetch)
+            with lock:
+                if f.closed:
+                    # Evicted after it was looked up; open it again
+                    continue
+                f.seek(offset)
+                data = f.read(length)
+            break
+        if len(data) != length:
+            raise OSError(
+                f"{self.name}: chunk {number} is shorter than expected"
+                f" ({offset + len(data)} < {offset + length} bytes)"
+            )
+        return data
+
+    def readinto(self, b: Any) -> int:
+        n = max(0, min(len(b), self.size - self.pos))
+        if n == 0:
+            return 0
+        segments = []
+        pos = self.pos
+        end = pos + n
+        while pos < end:
+            number, offset = divmod(pos, self.chunk_size)
+            length = min(self.chunk_size - offset, end - pos)
+            segments.append((number + 1, offset, length))
+            pos += length
+        if len(segments) == 1:
+            parts = [self._read_chunk(*segments[0])]
+        else:
+            parts = list(self._pool.map(lambda s: self._read_chunk(*s), segments))
+        data = b"".join(parts)
+        b[:n] = data
+        self.pos += n
+        return n
+
+    def info(self) -> dict[str, Any]:
+        return {"name": self.name, "size": self.size, "type": "file"}
+
+    def close(self) -> None:
+        if not self.closed:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            with self._lock:
+                futs = list(self._chunks.values())
+                self._chunks.clear()
+            for fut in futs:
+                if fut.done() and fut.exception() is None:
+                    fut.result().close()
+            super().close()
+
+
+def open_chunked(
+    key: AnnexKey,
+    layout: ChunkLayout,
+    open_chunk: Callable[[AnnexKey], Optional[IO[bytes]]],
+    name: str,
+    max_workers: int = DEFAULT_CHUNK_WORKERS,
+) -> Optional[ChunkedFile]:
+    """Return a `ChunkedFile` for ``key`` stored in chunks per ``layout``,
+    fetching each chunk key with ``open_chunk``, or `None` if the layout
+    does not fit the key's size or its first chunk cannot be opened"""
+    if key.size is None:
+        lgr.debug("%s: cannot read chunks of key without size", name)
+        return None
+    if layout.chunk_count != max(1, -(-key.size // layout.chunk_size)):
+        lgr.debug(
+            "%s: %d chunks of %d bytes do not match size %d",
+            name,
+            layout.chunk_count,
+            layout.chunk_size,
+            key.size,
+        )
+        return None
+
+    def opener(number: int) -> IO[bytes]:
+        ck = chunk_key(key, layout.chunk_size, number)
+        f = open_chunk(ck)
+        if f is None:
+            raise FileNotFoundError(f"{name}: chunk {ck} is not available")
+        return f
+
+    cf = ChunkedFile(key.size, layout.chunk_size, opener, name, max_workers)
+    try:
+        cf._get_chunk(1)
+    except OSError as e:
+        lgr.debug("%s: %s", name, e)
+        cf.close()
+        return None
+    return cf
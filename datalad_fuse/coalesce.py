@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass
+import logging
+import re
+from threading import Lock
+from typing import Optional
+
+from fsspec.asyn import sync
+
+lgr = logging.getLogger("datalad.fuse.coalesce")
+
+#: Default largest gap (in bytes) between two pending reads of a file for
+#: which they are fetched with a single range request.  Downloading this much
+#: unneeded data takes less time than another round trip on most links.
+DEFAULT_COALESCE_GAP = 64 * 1024
+
+#: Number of seconds for which a read waits for concurrent reads of the same
+#: file to be fetched together with
+COALESCE_WINDOW = 0.002
+
+#: Maximum number of ranges in one multi-range request, keeping the ``Range``
+#: header well below common server limits on header size
+MAX_RANGES_PER_REQUEST = 32
+
+Ranges = Sequence[tuple[int, int]]
+
+
+class MultipartError(ValueError):
+    """Raised when a ``multipart/byteranges`` response cannot be parsed or
+    lacks a requested range"""
+
+
+@dataclass
+class RangeGroup:
+    """A run of requested ranges fetched with a single range"""
+
+    start: int
+    end: int
+    #: Indices of the requested ranges in the group
+    members: list[int]
+
+
+def merge_ranges(ranges: Ranges, max_gap: int) -> list[RangeGroup]:
+    """Group the ranges ``(start, end)`` (with ``end`` exclusive), in order of
+    offset, so that ranges less than ``max_gap`` bytes apart are in the same
+    group"""
+    groups: list[RangeGroup] = []
+    for i in sorted(range(len(ranges)), key=lambda j: ranges[j]):
+        start, end = ranges[i]
+        if groups and start - groups[-1].end <= max_gap:
+            groups[-1].end = max(groups[-1].end, end)
+            groups[-1].members.append(i)
+        else:
+            groups.append(RangeGroup(start, end, [i]))
+    return groups
+
+
+def split_groups(
+    ranges: Ranges, groups: Sequence[RangeGroup], datas: Sequence[bytes]
+) -> list[bytes]:
+    """Cut the data fetched for each group into the data for its member
+    ranges, in the order of ``ranges``"""
+    out = [b""] * len(ranges)
+    for g, data in zip(groups, datas):
+        for i in g.members:
+            start, end = ranges[i]
+            out[i] = data[start - g.start : end - g.start]
+    return out
+
+
+def multirange_header(groups: Sequence[RangeGroup]) -> str:
+    return "bytes=" + ",".join(f"{g.start}-{g.end - 1}" for g in groups)
+
+
+def get_boundary(content_type: str) -> Optional[str]:
+    """Return the boundary of a ``multipart/byteranges`` content type, or
+    `None` if the content type is something else"""
+    mtype, _, params = content_type.partition(";")
+    if mtype.strip().lower() != "multipart/byteranges":
+        return None
+    m = re.search(r'boundary="?([^";]+)"?', params, flags=re.I)
+    return m[1].strip() if m else None
+
+
+def parse_byteranges(body: bytes, boundary: str) -> dict[int, bytes]:
+    """Parse the body of a ``multipart/byteranges`` response into a `dict`
+    mapping the offset of each part to its data"""
+    delimiter = b"--" + boundary.encode("latin-1")
+    parts: dict[int, bytes] = {}
+    pos = body.find(delimiter)
+    while pos != -1:
+        pos += len(delimiter)
+        if body.startswith(b"--", pos):
+            # Closing delimiter
+            break
+        header_end = body.find(b"\r\n\r\n", pos)
+        if header_end == -1:
+            raise MultipartError("Truncated part headers")
+        headers = body[pos:header_end].decode("latin-1")
+        m = re.search(
+            r"^content-range:\s*bytes\s+(\d+)-(\d+)/", headers, flags=re.I | re.M
+        )
+        if m is None:
+            raise MultipartError("Part without Content-Range")
+        start, last = int(m[1]), int(m[2])
+        data_start = header_end + 4
+        data = body[data_start : data_start + last - start + 1]
+        if len(data) != last - start + 1:
+            raise MultipartError(f"Truncated part for bytes {start}-{last}")
+        parts[start] = data
+        pos = body.find(delimiter, data_start + len(data))
+    return parts
+
+
+def extract_range(parts: dict[int, bytes], start: int, end: int) -> bytes:
+    """Return bytes ``start`` through ``end - 1`` from the parts of a
+    multipart response, which a server may have merged or reordered"""
+    for offset, data in parts.items():
+        if offset <= start and offset + len(data) >= end:
+            return data[start - offset : end - offset]
+    raise MultipartError(f"Response lacks bytes {start}-{end - 1}")
+
+
+class MultirangeSupport:
+    """Process-wide record of which hosts answer requests for several ranges
+    with a ``multipart/byteranges`` response.  Hosts not yet asked are
+    unknown (`None`)."""
+
+    def __init__(self) -> None:
+        self._hosts: dict[str, bool] = {}
+        self._lock = Lock()
+
+    def get(self, host: str) -> Optional[bool]:
+        with self._lock:
+            return self._hosts.get(host)
+
+    def set(self, host: str, supported: bool) -> None:
+        with self._lock:
+            if self._hosts.get(host) != supported:
+                lgr.debug(
+                    "%s: multi-range requests %ssupported",
+                    host,
+                    "" if supported else "not ",
+                )
+            self._hosts[host] = supported
+
+    def clear(self) -> None:
+        with self._lock:
+            self._hosts.clear()
+
+
+class RangeCoalescer:
+    """Batches reads of one file that are pending at the same time.
+
+    A read waits ``window`` seconds for others to arrive, after which all
+    pending reads are passed to ``fetch_ranges()`` at once, which can then
+    fetch them with fewer requests than one per read.  ``read()`` may be
+    called from any number of threads other than the one running ``loop``.
+    """
+
+    def __init__(
+        self,
+        fetch_ranges: Callable[[list[tuple[int, int]]], Awaitable[list[bytes]]],
+        loop: asyncio.AbstractEventLoop,
+        window: float = COALESCE_WINDOW,
+    ) -> None:
+        self.fetch_ranges = fetch_ranges
+        self.loop = loop
+        self.window = window
+        # Only accessed from within the loop:
+        self._pending: list[tuple[int, int, asyncio.Future[bytes]]] = []
+        self._flush_scheduled = False
+        self._batches: set[asyncio.Future[None]] = set()
+
+    def read(self, start: int, end: int) -> bytes:
+        """Read bytes ``start`` through ``end - 1``"""
+        data: bytes = sync(self.loop, self.async_read, start, end)
+        return data
+
+    async def async_read(self, start: int, end: int) -> bytes:
+        fut: asyncio.Future[bytes] = self.loop.create_future()
+        self._pending.append((start, end, fut))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        batch = [(s, e, fut) for s, e, fut in self._pending if not fut.done()]
+        self._pending = []
+        if batch:
+            task = asyncio.ensure_future(self._fetch_batch(batch))
+            # Keep a reference so that the task is not garbage-collected
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _fetch_batch(
+        self, batch: list[tuple[int, int, asyncio.Future[bytes]]]
+    ) -> None:
+        if len(batch) > 1:
+            lgr.debug("Fetching %d pending reads together", len(batch))
+        try:
+            datas = await self.fetch_ranges([(s, e) for s, e, _ in batch])
+        except Exception as e:
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for (_, _, fut), data in zip(batch, datas):
+                if not fut.done():
+                    fut.set_result(data)
+        finally:
+            # If the batch itself was cancelled, so are its reads
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.cancel()
+
+
+multirange_support = MultirangeSupport()
@@ -1,47 +1,109 @@
 from __future__ import annotations
 
-from collections.abc import Iterator
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
 from enum import Enum
+from errno import ENOENT
+from functools import partial
+import io
 import json
 import logging
 import os
 import os.path
 from pathlib import Path
+import re
 import subprocess
+import tarfile
+from threading import Lock, RLock
+import time
 from types import SimpleNamespace, TracebackType
 from typing import IO, Any, Optional, Tuple, cast
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 import urllib.request
+import zipfile
 
 import aiohttp
-from aiohttp_retry import ListRetry, RetryClient
-import boto3
-from botocore import UNSIGNED
-from botocore.config import Config as BotocoreConfig
 from datalad.distribution.dataset import Dataset
 from datalad.support.annexrepo import AnnexRepo
 from datalad.utils import get_dataset_root
+from fsspec.caching import MMapCache
 from fsspec.exceptions import BlocksizeMismatchError
 from fsspec.implementations.cached import CachingFileSystem
-from fsspec.implementations.http import HTTPFileSystem
 import methodtools
+import yarl
 
+from .archives import ArchiveIndex, is_archive_url, open_member, parse_archive_url
+from .chunks import DEFAULT_CHUNK_WORKERS, ChunkLayout, open_chunked, parse_chunk_log
+from .coalesce import DEFAULT_COALESCE_GAP
 from .consts import CACHE_SIZE
+from .health import host_health, host_of
+from .httpfile import (
+    DEFAULT_HEDGE_PERCENTILE,
+    AnnexHTTPFile,
+    AnnexHTTPFileSystem,
+    OfflineError,
+    offline_stats,
+    presigned_expiry,
+)
+from .limits import host_limiter
+from .probe import DEFAULT_STAGGER, probe_first
+from .profile import (
+    DEFAULT_PROFILE_TTL,
+    HostProfile,
+    Measurement,
+    RemoteProfile,
+    measure_url,
+    summarize,
+)
+from .readahead import DEFAULT_READAHEAD_SEGMENTS, DEFAULT_SEGMENT_SIZE
+from .retry import retry_budget, retry_policy
+from .s3 import S3Resolver, is_s3_url
+from .s3index import DEFAULT_INDEX_TTL, DEFAULT_NEGATIVE_INDEX_TTL, S3VersionIndex
+from .spool import DEFAULT_SPOOL_SIZE, Spooler
+from .trace import trace_request, traced
+from .transport import HTTP2Session, RetrySession, connection_pool
+from .urlcache import DEFAULT_NEGATIVE_TTL, DEFAULT_TTL, URLCache
 from .utils import AnnexKey, is_annex_dir_or_key
 
 lgr = logging.getLogger("datalad.fuse.fsspec")
 
 FileState = Enum("FileState", "NOT_ANNEXED NO_CONTENT HAS_CONTENT")
 
+#: git-annex's default cost for remotes on the local filesystem
+DEFAULT_LOCAL_COST = 100.0
+
+#: Default number of threads resolving URLs ahead of opens
+DEFAULT_RESOLVE_WORKERS = 4
+
+#: Maximum number of ahead-of-open URL resolutions that may be pending at once
+RESOLVE_AHEAD_LIMIT = 32
+
+#: Minimum number of seconds between two ahead-of-open URL resolutions for
+#: the same path
+RESOLVE_AHEAD_INTERVAL = 10.0
+
 
 class DatasetAdapter:
     def __init__(
-        self, path: str | Path, caching: bool, mode_transparent: bool = False
+        self,
+        path: str | Path,
+        caching: bool,
+        mode_transparent: bool = False,
+        offline: bool = False,
+        configure_client: bool = True,
     ) -> None:
         self.path = Path(path)
         self.mode_transparent = mode_transparent
         ds = Dataset(path)
+        if configure_client:
+            # The HTTP client's state is shared by all datasets, so its
+            # options apply to the whole process
+            apply_client_config(ds.config)
+        # In offline mode, only local content and content in the on-disk cache
+        # is served, and no network requests are made
+        self.offline = offline or ds.config.getbool("datalad.fusefs", "offline", False)
         self.annex: Optional[AnnexRepo]
         if isinstance(ds.repo, AnnexRepo):
             self.annex = ds.repo
@@ -51,7 +113,10 @@ class DatasetAdapter:
             ds.repo.get_commit_date(), tz=timezone.utc
         )
         self.caching = caching
-        fs = HTTPFileSystem(get_client=get_client)
+        # fsspec caches file system instances by their arguments, so this is
+        # the same instance -- with the same client session -- for all
+        # datasets; in any case, sessions share one connection pool
+        fs = self._httpfs = AnnexHTTPFileSystem(get_client=get_client)
         if self.caching:
             self.fs = CachingFileSystem(
                 fs=fs,
@@ -65,10 +130,107 @@ class DatasetAdapter:
             )
         else:
             self.fs = fs
+        # Complete copies of files from servers without range support
+        spool_size = int(ds.config.get("datalad.fusefs.spool-size", DEFAULT_SPOOL_SIZE))
+        self.spooler = Spooler(
+            os.path.join(path, ".git", "datalad", "cache", "fuse", "spool"),
+            max_size=spool_size or None,
+        )
+        self.url_cache = URLCache(
+            os.path.join(path, ".git", "datalad", "cache", "fuse", "urls.sqlite"),
+            ttl=float(ds.config.get("datalad.fusefs.url-cache-ttl", DEFAULT_TTL)),
+            negative_ttl=float(
+                ds.config.get(
+                    "datalad.fusefs.url-cache-negative-ttl", DEFAULT_NEGATIVE_TTL
+                )
+            ),
+        )
+        # remote base URL -> object-path layout known to be served by it
+        self._layouts: dict[str, Optional[str]] = {}
+        self.probe_stagger = float(
+            ds.config.get("datalad.fusefs.probe-stagger", DEFAULT_STAGGER)
+        )
+        self.hedge = ds.config.getbool("datalad.fusefs", "hedge", False)
+        self.hedge_percentile = float(
+            ds.config.get("datalad.fusefs.hedge-percentile", DEFAULT_HEDGE_PERCENTILE)
+        )
+        # Reads through the on-disk cache are not coalesced, as coalesced
+        # reads bypass it
+        self.coalesce = not caching and ds.config.getbool(
+            "datalad.fusefs", "coalesce", True
+        )
+        self.coalesce_gap = int(
+            ds.config.get("datalad.fusefs.coalesce-gap", DEFAULT_COALESCE_GAP)
+        )
+        # Likewise for segments fetched ahead of sequential reads
+        self.readahead_segments = (
+            0
+            if caching
+            else int(
+                ds.config.get(
+                    "datalad.fusefs.readahead-segments", DEFAULT_READAHEAD_SEGMENTS
+                )
+            )
+        )
+        self.segment_size = int(
+            ds.config.get("datalad.fusefs.readahead-segment-size", DEFAULT_SEGMENT_SIZE)
+        )
+        self.stream = not caching and ds.config.getbool(
+            "datalad.fusefs", "stream", False
+        )
+        self.s3 = S3Resolver(
+            endpoint_url=ds.config.get("datalad.fusefs.s3-endpoint"),
+            region=ds.config.get("datalad.fusefs.s3-region"),
+            anonymous=ds.config.getbool("datalad.fusefs", "s3-anonymous", True),
+        )
+        self.s3_index = S3VersionIndex(
+            os.path.join(path, ".git", "datalad", "cache", "fuse", "s3versions.sqlite"),
+            ttl=float(ds.config.get("datalad.fusefs.s3-index-ttl", DEFAULT_INDEX_TTL)),
+            negative_ttl=float(
+                ds.config.get(
+                    "datalad.fusefs.s3-index-negative-ttl", DEFAULT_NEGATIVE_INDEX_TTL
+                )
+            ),
+        )
+        self.s3_index_scope = ds.config.get("datalad.fusefs.s3-index-scope", "prefix")
+        self.archive_index = ArchiveIndex(
+            os.path.join(path, ".git", "datalad", "cache", "fuse", "archives.sqlite")
+        )
+        self.chunk_workers = int(
+            ds.config.get("datalad.fusefs.chunk-workers", DEFAULT_CHUNK_WORKERS)
+        )
+        self.profile = RemoteProfile(
+            os.path.join(path, ".git", "datalad", "cache", "fuse", "profile.sqlite"),
+            ttl=float(ds.config.get("datalad.fusefs.profile-ttl", DEFAULT_PROFILE_TTL)),
+        )
+        self.resolve_ahead_enabled = ds.config.getbool(
+            "datalad.fusefs", "resolve-ahead", True
+        )
+        self.resolve_workers = int(
+            ds.config.get("datalad.fusefs.resolve-workers", DEFAULT_RESOLVE_WORKERS)
+        )
+        self._resolver: Optional[ThreadPoolExecutor] = None
+        # key -> URL found (or being found) to serve it by `resolve_ahead()`,
+        # oldest first
+        self._resolved: OrderedDict[str, Future[Optional[str]]] = OrderedDict()
+        # path -> when it was last queued by `resolve_ahead()` and the task
+        # looking it up, oldest first
+        self._queued: OrderedDict[str, tuple[float, Future[None]]] = OrderedDict()
+        self._queue_lock = Lock()
+        # Serializes use of git-annex between opens and lazily computed
+        # alternate URLs of already opened files
+        self._lock = RLock()
 
     def close(self) -> None:
+        if self._resolver is not None:
+            self._resolver.shutdown(wait=True, cancel_futures=True)
+            self._resolver = None
         if self.annex is not None:
             self.annex._batched.clear()
+        self.url_cache.close()
+        self.s3_index.close()
+        self.archive_index.close()
+        self.profile.close()
 
     @methodtools.lru_cache(maxsize=CACHE_SIZE)
     def get_file_state(self, relpath: str) -> tuple[FileState, Optional[AnnexKey]]:
@@ -111,24 +273,21 @@ class DatasetAdapter:
         # TODO: switch to batch=True whenever
         # https://github.com/datalad/datalad/pull/6379 is merged/released.
         # Will need a recent git-annex to work!
-        whereis = self.annex.whereis(key, output="full", batch=False, key=True)
+        with traced("whereis", key=key):
+            whereis = self.annex.whereis(key, output="full", batch=False, key=True)
         remote_uuids = []
         for ru, v in whereis.items():
             remote_uuids.append(ru)
             for u in v["urls"]:
                 if is_http_url(u):
                     yield u
+                elif is_s3_url(u):
+                    try:
+                        yield self.s3.to_http(u)
+                    except ValueError as e:
+                        lgr.debug("Skipping S3 URL %s: %s", u, e)
 
-        path_mixed = self.annex._batched.get(
-            "examinekey",
-            annex_options=["--format=annex/objects/${hashdirmixed}${key}/${key}\\n"],
-            path=self.annex.path,
-        )(key)
-        path_lower = self.annex._batched.get(
-            "examinekey",
-            annex_options=["--format=annex/objects/${hashdirlower}${key}/${key}\\n"],
-            path=self.annex.path,
-        )(key)
+        path_mixed, path_lower = self._object_paths(key)
 
         uuid2remote_url = {}
         aneksajo_uuids: set[str] = set()
@@ -144,7 +303,11 @@ class DatasetAdapter:
             #   remote.{r}.pushurl config
             # TODO: SSH remote URLs not yet supported -- would need to
             #   derive the HTTP base URL from the SSH URL
-            if is_http_url(remote_url) and _is_aneksajo(remote_url):
+            if (
+                is_http_url(remote_url)
+                and not self.offline
+                and _is_aneksajo(remote_url)
+            ):
                 aneksajo_uuids.add(ru)
 
         for ru in remote_uuids:
@@ -161,24 +324,85 @@ class DatasetAdapter:
                     forge_base = base_stripped[:-4].rstrip("/")
                     yield forge_base + "/" + path_lower
                 if base_stripped.lower().endswith("/.git"):
-                    paths = [path_mixed, path_lower]
+                    root = base_stripped[:-5]
+                    variants = {
+                        ".git/mixed": f"{base_stripped[-4:]}/{path_mixed}",
+                        ".git/lower": f"{base_stripped[-4:]}/{path_lower}",
+                    }
                 else:
-                    paths = [
-                        path_lower,
-                        path_mixed,
-                        f".git/{path_lower}",
-                        f".git/{path_mixed}",
-                    ]
-                for p in paths:
-                    yield base_stripped + "/" + p
+                    root = base_stripped
+                    variants = {
+                        "lower": path_lower,
+                        "mixed": path_mixed,
+                        ".git/lower": f".git/{path_lower}",
+                        ".git/mixed": f".git/{path_mixed}",
+                    }
+                # Try the layout this remote is known to serve first; the
+                # others are only reached if it fails for this key
+                layouts = list(variants)
+                learned = self.get_layout(root)
+                if learned in variants:
+                    layouts.remove(learned)
+                    layouts.insert(0, learned)
+                for layout in layouts:
+                    yield root + "/" + variants[layout]
+
+    def get_layout(self, root: str) -> Optional[str]:
+        """Return the object-path layout learned for a remote base URL"""
+        try:
+            return self._layouts[root]
+        except KeyError:
+            layout = self._layouts[root] = self.url_cache.get_layout(root)
+            return layout
+
+    def learn_layout(self, url: str) -> None:
+        """Record which object-path layout the remote of ``url`` serves"""
+        if (split := split_layout(url)) is not None:
+            root, layout = split
+            if self._layouts.get(root) != layout:
+                lgr.debug("Learned object layout %r for %s", layout, root)
+                self._layouts[root] = layout
+                self.url_cache.set_layout(root, layout)
+
+    @methodtools.lru_cache(maxsize=1)
+    def _read_remote_log(self) -> list[tuple[str, dict[str, str]]]:
+        """Parse the git-annex branch remote.log (cached per DatasetAdapter
+        instance) into pairs of special remote UUIDs and their
+        configurations"""
+        with traced("remote_log"):
+            try:
+                result = subprocess.run(
+                    ["git", "-C", str(self.path), "show", "git-annex:remote.log"],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+            except subprocess.CalledProcessError:
+                lgr.debug("Could not read git-annex:remote.log for %s", self.path)
+                return []
+
+        entries: list[tuple[str, dict[str, str]]] = []
+        for line in result.stdout.strip().splitlines():
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split()
+            if len(parts) < 2:
+                continue
+            uuid = parts[0]
+            config: dict[str, str] = {}
+            for token in parts[1:]:
+                if "=" in token:
+                    k, v = token.split("=", 1)
+                    config[k] = v
+            entries.append((uuid, config))
+        return entries
 
     @methodtools.lru_cache(maxsize=1)
     def _get_exporttree_remotes(self) -> list[dict[str, str]]:
         """Get S3 exporttree remotes with public URLs.
 
-        Parses the git-annex branch remote.log once (cached per
-        DatasetAdapter instance) to find S3 special remotes configured
-        with ``exporttree=yes`` and a usable ``publicurl``.
+        Uses the git-annex branch remote.log to find S3 special remotes
+        configured with ``exporttree=yes`` and a usable ``publicurl``.
 
         This is a workaround for legacy datasets that lack proper
         versioned S3 URLs in their git-annex metadata.
@@ -190,30 +414,8 @@ class DatasetAdapter:
             Each dict has keys: ``uuid``, ``publicurl``, ``fileprefix``,
             ``bucket``, ``host``.
         """
-        try:
-            result = subprocess.run(
-                ["git", "-C", str(self.path), "show", "git-annex:remote.log"],
-                capture_output=True,
-                text=True,
-                check=True,
-            )
-        except subprocess.CalledProcessError:
-            lgr.debug("Could not read git-annex:remote.log for %s", self.path)
-            return []
-
         remotes: list[dict[str, str]] = []
-        for line in result.stdout.strip().splitlines():
-            if not line or line.startswith("#"):
-                continue
-            parts = line.split()
-            if len(parts) < 2:
-                continue
-            uuid = parts[0]
-            config: dict[str, str] = {}
-            for token in parts[1:]:
-                if "=" in token:
-                    k, v = token.split("=", 1)
-                    config[k] = v
+        for uuid, config in self._read_remote_log():
             if (
                 config.get("type") == "S3"
                 and config.get("exporttree") == "yes"
@@ -230,64 +432,199 @@ class DatasetAdapter:
                 )
         return remotes
 
+    @methodtools.lru_cache(maxsize=1)
+    def _get_local_remotes(self) -> list[dict[str, Any]]:
+        """Get remotes whose content is reachable on the local filesystem.
+
+        These are git remotes whose URL is a local path or a ``file://``
+        URL (e.g., sibling clones on a shared filesystem) and enabled,
+        unencrypted ``directory`` special remotes.
+
+        Returns
+        -------
+        list of dict
+            Each dict has keys: ``name``, ``uuid``, ``path``, ``kind``
+            (``"git"``, ``"directory"``, or ``"export"`` for a directory
+            special remote with ``exporttree=yes``), and ``cost``, sorted by
+            cost (from ``remote.<name>.annex-cost``, cheapest first).
+        """
+        if self.annex is None:
+            return []
+        remotes: list[dict[str, Any]] = []
+        rlog = dict(self._read_remote_log())
+        for r in self.annex.get_remotes():
+            if self.annex.config.getbool(f"remote.{r}", "annex-ignore", False):
+                continue
+            ru = self.annex.config.get(f"remote.{r}.annex-uuid")
+            config = rlog.get(ru, {}) if ru is not None else {}
+            if directory := self.annex.config.get(f"remote.{r}.annex-directory"):
+                if config.get("encryption", "none") != "none":
+                    continue
+                kind = "export" if config.get("exporttree") == "yes" else "directory"
+                path = Path(directory)
+            elif (url := self.annex.config.get(f"remote.{r}.url")) is not None:
+                if (local := local_path(url)) is None:
+                    continue
+                kind = "git"
+                path = local
+            else:
+                continue
+            if not path.is_absolute():
+                path = self.path / path
+            cost = float(
+                self.annex.config.get(f"remote.{r}.annex-cost", DEFAULT_LOCAL_COST)
+            )
+            remotes.append(
+                {"name": r, "uuid": ru, "path": path, "kind": kind, "cost": cost}
+            )
+        remotes.sort(key=lambda rm: rm["cost"])
+        return remotes
+
+    def get_local_paths(self, relpath: str, key: AnnexKey) -> Iterator[Path]:
+        """Yield paths of copies of ``key`` in remotes on the local
+        filesystem (see `_get_local_remotes()`), cheapest remote first"""
+        remotes = self._get_local_remotes()
+        if not remotes:
+            return
+        path_mixed, path_lower = self._object_paths(str(key))
+        for remote in remotes:
+            root = remote["path"]
+            if remote["kind"] == "git":
+                candidates = [
+                    root / ".git" / path_mixed,
+                    root / ".git" / path_lower,
+                    root / path_lower,
+                    root / path_mixed,
+                ]
+            elif remote["kind"] == "directory":
+                # Directory special remotes use the hashdirlower layout
+                # without the annex/objects/ prefix
+                candidates = [root / Path(path_lower).relative_to("annex/objects")]
+            elif relpath.startswith(".git/"):
+                continue
+            else:
+                candidates = [root / relpath]
+            for p in candidates:
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                if key.content_size is not None and st.st_size != key.content_size:
+                    lgr.debug("%s: ignoring %s as its size differs", relpath, p)
+                    continue
+                lgr.debug(
+                    "%s: found in local remote %s at %s", relpath, remote["name"], p
+                )
+                yield p
+
+    def _object_paths(self, key: str) -> tuple[str, str]:
+        """Return the ``annex/objects/...`` paths of ``key`` in the
+        hashdirmixed and hashdirlower layouts"""
+        assert self.annex is not None
+        with traced("examinekey", key=key):
+            path_mixed = self.annex._batched.get(
+                "examinekey",
+                annex_options=[
+                    "--format=annex/objects/${hashdirmixed}${key}/${key}\\n"
+                ],
+                path=self.annex.path,
+            )(key)
+            path_lower = self.annex._batched.get(
+                "examinekey",
+                annex_options=[
+                    "--format=annex/objects/${hashdirlower}${key}/${key}\\n"
+                ],
+                path=self.annex.path,
+            )(key)
+        return (path_mixed, path_lower)
+
     @staticmethod
     def _list_s3_versions(
         bucket: str,
-        object_key: str,
+        prefix: str,
         host: str = "s3.amazonaws.com",
     ) -> list[dict[str, Any]]:
-        """List all S3 object versions for a key.
+        """List all S3 object versions under a prefix.
 
-        Uses ``boto3`` to call ``ListObjectVersions`` with anonymous
-        credentials (for public buckets).
+        Uses a pooled anonymous ``boto3`` client for the host (for public
+        buckets) to page through ``ListObjectVersions``.
 
         Parameters
         ----------
         bucket : str
             S3 bucket name (e.g., ``openneuro.org``).
-        object_key : str
-            Full object key including fileprefix (e.g.,
-            ``ds000113/sub-01/.../bold.nii.gz``).
+        prefix : str
+            Key prefix to list (e.g., ``ds000113/``); may also be a full
+            object key.
         host : str
             S3 endpoint hostname (default: ``s3.amazonaws.com``).
 
         Returns
         -------
         list of dict
-            Each dict has keys: ``VersionId``, ``Size``, ``ETag``,
-            ``IsLatest``.
+            Each dict has keys: ``Key``, ``VersionId``, ``Size``, ``ETag``,
+            ``IsLatest``.  Empty if listing failed.
         """
-        try:
-            endpoint_url = f"https://{host}"
-            client = boto3.client(
-                "s3",
-                endpoint_url=endpoint_url,
-                config=BotocoreConfig(signature_version=UNSIGNED),
-            )
-            response = client.list_object_versions(
-                Bucket=bucket, Prefix=object_key
-            )
-        except Exception as e:
-            lgr.debug(
-                "Failed to list S3 versions for %s/%s: %s",
-                bucket, object_key, e,
-            )
-            return []
-
         versions: list[dict[str, Any]] = []
-        for v in response.get("Versions", []):
-            # Only include exact key matches (prefix query may return others)
-            if v.get("Key") == object_key:
-                versions.append(
-                    {
-                        "VersionId": v.get("VersionId", ""),
-                        "Size": v.get("Size", 0),
-                        "ETag": v.get("ETag", ""),
-                        "IsLatest": v.get("IsLatest", False),
-                    }
+        with traced("s3_list_versions", bucket=bucket, prefix=prefix) as st:
+            try:
+                client = S3Resolver(endpoint_url=f"https://{host}").get_client()
+                paginator = client.get_paginator("list_object_versions")
+                for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+                    for v in page.get("Versions", []):
+                        versions.append(
+                            {
+                                "Key": v.get("Key", ""),
+                                "VersionId": v.get("VersionId", ""),
+                                "Size": v.get("Size", 0),
+                                "ETag": v.get("ETag", ""),
+                                "IsLatest": v.get("IsLatest", False),
+                            }
+                        )
+            except Exception as e:
+                lgr.debug(
+                    "Failed to list S3 versions for %s/%s: %s",
+                    bucket,
+                    prefix,
+                    e,
                 )
+                st["error"] = str(e)
+                return []
+            st["versions"] = len(versions)
         return versions
 
+    def _get_s3_versions(
+        self, bucket: str, object_key: str, fileprefix: str, host: str
+    ) -> list[dict[str, Any]]:
+        """Look up the versions of an S3 object in the version index.
+
+        If no current listing covers the object, first list either the
+        whole ``fileprefix`` of its exporttree remote (the default) or,
+        if ``datalad.fusefs.s3-index-scope`` is ``directory`` or the
+        remote has no fileprefix, just the object's directory, and index
+        the result.  A listing that fails or finds nothing is not repeated
+        for ``datalad.fusefs.s3-index-negative-ttl`` seconds.
+
+        Returns
+        -------
+        list of dict
+            As for :meth:`_list_s3_versions`, restricted to ``object_key``.
+        """
+        if not self.s3_index.covers(host, bucket, object_key) and not self.offline:
+            if fileprefix and self.s3_index_scope != "directory":
+                prefix = fileprefix
+            elif "/" in object_key:
+                prefix = object_key.rsplit("/", 1)[0] + "/"
+            else:
+                prefix = object_key
+            lgr.debug("Listing S3 versions under s3://%s/%s", bucket, prefix)
+            versions = self._list_s3_versions(bucket, prefix, host)
+            if not versions:
+                self.s3_index.record_miss(host, bucket, prefix)
+                return []
+            self.s3_index.store(host, bucket, prefix, versions)
+        return self.s3_index.get_versions(host, bucket, object_key)
+
     @staticmethod
     def _match_s3_version(
         versions: list[dict[str, Any]], expected_size: int
@@ -331,9 +668,7 @@ class DatasetAdapter:
             f"Cannot determine correct version."
         )
 
-    def get_exporttree_urls(
-        self, relpath: str, key: AnnexKey
-    ) -> Iterator[str]:
+    def get_exporttree_urls(self, relpath: str, key: AnnexKey) -> Iterator[str]:
         """Yield versioned URLs for file on S3 exporttree remotes.
 
         Workaround for datasets lacking proper versioned URLs in
@@ -367,16 +702,12 @@ class DatasetAdapter:
             base_url = f"{publicurl}/{object_key}"
 
             if key.size is not None:
-                versions = self._list_s3_versions(bucket, object_key, host)
+                versions = self._get_s3_versions(bucket, object_key, fileprefix, host)
                 if versions:
                     try:
-                        version_id = self._match_s3_version(
-                            versions, key.size
-                        )
+                        version_id = self._match_s3_version(versions, key.size)
                     except ValueError as e:
-                        lgr.warning(
-                            "%s: %s", relpath, e
-                        )
+                        lgr.warning("%s: %s", relpath, e)
                         continue
                     if version_id:
                         yield f"{base_url}?versionId={version_id}"
@@ -413,7 +744,10 @@ class DatasetAdapter:
             kwargs = {}
         else:
             kwargs = {"encoding": encoding, "errors": errors}
-        fstate, key = self.get_file_state(relpath)
+        with traced("get_file_state", path=relpath) as st:
+            fstate, key = self.get_file_state(relpath)
+            st["state"] = fstate.name
+            st["key"] = str(key) if key is not None else None
         if fstate is FileState.NOT_ANNEXED:
             lgr.debug("%s: not under annex", relpath)
         else:
@@ -423,49 +757,34 @@ class DatasetAdapter:
                 "has" if fstate is FileState.HAS_CONTENT else "does not have",
             )
         if fstate is FileState.NO_CONTENT:
-            lgr.debug("%s: opening via fsspec", relpath)
-            for url in self.get_urls(str(key)):
-                try:
-                    lgr.debug("%s: Attempting to open via URL %s", relpath, url)
-                    return self.fs.open(url, mode, **kwargs)  # type: ignore
-                except BlocksizeMismatchError as e:
-                    lgr.warning(
-                        "%s: Blocksize mismatch: %s; deleting cached file and"
-                        " re-opening",
+            assert key is not None
+            f = self._open_key(relpath, key, mode, **kwargs)
+            if f is None:
+                with self._lock, traced("exporttree"):
+                    # Fallback: try S3 exporttree URLs (workaround for datasets
+                    # lacking proper versioned URLs — see openneuro#3875)
+                    f = self._open_first(
                         relpath,
-                        e,
+                        str(key),
+                        self.get_exporttree_urls(relpath, key),
+                        mode,
+                        **kwargs,
                     )
-                    self.fs.pop_from_cache(url)
-                    return self.fs.open(url, mode, **kwargs)  # type: ignore
-                except FileNotFoundError as e:
-                    lgr.debug(
-                        "Failed to open file %s at URL %s: %s", relpath, url, str(e)
-                    )
-            # Fallback: try S3 exporttree URLs (workaround for datasets
-            # lacking proper versioned URLs — see openneuro#3875)
-            if key is not None:
-                for url in self.get_exporttree_urls(relpath, key):
-                    try:
-                        lgr.debug(
-                            "%s: Attempting exporttree URL %s", relpath, url
-                        )
-                        return self.fs.open(url, mode, **kwargs)  # type: ignore
-                    except BlocksizeMismatchError as e:
-                        lgr.warning(
-                            "%s: Blocksize mismatch: %s; deleting cached file"
-                            " and re-opening",
-                            relpath,
-                            e,
-                        )
-                        self.fs.pop_from_cache(url)
-                        return self.fs.open(url, mode, **kwargs)  # type: ignore
-                    except FileNotFoundError as e:
-                        lgr.debug(
-                            "Failed to open file %s at exporttree URL %s: %s",
-                            relpath,
-                            url,
-                            str(e),
-                        )
+            if f is None:
+                with traced("chunks"):
+                    f = self._open_chunked(relpath, key, mode, **kwargs)
+            if f is None:
+                with traced("archive"):
+                    f = self._open_from_archive(relpath, key, mode, **kwargs)
+            if f is not None:
+                return f
+            if self.offline:
+                offline_stats.misses += 1
+                raise OfflineError(
+                    ENOENT,
+                    f"{relpath}: content is neither available locally nor cached"
+                    " (offline mode)",
+                )
             raise IOError(
                 f"Could not find a usable URL for {relpath} within {self.path}"
             )
@@ -473,19 +792,597 @@ class DatasetAdapter:
             lgr.debug("%s: opening directly", relpath)
             return open(self.path / relpath, mode, **kwargs)  # type: ignore
 
+    def _open_key(
+        self, relpath: str, key: AnnexKey, mode: str, **kwargs: Any
+    ) -> Optional[IO]:
+        """Open the content of ``key`` from a local remote or via its URLs.
+        Returns `None` if this is not possible."""
+        with self._lock, traced("local_remotes", key=str(key)) as st:
+            for p in self.get_local_paths(relpath, key):
+                lgr.debug("%s: opening local copy %s", relpath, p)
+                st["path"] = str(p)
+                return open(p, mode, **kwargs)  # type: ignore
+        lgr.debug("%s: opening via fsspec", relpath)
+        skey = str(key)
+        with traced("url_cache", key=skey) as st:
+            url = st["url"] = self.url_cache.get_working(skey)
+        if url is not None and (not self.offline or self.is_cached(url)):
+            try:
+                lgr.debug("%s: Attempting to open via cached URL %s", relpath, url)
+                # The URL is known to work, so it is only checked when read
+                return self._open_url(
+                    relpath,
+                    url,
+                    mode,
+                    key=skey,
+                    probe=False,
+                    alternates=partial(self._alternate_urls, relpath, key),
+                    **kwargs,
+                )
+            except FileNotFoundError as e:
+                lgr.debug(
+                    "Failed to open file %s at cached URL %s: %s",
+                    relpath,
+                    url,
+                    str(e),
+                )
+                self.url_cache.record_failure(skey, url)
+        if (fut := self._resolved.pop(skey, None)) is not None:
+            with traced("resolved_ahead", key=skey) as st:
+                try:
+                    url = st["url"] = fut.result()
+                except Exception as e:
+                    lgr.debug("%s: resolving URL ahead failed: %s", relpath, e)
+                    url = None
+            if url is not None:
+                try:
+                    lgr.debug(
+                        "%s: Attempting to open via URL resolved ahead %s", relpath, url
+                    )
+                    # The URL has been probed already
+                    f = self._open_url(
+                        relpath,
+                        url,
+                        mode,
+                        key=skey,
+                        probe=False,
+                        alternates=partial(self._alternate_urls, relpath, key),
+                        **kwargs,
+                    )
+                except FileNotFoundError as e:
+                    lgr.debug(
+                        "Failed to open file %s at URL %s: %s", relpath, url, str(e)
+                    )
+                    self.url_cache.record_failure(skey, url)
+                else:
+                    if presigned_expiry(yarl.URL(url)) is None:
+                        self.url_cache.record_success(skey, url)
+                    self.learn_layout(url)
+                    return f
+        with self._lock, traced("urls", key=skey):
+            return self._open_first(relpath, skey, self.get_urls(skey), mode, **kwargs)
+
+    def resolve_ahead(self, relpath: str) -> None:
+        """Start finding a working URL for ``relpath`` in the background if it
+        is annexed without content, so that a following `open()` (which
+        waits for the resolution if it is still under way) can use it right
+        away.
+
+        This is meant to be called when a file is looked at (e.g., stat'ed),
+        as files are usually opened shortly after, and so only queues the
+        path; all git-annex lookups happen in the background.  Nothing is
+        queued if the path was already queued within the last
+        `RESOLVE_AHEAD_INTERVAL` seconds or if too many resolutions are
+        already pending, and nothing is resolved if the content is available
+        locally or at a URL in the URL cache.
+        """
+        if not self.resolve_ahead_enabled or self.offline or self.annex is None:
+            return
+        now = time.monotonic()
+        with self._queue_lock:
+            if (queued := self._queued.get(relpath)) is not None:
+                when, task = queued
+                if not task.done() or now - when < RESOLVE_AHEAD_INTERVAL:
+                    return
+            pending = sum(1 for _, t in self._queued.values() if not t.done())
+            if pending >= RESOLVE_AHEAD_LIMIT:
+                lgr.debug("%s: too many pending resolutions; not resolving", relpath)
+                return
+            if self._resolver is None:
+                self._resolver = ThreadPoolExecutor(
+                    max_workers=self.resolve_workers,
+                    thread_name_prefix="datalad-fuse-resolve",
+                )
+            self._queued.pop(relpath, None)
+            self._queued[relpath] = (
+                now,
+                self._resolver.submit(self._resolve_ahead, relpath),
+            )
+            while len(self._queued) > CACHE_SIZE:
+                self._queued.popitem(last=False)
+
+    def _resolve_ahead(self, relpath: str) -> None:
+        """Resolve a URL for ``relpath`` queued by `resolve_ahead()`, storing
+        the result where `open()` will find it"""
+        try:
+            fstate, key = self.get_file_state(relpath)
+        except OSError:
+            return
+        if fstate is not FileState.NO_CONTENT or key is None:
+            return
+        skey = str(key)
+        with self._lock:
+            if skey in self._resolved:
+                return
+            if self.url_cache.get_working(skey) is not None:
+                return
+            if any(True for _ in self.get_local_paths(relpath, key)):
+                return
+            lgr.debug("%s: resolving URL ahead of open", relpath)
+            fut: Future[Optional[str]] = Future()
+            fut.set_running_or_notify_cancel()
+            self._resolved[skey] = fut
+            while len(self._resolved) > CACHE_SIZE:
+                self._resolved.popitem(last=False)
+        try:
+            fut.set_result(self._resolve_url(relpath, key))
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+
+    def _resolve_url(self, relpath: str, key: AnnexKey) -> Optional[str]:
+        """Return the first of the candidate URLs for ``key`` (falling back to
+        those on exporttree remotes) to answer, or `None` if none work"""
+        skey = str(key)
+        with self._lock:
+            urls = [
+                u for u in self.get_urls(skey) if not self.url_cache.is_dead(skey, u)
+            ]
+            if not urls:
+                urls = [
+                    u
+                    for u in self.get_exporttree_urls(relpath, key)
+                    if not self.url_cache.is_dead(skey, u)
+                ]
+        candidates = self.order_urls(list(dict.fromkeys(urls)))
+        # Even a sole candidate is probed, so that opening it need not be
+        winner, errors = probe_first(
+            self._httpfs, candidates, stagger=self.probe_stagger
+        )
+        for u, e in errors.items():
+            lgr.debug("Failed to probe file %s at URL %s: %s", relpath, u, e)
+            if isinstance(e, FileNotFoundError):
+                self.url_cache.record_failure(skey, u)
+        return winner
+
+    @methodtools.lru_cache(maxsize=1)
+    def _get_web_special_remotes(self) -> dict[str, list[dict[str, str]]]:
+        """Get special remotes whose objects can be downloaded over HTTP.
+
+        These are ``httpalso`` remotes (keyed by the UUID of the remote
+        they mirror) and S3 remotes with a public URL that are not
+        exporttree remotes.
+
+        Returns
+        -------
+        dict
+            Maps remote UUIDs to lists of dicts with keys ``type``
+            (``"httpalso"`` or ``"S3"``) and ``url`` (the base URL of the
+            objects).
+        """
+        remotes: dict[str, list[dict[str, str]]] = {}
+        for uuid, config in self._read_remote_log():
+            if config.get("type") == "httpalso" and "url" in config:
+                remotes.setdefault(config.get("sameas-uuid", uuid), []).append(
+                    {"type": "httpalso", "url": config["url"].rstrip("/") + "/"}
+                )
+            elif (
+                config.get("type") == "S3"
+                and config.get("exporttree") != "yes"
+                and config.get("publicurl", "no").startswith("http")
+            ):
+                remotes.setdefault(config.get("sameas-uuid", uuid), []).append(
+                    {
+                        "type": "S3",
+                        "url": config["publicurl"].rstrip("/")
+                        + "/"
+                        + config.get("fileprefix", ""),
+                    }
+                )
+        return remotes
+
+    def get_chunk_layouts(self, key: str) -> dict[str, list[ChunkLayout]]:
+        """Return the chunk layouts in which remotes store ``key``, as
+        recorded in the key's chunk log on the git-annex branch"""
+        _, path_lower = self._object_paths(key)
+        hashdir = "/".join(Path(path_lower).parts[2:4])
+        with traced("chunk_log", key=key):
+            try:
+                result = subprocess.run(
+                    [
+                        "git",
+                        "-C",
+                        str(self.path),
+                        "show",
+                        f"git-annex:{hashdir}/{key}.log.cnk",
+                    ],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+            except subprocess.CalledProcessError:
+                return {}
+        return parse_chunk_log(result.stdout)
+
+    def _open_chunked(
+        self, relpath: str, key: AnnexKey, mode: str, **kwargs: Any
+    ) -> Optional[IO]:
+        """Open the content of ``key`` from the chunks that a special remote
+        with ``chunk=`` stores it in.  Returns `None` if this is not
+        possible."""
+        if key.size is None:
+            return None
+        with self._lock:
+            layouts = self.get_chunk_layouts(str(key))
+            if not layouts:
+                return None
+            local = {
+                r["uuid"]: r
+                for r in self._get_local_remotes()
+                if r["kind"] == "directory"
+            }
+            web = self._get_web_special_remotes()
+        # Prefer remotes on the local filesystem
+        for uuid in sorted(layouts, key=lambda u: u not in local):
+            if uuid not in local and uuid not in web:
+                continue
+            for layout in layouts[uuid]:
+                lgr.debug(
+                    "%s: Attempting to open %d chunks of %d bytes from %s",
+                    relpath,
+                    layout.chunk_count,
+                    layout.chunk_size,
+                    uuid,
+                )
+                f = open_chunked(
+                    key,
+                    layout,
+                    partial(
+                        self._open_chunk, relpath, local.get(uuid), web.get(uuid, [])
+                    ),
+                    name=relpath,
+                    max_workers=self.chunk_workers,
+                )
+                if f is not None:
+                    if mode != "rb":
+                        return io.TextIOWrapper(io.BufferedReader(f), **kwargs)
+                    return cast(IO, f)
+        return None
+
+    def _open_chunk(
+        self,
+        relpath: str,
+        local: Optional[dict[str, Any]],
+        web: list[dict[str, str]],
+        ck: AnnexKey,
+    ) -> Optional[IO]:
+        """Open chunk key ``ck`` from a local directory remote or the URLs of
+        web-accessible special remotes"""
+        skey = str(ck)
+        with self._lock:
+            path_mixed, path_lower = self._object_paths(skey)
+        if local is not None:
+            p = local["path"] / Path(path_lower).relative_to("annex/objects")
+            try:
+                if p.stat().st_size == ck.content_size:
+                    return open(p, "rb")
+            except OSError:
+                pass
+        urls = []
+        for remote in web:
+            if remote["type"] == "httpalso":
+                for path in (path_lower, path_mixed):
+                    urls.append(
+                        remote["url"] + str(Path(path).relative_to("annex/objects"))
+                    )
+            else:
+                urls.append(remote["url"] + skey)
+        return self._open_first(relpath, skey, urls, "rb")
+
+    def get_archive_urls(self, key: str) -> list[str]:
+        """Return the ``dl+archive:`` URLs registered for ``key``"""
+        assert self.annex is not None
+        with traced("whereis", key=key):
+            whereis = self.annex.whereis(key, output="full", batch=False, key=True)
+        return [u for v in whereis.values() for u in v["urls"] if is_archive_url(u)]
+
+    def _open_from_archive(
+        self, relpath: str, key: AnnexKey, mode: str, **kwargs: Any
+    ) -> Optional[IO]:
+        """Open the content of ``key`` as a member of an archive referenced by
+        one of its ``dl+archive:`` URLs (as provided by the datalad-archives
+        special remote).  Returns `None` if this is not possible."""
+        with self._lock:
+            urls = self.get_archive_urls(str(key))
+        for url in urls:
+            try:
+                member = parse_archive_url(url)
+                archive_key = AnnexKey.parse(member.archive_key)
+            except ValueError as e:
+                lgr.debug("%s: Skipping archive URL %s: %s", relpath, url, e)
+                continue
+            lgr.debug("%s: Attempting to open via archive URL %s", relpath, url)
+            archive = self._open_archive(relpath, archive_key)
+            if archive is None:
+                lgr.debug("%s: Archive %s not available", relpath, archive_key)
+                continue
+            try:
+                f = open_member(
+                    archive,
+                    member,
+                    self.archive_index,
+                    name=relpath,
+                    download=self._download_archive,
+                )
+            except (OSError, tarfile.TarError, zipfile.BadZipFile) as e:
+                lgr.debug("%s: Failed to open %s: %s", relpath, url, e)
+                archive.close()
+                continue
+            if mode != "rb":
+                return io.TextIOWrapper(io.BufferedReader(f), **kwargs)
+            return cast(IO, f)
+        return None
+
+    def _download_archive(self, f: IO[bytes]) -> IO[bytes]:
+        """Return a local copy of a compressed archive opened from a URL,
+        downloading it completely to the spool directory, or ``f`` itself if
+        it is not remote"""
+        if not isinstance(f, AnnexHTTPFile) or f.spooler is None or self.offline:
+            return f
+        with traced("spool_archive", url=f.url):
+            return f.spool().open("rb")
+
+    def _open_archive(self, relpath: str, key: AnnexKey) -> Optional[IO]:
+        """Open an archive by its key, from the local annex if present"""
+        with self._lock:
+            for p in self._object_paths(str(key)):
+                if (path := self.path / ".git" / p).exists():
+                    return open(path, "rb")
+        return self._open_key(relpath, key, "rb")
+
+    def _open_first(
+        self, relpath: str, key: str, urls: Iterable[str], mode: str, **kwargs: Any
+    ) -> Optional[IO]:
+        """Open ``relpath`` via whichever of ``urls`` answers first.
+
+        If there are multiple candidate URLs, they are probed concurrently
+        (see `probe_first()`), so that a slow or unresponsive remote does not
+        delay trying the others.  Returns `None` if no URL works.
+        """
+        candidates: list[str] = []
+        for url in urls:
+            if self.url_cache.is_dead(key, url):
+                lgr.debug("%s: Skipping known-dead URL %s", relpath, url)
+            elif url not in candidates:
+                candidates.append(url)
+        candidates = self.order_urls(candidates)
+        if self.offline:
+            # Only open a URL whose content is cached; there is nothing to probe
+            candidates = [u for u in candidates if self.is_cached(u)][:1]
+        while candidates:
+            if len(candidates) == 1:
+                url = candidates[0]
+            else:
+                with traced("probe", candidates=list(candidates)) as st:
+                    winner, errors = probe_first(
+                        self._httpfs, candidates, stagger=self.probe_stagger
+                    )
+                    st["winner"] = winner
+                    st["failed"] = {u: str(e) for u, e in errors.items()}
+                for u, e in errors.items():
+                    lgr.debug("Failed to probe file %s at URL %s: %s", relpath, u, e)
+                    candidates.remove(u)
+                    if isinstance(e, FileNotFoundError):
+                        self.url_cache.record_failure(key, u)
+                if winner is None:
+                    return None
+                url = winner
+            try:
+                lgr.debug("%s: Attempting to open via URL %s", relpath, url)
+                others = [u for u in candidates if u != url]
+                f = self._open_url(
+                    relpath,
+                    url,
+                    mode,
+                    key=key,
+                    alternates=partial(list, others),
+                    **kwargs,
+                )
+            except FileNotFoundError as e:
+                lgr.debug("Failed to open file %s at URL %s: %s", relpath, url, str(e))
+                self.url_cache.record_failure(key, url)
+                candidates.remove(url)
+            else:
+                if presigned_expiry(yarl.URL(url)) is None:
+                    # Presigned URLs expire, so they are not worth remembering
+                    self.url_cache.record_success(key, url)
+                self.learn_layout(url)
+                return f
+        return None
+
+    def _alternate_urls(self, relpath: str, key: AnnexKey) -> list[str]:
+        """Return all usable candidate URLs for ``key``, best first"""
+        skey = str(key)
+        with self._lock:
+            urls = [
+                u for u in self.get_urls(skey) if not self.url_cache.is_dead(skey, u)
+            ]
+            if not urls:
+                urls = [
+                    u
+                    for u in self.get_exporttree_urls(relpath, key)
+                    if not self.url_cache.is_dead(skey, u)
+                ]
+        return self.order_urls(list(dict.fromkeys(urls)))
+
+    def order_urls(self, urls: list[str]) -> list[str]:
+        """Order candidate URLs best first: hosts that are currently failing
+        are dropped (see `HostHealth.order()`), and the rest are ranked by
+        their measured profiles (see `profile_remotes()`), falling back to
+        their health statistics"""
+        return self.profile.order(host_health.order(urls))
+
+    def profile_remotes(
+        self, relpaths: Iterable[str], nbytes: int
+    ) -> tuple[list[HostProfile], dict[str, str]]:
+        """Measure the time to first byte and the throughput of reading up
+        to ``nbytes`` bytes from every candidate URL of each of the given
+        annexed files, and store the resulting profile of each host.
+
+        Returns a list of the new host profiles, best first, and a `dict`
+        mapping hosts for which all requests failed to the last error.
+        """
+        assert self.annex is not None
+        measurements: dict[str, list[Measurement]] = {}
+        errors: dict[str, str] = {}
+        for rec in self.annex.call_annex_records(
+            ["find", "--include=*"], files=list(relpaths)
+        ):
+            relpath = rec["file"]
+            key = AnnexKey.parse(rec["key"])
+            if key.size == 0:
+                continue
+            n = min(nbytes, key.size) if key.size is not None else nbytes
+            with self._lock:
+                urls = list(self.get_urls(str(key)))
+                if not urls:
+                    urls = list(self.get_exporttree_urls(relpath, key))
+            for url in dict.fromkeys(urls):
+                host = host_of(url)
+                try:
+                    m = measure_url(self._httpfs, url, n)
+                except FileNotFoundError:
+                    # Expected for all but one object path layout of a remote
+                    lgr.debug("%s: not found at %s", relpath, url)
+                    continue
+                except Exception as e:
+                    lgr.debug("%s: failed to measure %s: %s", relpath, url, e)
+                    errors[host] = f"{type(e).__name__}: {e}"
+                    continue
+                lgr.debug(
+                    "%s: %s: TTFB %.3fs, %s bytes/s", relpath, url, m.ttfb, m.throughput
+                )
+                measurements.setdefault(host, []).append(m)
+        profiles = [summarize(host, ms) for host, ms in measurements.items()]
+        self.profile.store(profiles)
+        profiles.sort(key=lambda p: p.score)
+        return (profiles, {h: e for h, e in errors.items() if h not in measurements})
+
+    def is_cached(self, url: str) -> bool:
+        """Whether the complete content at ``url`` is in the on-disk cache.
+
+        Partially cached files do not count, as `CachingFileSystem` marks
+        blocks as cached before fetching them, so a failed fetch would leave
+        unfilled blocks behind.
+        """
+        if not self.caching:
+            return False
+        detail = self.fs._check_file(url)  # type: ignore[attr-defined]
+        return bool(detail) and detail[0]["blocks"] is True
+
+    def _open_url(
+        self,
+        relpath: str,
+        url: str,
+        mode: str,
+        key: Optional[str] = None,
+        probe: bool = True,
+        **kwargs: Any,
+    ) -> IO:
+        """Open ``url`` for ``relpath``.  If ``key`` gives the size of the
+        content and ``probe`` is true, the first block is fetched to check
+        that the URL serves it; otherwise, the URL is only checked by reading
+        from it, and ``key``'s entry in the URL cache is replaced by whichever
+        alternate URL is used instead if that fails."""
+        kwargs["spooler"] = self.spooler
+        kwargs["spool_name"] = key
+        if key is not None:
+            # The size is known from the key, so the server need not be asked
+            kwargs["key_size"] = AnnexKey.parse(key).content_size
+            if not probe:
+                kwargs["on_url_failure"] = partial(self.url_cache.record_failure, key)
+                kwargs["on_url_switch"] = partial(self.url_cache.record_success, key)
+        if self.hedge:
+            kwargs["hedge"] = True
+            kwargs["hedge_percentile"] = self.hedge_percentile
+        if self.coalesce:
+            kwargs["coalesce_gap"] = self.coalesce_gap
+        if self.stream:
+            kwargs["stream"] = True
+        elif self.readahead_segments > 0:
+            kwargs["readahead_segments"] = self.readahead_segments
+            kwargs["segment_size"] = self.segment_size
+        with traced("open_url", url=url):
+            try:
+                f = self.fs.open(url, mode, **kwargs)
+            except BlocksizeMismatchError as e:
+                lgr.warning(
+                    "%s: Blocksize mismatch: %s; deleting cached file and re-opening",
+                    relpath,
+                    e,
+                )
+                self.fs.pop_from_cache(url)
+                f = self.fs.open(url, mode, **kwargs)
+        raw = f.buffer if isinstance(f, io.TextIOWrapper) else f
+        if self.caching:
+            # `CachingFileSystem` fetches non-contiguous missing blocks with
+            # `cat_ranges()`, which passes on the open options (e.g.,
+            # ``alternates``) as request parameters and returns errors in place
+            # of data; fetch them through the file instead, so that they get
+            # failover and hedging as well
+            if isinstance(cache := getattr(raw, "cache", None), MMapCache):
+                cache.multi_fetcher = None
+        if probe and isinstance(raw, AnnexHTTPFile) and kwargs.get("key_size"):
+            # Opening the file made no request, so check that the URL serves
+            # it before the URL is recorded as working (raising
+            # `FileNotFoundError` if not, so that other sources are tried)
+            try:
+                with traced("probe_url", url=url):
+                    raw.probe()
+            except BaseException:
+                f.close()
+                if self.caching:
+                    # Don't keep the blocks marked as cached by the failed read
+                    self.fs.pop_from_cache(url)
+                raise
+        return cast(IO, f)
+
     def clear(self) -> None:
         if self.caching:
             self.fs.clear_cache()
+        self.url_cache.clear()
+        self.spooler.clear()
+        self.s3_index.clear()
+        self.archive_index.clear()
 
 
 class FsspecAdapter:
     def __init__(
-        self, root: str | Path, caching: bool, mode_transparent: bool = False
+        self,
+        root: str | Path,
+        caching: bool,
+        mode_transparent: bool = False,
+        offline: bool = False,
     ) -> None:
         self.root = Path(root)
         self.mode_transparent = mode_transparent
         self.caching = caching
+        self.offline = offline
         self.datasets: dict[Path, DatasetAdapter] = {}
+        # The dataset containing the root, whose configuration sets the
+        # process-wide options
+        rootds = get_dataset_root(self.root)
+        self.root_dataset = Path(rootds).resolve() if rootds is not None else None
 
     def __enter__(self) -> FsspecAdapter:
         return self
@@ -525,6 +1422,9 @@ class FsspecAdapter:
                 dspath,
                 mode_transparent=self.mode_transparent,
                 caching=self.caching,
+                offline=self.offline,
+                # Subdatasets don't override the mounted dataset's options
+                configure_client=dspath.resolve() == self.root_dataset,
             )
         relpath = str(Path(filepath).relative_to(dspath))
         return dsap, relpath
@@ -536,7 +1436,9 @@ class FsspecAdapter:
         encoding: str = "utf-8",
         errors: Optional[str] = None,
     ) -> IO:
-        dsap, relpath = self.resolve_dataset(filepath)
+        with traced("resolve_dataset", path=str(filepath)) as st:
+            dsap, relpath = self.resolve_dataset(filepath)
+            st["dataset"] = str(dsap.path)
         lgr.debug(
             "%s: path resolved to %s in dataset at %s", filepath, relpath, dsap.path
         )
@@ -548,6 +1450,15 @@ class FsspecAdapter:
         dsap, relpath = self.resolve_dataset(filepath)
         return cast(Tuple[FileState, Optional[AnnexKey]], dsap.get_file_state(relpath))
 
+    def resolve_ahead(self, filepath: str | Path) -> None:
+        """Start resolving a URL for ``filepath`` in the background in
+        anticipation of it being opened; see `DatasetAdapter.resolve_ahead()`"""
+        try:
+            dsap, relpath = self.resolve_dataset(filepath)
+            dsap.resolve_ahead(relpath)
+        except Exception as e:
+            lgr.debug("%s: not resolving URL ahead: %s", filepath, e)
+
     def is_under_annex(self, filepath: str | Path) -> bool:
         dsap, relpath = self.resolve_dataset(filepath)
         fstate, _ = dsap.get_file_state(relpath)
@@ -562,6 +1473,40 @@ def is_http_url(s: str) -> bool:
     return s.lower().startswith(("http://", "https://"))
 
 
+def local_path(url: str) -> Optional[Path]:
+    """Return the local filesystem path that a git remote URL refers to, or
+    `None` if it is not a local path or ``file://`` URL"""
+    if url.lower().startswith("file://"):
+        return Path(unquote(urlparse(url).path))
+    if "://" in url:
+        return None
+    # scp-like syntax (``[user@]host:path``) has a colon before any slash
+    if re.match(r"[^/]+:", url):
+        return None
+    return Path(os.path.expanduser(url))
+
+
+def split_layout(url: str) -> Optional[tuple[str, str]]:
+    """Split an annex object URL into the remote's base URL and the layout
+    variant (as used by `DatasetAdapter.get_urls`) that the URL follows"""
+    m = re.fullmatch(
+        r"(?P<root>.+?)/(?P<git>\.git/)?annex/objects/"
+        r"(?P<h1>[^/]+)/(?P<h2>[^/]+)/[^/]+/[^/]+",
+        url,
+    )
+    if m is None:
+        return None
+    if re.fullmatch(r"[0-9a-f]{3}", m["h1"]) and re.fullmatch(r"[0-9a-f]{3}", m["h2"]):
+        hashdir = "lower"
+    elif re.fullmatch(r"[0-9A-Za-z]{2}", m["h1"]) and re.fullmatch(
+        r"[0-9A-Za-z]{2}", m["h2"]
+    ):
+        hashdir = "mixed"
+    else:
+        return None
+    return (m["root"], (m["git"] or "") + hashdir)
+
+
 _aneksajo_cache: dict[str, bool] = {}
 
 
@@ -583,16 +1528,18 @@ def _is_aneksajo(base_url: str) -> bool:
     if cache_key in _aneksajo_cache:
         return _aneksajo_cache[cache_key]
 
-    try:
-        api_url = f"{cache_key}/api/forgejo/v1/version"
-        req = urllib.request.Request(api_url, method="GET")
-        req.add_header("Accept", "application/json")
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-            result = "git-annex" in data.get("version", "")
-    except Exception:
-        lgr.debug("_is_aneksajo(%s) probe failed", cache_key, exc_info=True)
-        result = False
+    with traced("aneksajo_probe", host=cache_key) as st:
+        try:
+            api_url = f"{cache_key}/api/forgejo/v1/version"
+            req = urllib.request.Request(api_url, method="GET")
+            req.add_header("Accept", "application/json")
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                data = json.loads(resp.read().decode())
+                result = "git-annex" in data.get("version", "")
+        except Exception:
+            lgr.debug("_is_aneksajo(%s) probe failed", cache_key, exc_info=True)
+            result = False
+        st["aneksajo"] = result
 
     _aneksajo_cache[cache_key] = result
     lgr.debug("_is_aneksajo(%s) = %s", cache_key, result)
@@ -602,19 +1549,72 @@ def _is_aneksajo(base_url: str) -> bool:
 async def on_request_start(
     _session: aiohttp.ClientSession,
     trace_config_ctx: SimpleNamespace,
-    params: aiohttp.TraceRequestStartParams,
+    _params: aiohttp.TraceRequestStartParams,
 ) -> None:
-    if trace_config_ctx.trace_request_ctx["current_attempt"] > 1:
-        lgr.warning("Retrying request to %s", params.url)
+    trace_config_ctx.start = time.monotonic()
 
 
-async def get_client(**kwargs: Any) -> RetryClient:
+async def on_request_end(
+    _session: aiohttp.ClientSession,
+    trace_config_ctx: SimpleNamespace,
+    params: aiohttp.TraceRequestEndParams,
+) -> None:
+    host_health.record_response(
+        host_of(str(params.url)),
+        params.response.status,
+        time.monotonic() - trace_config_ctx.start,
+    )
+    trace_request(
+        params.method,
+        str(params.url),
+        trace_config_ctx.start,
+        trace_config_ctx.trace_request_ctx["current_attempt"],
+        status=params.response.status,
+    )
+
+
+async def on_request_exception(
+    _session: aiohttp.ClientSession,
+    trace_config_ctx: SimpleNamespace,
+    params: aiohttp.TraceRequestExceptionParams,
+) -> None:
+    # Cancellation (e.g., of a losing probe) is not the host's fault
+    if isinstance(params.exception, Exception):
+        host_health.record_failure(host_of(str(params.url)))
+    trace_request(
+        params.method,
+        str(params.url),
+        getattr(trace_config_ctx, "start", time.monotonic()),
+        trace_config_ctx.trace_request_ctx["current_attempt"],
+        error=params.exception,
+    )
+
+
+def apply_client_config(config: Any) -> None:
+    """Set the options of the process-wide HTTP client state -- how requests
+    are retried, when hosts are skipped, how many requests are sent to each
+    host, and the connection pool -- from ``config``"""
+    connection_pool.configure(config)
+    host_limiter.configure(config)
+    retry_policy.configure(config)
+    retry_budget.configure(config)
+    host_health.configure(config)
+
+
+async def get_client(**kwargs: Any) -> RetrySession | HTTP2Session:
+    if connection_pool.config.http2 and not kwargs.keys() - {"loop"}:
+        if (client := connection_pool.get_http2_client()) is not None:
+            return HTTP2Session(client)
     trace_config = aiohttp.TraceConfig()
     trace_config.on_request_start.append(on_request_start)
-    return RetryClient(
-        client_session=aiohttp.ClientSession(
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    # All sessions share the process-wide connection pool
+    kwargs.setdefault("connector", connection_pool.get_connector())
+    kwargs.setdefault("connector_owner", False)
+    return RetrySession(
+        aiohttp.ClientSession(
             trace_configs=[trace_config],
             **kwargs,
-        ),
-        retry_options=ListRetry(timeouts=[1, 2, 6, 15, 36]),
+        )
     )
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import io
+import json
+import os.path
+import sys
+from typing import Any, Dict, Iterator, Optional
+
+from datalad.distribution.dataset import (
+    Dataset,
+    EnsureDataset,
+    datasetmethod,
+    require_dataset,
+)
+from datalad.interface.base import Interface, build_doc, eval_results
+from datalad.interface.results import get_status_dict
+from datalad.support.constraints import EnsureInt, EnsureNone, EnsureStr
+from datalad.support.param import Parameter
+
+from .archives import MemberFile
+from .chunks import ChunkedFile
+from .fsspec import DatasetAdapter, FileState, FsspecAdapter
+from .trace import traced, tracing
+
+DEFAULT_BYTES = 1
+
+
+def describe_transfer(f: Any) -> dict[str, Any]:
+    """Describe where the data read from a file returned by
+    `FsspecAdapter.open()` comes from"""
+    while isinstance(f, (io.TextIOWrapper, io.BufferedReader)) and not isinstance(
+        getattr(f, "name", None), str
+    ):
+        f = f.buffer if isinstance(f, io.TextIOWrapper) else f.raw
+    if isinstance(f, MemberFile):
+        return {"kind": "archive", "size": f.size}
+    elif isinstance(f, ChunkedFile):
+        return {
+            "kind": "chunks",
+            "size": f.size,
+            "chunk_size": f.chunk_size,
+            "chunks": f.chunk_count,
+        }
+    elif isinstance(url := getattr(f, "url", None), str):
+        return {"kind": "url", "url": url, "size": getattr(f, "size", None)}
+    elif isinstance(name := getattr(f, "name", None), str):
+        return {"kind": "local", "path": name}
+    else:
+        return {"kind": type(f).__name__}
+
+
+def describe_candidates(dsap: DatasetAdapter, relpath: str) -> dict[str, Any]:
+    """Describe the sources from which the content of ``relpath`` would be
+    read, in the order in which they would be tried, using only local
+    information: the file's state, copies in local remotes, the URL
+    recorded as working in the URL cache, and the candidate URLs (those
+    recorded as dead last) along with whether their content is in the
+    on-disk cache"""
+    with traced("get_file_state", path=relpath):
+        fstate, key = dsap.get_file_state(relpath)
+    info: dict[str, Any] = {
+        "state": fstate.name,
+        "key": str(key) if key is not None else None,
+    }
+    if fstate is not FileState.NO_CONTENT:
+        return info
+    assert key is not None
+    skey = str(key)
+    with traced("local_remotes", key=skey):
+        info["local_paths"] = [str(p) for p in dsap.get_local_paths(relpath, key)]
+    info["cached_url"] = dsap.url_cache.get_working(skey)
+    urls = list(dict.fromkeys(dsap.get_urls(skey)))
+    if not urls:
+        with traced("exporttree"):
+            urls = list(dict.fromkeys(dsap.get_exporttree_urls(relpath, key)))
+    dead = [u for u in urls if dsap.url_cache.is_dead(skey, u)]
+    ordered = dsap.order_urls([u for u in urls if u not in dead])
+    info["candidates"] = [
+        {"url": u, "dead": u in dead, "cached": dsap.is_cached(u)}
+        for u in ordered + dead
+    ]
+    return info
+
+
+@build_doc
+class FsspecExplain(Interface):
+    """
+    Explain how an annexed file's content is located and opened
+
+    The file is resolved exactly as for reading it via ``fusefs`` or
+    ``fsspec-head``, and the first bytes are read.  Each resolution step
+    (e.g., git-annex queries, URL probes, S3 version listings) and each HTTP
+    request made is reported as JSON along with its timing and outcome, as
+    is the source from which the content is ultimately read.
+
+    With ``--offline``, no network requests are made and nothing is read:
+    instead, the candidate sources of the content are listed in the order in
+    which they would be tried, along with the state of the URL and content
+    caches for each candidate URL.
+    """
+
+    result_renderer = "tailored"
+
+    _params_ = {
+        "dataset": Parameter(
+            args=("-d", "--dataset"),
+            doc="""dataset to operate on.  If no dataset is given, an
+            attempt is made to identify the dataset based on the current
+            working directory.""",
+            constraints=EnsureDataset() | EnsureNone(),
+        ),
+        "bytes": Parameter(
+            args=("-c", "--bytes"),
+            doc="How many bytes to read after opening the file (default 1)",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
+        "mode_transparent": Parameter(
+            args=("--mode-transparent",),
+            action="store_true",
+            doc="Support reading from .git directory",
+        ),
+        "offline": Parameter(
+            args=("--offline",),
+            action="store_true",
+            doc="""Only list the candidate URLs in the order in which they
+            would be tried and their cache state, without making any network
+            requests""",
+        ),
+        "caching": Parameter(
+            args=("--caching",),
+            choices=["none", "ondisk"],
+            default="none",
+            doc="Whether to cache fsspec'ed files on disk on not at all",
+        ),
+        "path": Parameter(
+            args=("path",),
+            doc="Path to an annexed file to explain the opening of",
+            constraints=EnsureStr(),
+        ),
+    }
+
+    @staticmethod
+    @datasetmethod(name="fsspec_explain")
+    @eval_results
+    def __call__(
+        path: str,
+        dataset: Optional[Dataset] = None,
+        bytes: Optional[int] = None,
+        mode_transparent: bool = False,
+        offline: bool = False,
+        caching: str | None = None,
+    ) -> Iterator[Dict[str, Any]]:
+        ds = require_dataset(
+            dataset, purpose="explain file access", check_installed=True
+        )
+        if bytes is None:
+            bytes = DEFAULT_BYTES
+        if not os.path.isabs(path):
+            path = os.path.join(ds.path, path)
+        explanation: dict[str, Any] = {"path": path}
+        error: Optional[str] = None
+        with FsspecAdapter(
+            ds.path,
+            mode_transparent=mode_transparent,
+            caching=caching == "ondisk",
+            offline=offline,
+        ) as fsa, tracing() as tracer:
+            try:
+                if offline:
+                    dsap, relpath = fsa.resolve_dataset(path)
+                    explanation.update(describe_candidates(dsap, relpath))
+                else:
+                    with traced("open"):
+                        fp = fsa.open(path)
+                    with fp:
+                        explanation["transfer"] = describe_transfer(fp)
+                        with traced("read", bytes=bytes) as st:
+                            st["received"] = len(fp.read(bytes))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                explanation["error"] = error
+            explanation.update(tracer.as_dict())
+        yield get_status_dict(
+            action="fsspec-explain",
+            ds=ds,
+            path=path,
+            status="ok" if error is None else "error",
+            message=error,
+            explanation=explanation,
+        )
+
+    @staticmethod
+    def custom_result_renderer(res: dict[str, Any], **_: Any) -> None:
+        json.dump(res["explanation"], sys.stdout, indent=2)
+        sys.stdout.write("\n")
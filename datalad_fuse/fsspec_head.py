@@ -59,6 +59,12 @@ class FsspecHead(Interface):
             default="none",
             doc="Whether to cache fsspec'ed files on disk on not at all",
         ),
+        "offline": Parameter(
+            args=("--offline",),
+            action="store_true",
+            doc="""Only use content that is available locally or completely
+            in the on-disk cache""",
+        ),
         "path": Parameter(
             args=("path",),
             doc="Path to an annexed file to show the leading contents of",
@@ -76,6 +82,7 @@ class FsspecHead(Interface):
         bytes: Optional[int] = None,
         mode_transparent: bool = False,
         caching: str | None = None,
+        offline: bool = False,
     ) -> Iterator[Dict[str, Any]]:
         ds = require_dataset(dataset, purpose="fetch file data", check_installed=True)
         if lines is not None and bytes is not None:
@@ -83,7 +90,10 @@ class FsspecHead(Interface):
         elif lines is None and bytes is None:
             lines = DEFAULT_LINES
         with FsspecAdapter(
-            ds.path, mode_transparent=mode_transparent, caching=caching == "ondisk"
+            ds.path,
+            mode_transparent=mode_transparent,
+            caching=caching == "ondisk",
+            offline=offline,
         ) as fsa:
             if not os.path.isabs(path):
                 path = os.path.join(ds.path, path)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import random
+import sys
+from typing import Any, Dict, Iterator, Optional
+
+from datalad.distribution.dataset import (
+    Dataset,
+    EnsureDataset,
+    datasetmethod,
+    require_dataset,
+)
+from datalad.interface.base import Interface, build_doc, eval_results
+from datalad.interface.results import get_status_dict
+from datalad.support.constraints import EnsureInt, EnsureNone
+from datalad.support.param import Parameter
+
+from .fsspec import DatasetAdapter
+from .profile import DEFAULT_PROFILE_BYTES, DEFAULT_PROFILE_SAMPLES
+
+
+@build_doc
+class FsspecProfile(Interface):
+    """
+    Measure how fast the remotes of a dataset serve annexed files
+
+    A sample of the dataset's annexed files is taken, and the leading bytes of
+    each are read from every URL at which the file is available.  The median
+    time to first byte and throughput of each remote host are stored in the
+    dataset's cache, where ``fusefs`` and ``fsspec-head`` use them to try the
+    fastest hosts first.
+    """
+
+    result_renderer = "tailored"
+
+    _params_ = {
+        "dataset": Parameter(
+            args=("-d", "--dataset"),
+            doc="""dataset to operate on.  If no dataset is given, an
+            attempt is made to identify the dataset based on the current
+            working directory.""",
+            constraints=EnsureDataset() | EnsureNone(),
+        ),
+        "samples": Parameter(
+            args=("-n", "--samples"),
+            doc="How many annexed files to sample (default 5)",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
+        "bytes": Parameter(
+            args=("-c", "--bytes"),
+            doc="How many bytes to read from each URL (default 4 MiB)",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
+    }
+
+    @staticmethod
+    @datasetmethod(name="fsspec_profile")
+    @eval_results
+    def __call__(
+        dataset: Optional[Dataset] = None,
+        samples: Optional[int] = None,
+        bytes: Optional[int] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        ds = require_dataset(dataset, purpose="profile remotes", check_installed=True)
+        if samples is None:
+            samples = DEFAULT_PROFILE_SAMPLES
+        if bytes is None:
+            bytes = DEFAULT_PROFILE_BYTES
+        if samples < 1 or bytes < 1:
+            raise ValueError("'samples' and 'bytes' must be positive")
+        files = ds.repo.get_annexed_files()
+        if not files:
+            yield get_status_dict(
+                action="fsspec-profile",
+                ds=ds,
+                status="notneeded",
+                message="No annexed files to sample",
+            )
+            return
+        sample = random.sample(files, min(samples, len(files)))
+        dsap = DatasetAdapter(ds.path, caching=False)
+        try:
+            profiles, errors = dsap.profile_remotes(sample, bytes)
+        finally:
+            dsap.close()
+        for rank, p in enumerate(profiles, start=1):
+            yield get_status_dict(
+                action="fsspec-profile",
+                ds=ds,
+                status="ok",
+                rank=rank,
+                host=p.host,
+                ttfb=p.ttfb,
+                throughput=p.throughput,
+                samples=p.samples,
+            )
+        for host, err in errors.items():
+            yield get_status_dict(
+                action="fsspec-profile",
+                ds=ds,
+                status="error",
+                host=host,
+                message=err,
+            )
+
+    @staticmethod
+    def custom_result_renderer(res: dict[str, Any], **_: Any) -> None:
+        if res["status"] == "ok":
+            if res["throughput"] is not None:
+                throughput = f"{res['throughput'] / 1e6:.2f} MB/s"
+            else:
+                throughput = "-"
+            sys.stdout.write(
+                f"{res['rank']:3d}. {res['host']}  TTFB {res['ttfb'] * 1000:.1f} ms"
+                f"  throughput {throughput}  ({res['samples']} samples)\n"
+            )
+        elif res["status"] == "error":
+            sys.stdout.write(f"  -  {res['host']}  failed: {res['message']}\n")
+        else:
+            sys.stdout.write(f"{res['message']}\n")
@@ -22,7 +22,8 @@ from fuse import FuseOSError, Operations
 import methodtools
 
 from .consts import CACHE_SIZE
-from .fsspec import FsspecAdapter
+from .fsspec import RESOLVE_AHEAD_LIMIT, FsspecAdapter
+from .httpfile import AnnexHTTPFile, hedge_stats, offline_stats
 
 # Make it relatively small since we are aiming for metadata records ATM
 # Seems of no real good positive net ATM
@@ -70,18 +71,25 @@ class DataLadFUSE(Operations):  # LoggingMixIn,
     _counter_offset = 1000
 
     def __init__(
-        self, root: str, caching: bool, mode_transparent: bool = False
+        self,
+        root: str,
+        caching: bool,
+        mode_transparent: bool = False,
+        offline: bool = False,
     ) -> None:
         self.root = op.realpath(root)
         self.mode_transparent = mode_transparent
         self.rwlock = Lock()
         self._adapter = FsspecAdapter(
-            root, mode_transparent=mode_transparent, caching=caching
+            root, mode_transparent=mode_transparent, caching=caching, offline=offline
         )
         self._fhdict: dict[int, Optional[IO[bytes]]] = {}
         # fh to fsspec_file, already opened (we are RO for now, so can just open
         # and there is no seek so we should be ok even if the same file open
         # multiple times?
+        # fh -> number of reads from it in progress
+        self._reading: dict[int, int] = {}
+        self._reading_lock = Lock()
         self._counter = DataLadFUSE._counter_offset
 
     def __call__(self, op: str, path: str, *args: Any) -> Any:
@@ -95,6 +103,18 @@ class DataLadFUSE(Operations):  # LoggingMixIn,
 
     def destroy(self, _path: Optional[str] = None) -> int:
         lgr.warning("Destroying fsspecs and collection of %d fhs", len(self._fhdict))
+        if hedge_stats.issued:
+            lgr.info(
+                "Hedged range requests: %d issued, %d won",
+                hedge_stats.issued,
+                hedge_stats.won,
+            )
+        if offline_stats.misses:
+            lgr.warning(
+                "Offline mode: %d opens failed for content that is neither"
+                " available locally nor cached",
+                offline_stats.misses,
+            )
         for f in self._fhdict.values():
             if f is not None:
                 try:
@@ -182,6 +202,8 @@ class DataLadFUSE(Operations):  # LoggingMixIn,
                         size=key.size,
                         timestamp=self._adapter.get_commit_datetime(path),
                     )
+                    # The file is likely to be opened next
+                    self._adapter.resolve_ahead(path)
                 else:
                     lgr.debug("File not already open")
                     with self.rwlock:
@@ -252,9 +274,32 @@ class DataLadFUSE(Operations):  # LoggingMixIn,
             # TODO: check for path to correspond?
             f = self._fhdict[fh]
             assert f is not None
-            with self.rwlock:
-                f.seek(offset)
-                return f.read(size)
+            with self._reading_lock:
+                concurrent = self._reading.get(fh, 0) > 0
+                self._reading[fh] = self._reading.get(fh, 0) + 1
+            try:
+                data: Optional[bytes] = None
+                if isinstance(f, AnnexHTTPFile):
+                    if f.readahead is not None and f.readahead.engaged:
+                        # The file is being scanned (as detected by
+                        # `AnnexHTTPFile.read()`); answer from the data
+                        # fetched ahead without holding the lock
+                        data = f.readahead.read(offset, size)
+                    if data is None and concurrent and f.coalescer is not None:
+                        # Another read of the file is in progress; read
+                        # without waiting for it, so that reads of the file
+                        # made concurrently can be fetched together
+                        data = f.pread(offset, size)
+                if data is None:
+                    with self.rwlock:
+                        f.seek(offset)
+                        data = f.read(size)
+                return data
+            finally:
+                with self._reading_lock:
+                    self._reading[fh] -= 1
+                    if not self._reading[fh]:
+                        del self._reading[fh]
 
     def opendir(self, path: str) -> int:
         lgr.debug("opendir(path=%r)", path)
@@ -270,6 +315,15 @@ class DataLadFUSE(Operations):  # LoggingMixIn,
     def readdir(self, path: str, _fh: int) -> list[str]:
         lgr.debug("readdir(path=%r, fh=%r)", path, _fh)
         paths = [".", ".."] + os.listdir(path)
+        # Start resolving URLs for the first few annexed files without content
+        ahead = 0
+        for name in paths[2:]:
+            if ahead >= RESOLVE_AHEAD_LIMIT:
+                break
+            p = op.join(path, name)
+            if op.islink(p) and not op.exists(p):
+                self._adapter.resolve_ahead(p)
+                ahead += 1
         if not self.mode_transparent:
             try:
                 paths.remove(".git")
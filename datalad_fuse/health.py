@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+from dataclasses import dataclass
+import logging
+from threading import Lock
+import time
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+from datalad import cfg
+
+lgr = logging.getLogger("datalad.fuse.health")
+
+#: Default number of consecutive failed requests after which a host is skipped
+DEFAULT_FAILURE_THRESHOLD = 3
+
+#: Default number of seconds for which a failing host is skipped
+DEFAULT_COOLDOWN = 30.0
+
+#: Weight of the most recent observation in the moving average of latencies
+LATENCY_ALPHA = 0.3
+
+#: Seconds added to a host's score per unit of its error rate
+ERROR_PENALTY = 10.0
+
+#: Statuses with which servers signal that they are overloaded.  Responses
+#: with these are left to the retry policy and the concurrency limiter and
+#: do not count as failures of the host.
+THROTTLE_STATUSES = frozenset({429, 503})
+
+
+def host_of(url: str) -> str:
+    """Return the ``scheme://host[:port]`` part of ``url``, without userinfo"""
+    parsed = urlparse(url)
+    port_suffix = f":{parsed.port}" if parsed.port else ""  # noqa: E231
+    return f"{parsed.scheme}://{parsed.hostname or ''}{port_suffix}"  # noqa: E231
+
+
+@dataclass
+class HostStats:
+    #: Exponentially-weighted moving average of request latency in seconds
+    latency: Optional[float] = None
+    requests: int = 0
+    errors: int = 0
+    consecutive_failures: int = 0
+    #: Time (per `time.monotonic()`) until which the host is skipped
+    open_until: float = 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+
+class HostHealth:
+    """Process-wide latency and error statistics for remote hosts.
+
+    Each request made through the HTTP client (see `get_client()`) is
+    recorded here.  Candidate URLs are ordered by the health of their hosts,
+    and a host that fails ``failure_threshold`` requests in a row has its
+    circuit breaker opened: its URLs are skipped in favor of those on other
+    hosts, and requests to it are not retried, for ``cooldown`` seconds.  A
+    host with no alternative is still sent requests, as trials of whether it
+    has recovered; after the cooldown, a single further failure opens the
+    breaker again right away, while a success closes it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._stats: dict[str, HostStats] = {}
+        self._lock = Lock()
+
+    def get(self, host: str) -> HostStats:
+        with self._lock:
+            return self._stats.setdefault(host, HostStats())
+
+    def record_success(self, host: str, latency: float) -> None:
+        with self._lock:
+            st = self._stats.setdefault(host, HostStats())
+            st.requests += 1
+            st.consecutive_failures = 0
+            st.open_until = 0.0
+            if st.latency is None:
+                st.latency = latency
+            else:
+                st.latency += LATENCY_ALPHA * (latency - st.latency)
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            st = self._stats.setdefault(host, HostStats())
+            st.requests += 1
+            st.errors += 1
+            st.consecutive_failures += 1
+            if st.consecutive_failures >= self.failure_threshold:
+                if st.open_until <= time.monotonic():
+                    lgr.warning(
+                        "%s failed %d requests in a row; skipping it for %g seconds",
+                        host,
+                        st.consecutive_failures,
+                        self.cooldown,
+                    )
+                st.open_until = time.monotonic() + self.cooldown
+
+    def configure(self, config: Any) -> None:
+        """Set ``failure_threshold`` and ``cooldown`` from the
+        ``datalad.fusefs.breaker-*`` options in ``config``"""
+        with self._lock:
+            self.failure_threshold = int(
+                config.get(
+                    "datalad.fusefs.breaker-threshold", DEFAULT_FAILURE_THRESHOLD
+                )
+            )
+            self.cooldown = float(
+                config.get("datalad.fusefs.breaker-cooldown", DEFAULT_COOLDOWN)
+            )
+
+    def record_response(self, host: str, status: int, latency: float) -> None:
+        """Record a response from ``host``: server errors count as failures,
+        throttling responses (see `THROTTLE_STATUSES`) as neither failures
+        nor successes, and anything else as a success"""
+        if status in THROTTLE_STATUSES:
+            with self._lock:
+                self._stats.setdefault(host, HostStats()).requests += 1
+        elif status >= 500:
+            self.record_failure(host)
+        else:
+            self.record_success(host, latency)
+
+    def is_available(self, host: str) -> bool:
+        """False iff the host's circuit breaker is currently open"""
+        with self._lock:
+            st = self._stats.get(host)
+            return st is None or st.open_until <= time.monotonic()
+
+    def score(self, host: str) -> Optional[float]:
+        """Return an estimate of how costly requests to ``host`` are (lower is
+        better), or `None` if nothing is known about it yet"""
+        with self._lock:
+            st = self._stats.get(host)
+            if st is None or st.latency is None:
+                return None
+            return st.latency + ERROR_PENALTY * st.error_rate
+
+    def order(self, urls: Sequence[str]) -> list[str]:
+        """Order ``urls`` by the health of their hosts, dropping those whose
+        hosts are currently skipped.
+
+        Hosts without statistics are assumed to be of average health.  The
+        sort is stable, so URLs of equally healthy hosts keep their relative
+        order.  If all hosts are being skipped, all URLs are returned.
+        """
+        available = [u for u in urls if self.is_available(host_of(u))]
+        if not available:
+            lgr.debug("All hosts are being skipped; trying them anyway")
+            available = list(urls)
+        elif len(available) < len(urls):
+            lgr.debug(
+                "Skipping URLs on failing hosts: %s",
+                ", ".join(u for u in urls if u not in available),
+            )
+        scores = {u: self.score(host_of(u)) for u in available}
+        known = [s for s in scores.values() if s is not None]
+        default = sum(known) / len(known) if known else 0.0
+        return sorted(
+            available, key=lambda u: default if (s := scores[u]) is None else s
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+host_health = HostHealth()
+host_health.configure(cfg)
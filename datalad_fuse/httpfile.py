@@ -0,0 +1,843 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from errno import ENOENT
+from functools import partial
+import logging
+from pathlib import Path
+from threading import Lock
+import time
+from typing import Any, List, Optional
+
+import aiohttp
+from fsspec.asyn import sync, sync_wrapper
+from fsspec.caching import BytesCache, MMapCache, ReadAheadCache
+from fsspec.implementations.http import HTTPFile, HTTPFileSystem, HTTPStreamFile
+import yarl
+
+from .coalesce import (
+    MAX_RANGES_PER_REQUEST,
+    MultipartError,
+    RangeCoalescer,
+    RangeGroup,
+    extract_range,
+    get_boundary,
+    merge_ranges,
+    multirange_header,
+    multirange_support,
+    parse_byteranges,
+    split_groups,
+)
+from .health import host_health, host_of
+from .readahead import DEFAULT_SEGMENT_SIZE, SegmentedReader, StreamingReader
+from .spool import SPOOL_CHUNK_SIZE, Spooler, range_support
+
+lgr = logging.getLogger("datalad.fuse.httpfile")
+
+#: Default percentile of recent range-request latencies after which a hedged
+#: request is sent
+DEFAULT_HEDGE_PERCENTILE = 95.0
+
+#: Hedging deadline (in seconds) used until enough latencies have been seen
+DEFAULT_HEDGE_DEADLINE = 1.0
+
+#: Lower bound on the hedging deadline (in seconds)
+MIN_HEDGE_DEADLINE = 0.05
+
+#: Number of recent latencies per host from which the deadline is computed
+LATENCY_WINDOW = 200
+
+#: Number of latencies that must be seen before the deadline adapts
+MIN_LATENCY_SAMPLES = 10
+
+#: Default number of seconds for which a redirect target without a known
+#: expiry is reused
+DEFAULT_REDIRECT_TTL = 300.0
+
+#: Number of seconds before its expiry at which a presigned redirect target is
+#: no longer used
+REFRESH_MARGIN = 60.0
+
+AlternatesProvider = Callable[[], List[str]]
+
+#: Errors on fetching a range from one URL upon which alternate URLs are tried
+FAILOVER_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+
+class LatencyTracker:
+    """Sliding window of recent range-request latencies per host"""
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        self.window = window
+        self._latencies: dict[str, deque[float]] = {}
+        self._lock = Lock()
+
+    def record(self, host: str, latency: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(host, deque(maxlen=self.window)).append(latency)
+
+    def percentile(self, host: str, pct: float) -> Optional[float]:
+        """Return the ``pct``-th percentile of recent latencies for ``host``, or
+        `None` if too few have been recorded yet"""
+        with self._lock:
+            values = sorted(self._latencies.get(host, ()))
+        if len(values) < MIN_LATENCY_SAMPLES:
+            return None
+        return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+@dataclass
+class HedgeStats:
+    #: Number of duplicate range requests sent to an alternate URL
+    issued: int = 0
+    #: Number of those that answered before the original request
+    won: int = 0
+
+
+@dataclass
+class OfflineStats:
+    #: Number of opens that could not be served in offline mode
+    misses: int = 0
+
+
+class OfflineError(OSError):
+    """Raised in offline mode when content is neither available locally nor
+    completely cached"""
+
+
+class SizeMismatchError(OSError):
+    """Raised when a server reports a different size for a file than the
+    size known from its annex key"""
+
+
+class RedirectCache:
+    """Cache of the targets that URLs redirect to.
+
+    Presigned URLs (e.g., to S3) are only valid until some point in time,
+    which is parsed from the URL's query parameters; a target is no longer
+    used ``REFRESH_MARGIN`` seconds before then, so that the original URL is
+    requested (and the redirect re-resolved) before the target expires.
+    Targets without a recognizable expiry are kept for ``ttl`` seconds.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_REDIRECT_TTL) -> None:
+        self.ttl = ttl
+        self._targets: dict[str, tuple[yarl.URL, float]] = {}
+        self._lock = Lock()
+
+    def get(self, url: str) -> Optional[yarl.URL]:
+        with self._lock:
+            try:
+                target, expiry = self._targets[url]
+            except KeyError:
+                return None
+            if time.time() >= expiry - REFRESH_MARGIN:
+                lgr.debug("%s: redirect target is about to expire; refreshing", url)
+                del self._targets[url]
+                return None
+            return target
+
+    def store(self, url: str, target: yarl.URL) -> None:
+        expiry = presigned_expiry(target)
+        if expiry is None:
+            expiry = time.time() + self.ttl
+        lgr.debug("%s: caching redirect to %s until %s", url, target, expiry)
+        with self._lock:
+            self._targets[url] = (target, expiry)
+
+    def forget(self, url: str) -> None:
+        with self._lock:
+            self._targets.pop(url, None)
+
+
+def presigned_expiry(url: yarl.URL) -> Optional[float]:
+    """Return the time (as a Unix timestamp) at which a presigned URL expires,
+    or `None` if this cannot be determined from its query parameters"""
+    q = url.query
+    for prefix in ("X-Amz", "X-Goog"):
+        if f"{prefix}-Date" in q and f"{prefix}-Expires" in q:
+            try:
+                signed = datetime.strptime(q[f"{prefix}-Date"], "%Y%m%dT%H%M%SZ")
+                return signed.replace(tzinfo=timezone.utc).timestamp() + int(
+                    q[f"{prefix}-Expires"]
+                )
+            except ValueError:
+                return None
+    if "Expires" in q:
+        # AWS signature version 2 & CloudFront
+        try:
+            return float(q["Expires"])
+        except ValueError:
+            return None
+    return None
+
+
+range_latency = LatencyTracker()
+
+redirect_cache = RedirectCache()
+
+hedge_stats = HedgeStats()
+
+offline_stats = OfflineStats()
+
+
+class AnnexHTTPFileSystem(HTTPFileSystem):
+    """`HTTPFileSystem` producing `AnnexHTTPFile` instances.
+
+    In addition to the usual arguments, ``open()`` accepts:
+
+    ``alternates``
+        a callable returning other URLs (in order of preference) serving the
+        same content, called only once they are actually needed
+
+    ``hedge``
+        whether to send a duplicate request to the first alternate URL when a
+        range request takes longer than the ``hedge_percentile``-th percentile
+        of recent latencies for the host
+
+    ``coalesce_gap``
+        if not `None`, reads made with ``pread()`` that are pending at the same
+        time are fetched together, with ranges at most this many bytes apart
+        merged into one
+
+    ``readahead_segments``, ``segment_size``
+        if ``readahead_segments`` is positive and the file spans at least two
+        segments of ``segment_size`` bytes, sequential scans of the file
+        (as detected by ``readahead.read()``) fetch that many segments ahead
+        concurrently; see `SegmentedReader`
+
+    ``stream``
+        if true, sequential scans of the file are instead read from a single
+        open-ended GET request; see `StreamingReader`
+
+    ``spooler``, ``spool_name``
+        if ``spooler`` is given, a file from a server that does not support
+        range requests is downloaded completely to ``spooler`` under the name
+        ``spool_name`` (default: the URL), and all reads are served from the
+        download
+
+    ``key_size``
+        the size of the file as known from its annex key; unless ``size`` is
+        given as well, the file is opened with this size without requesting
+        it from the server.  A server that reports a different size for the
+        file raises a `SizeMismatchError`.  (This is separate from ``size``,
+        which `CachingFileSystem` sets to the size it has recorded for a
+        cached file.)
+
+    ``on_url_failure``
+        a callable that is passed the file's URL whenever fetching from it
+        fails (before any alternate URLs are tried), so that a URL that was
+        not checked on opening can be forgotten
+
+    ``on_url_switch``
+        a callable that is passed the alternate URL that a file switches to
+        after fetching from its URL failed
+    """
+
+    def _open(
+        self,
+        path: str,
+        mode: str = "rb",
+        block_size: Optional[int] = None,
+        autocommit: Optional[bool] = None,  # noqa: U100
+        cache_type: Optional[str] = None,
+        cache_options: Optional[dict] = None,
+        size: Optional[int] = None,
+        alternates: Optional[AlternatesProvider] = None,
+        hedge: bool = False,
+        hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE,
+        coalesce_gap: Optional[int] = None,
+        readahead_segments: int = 0,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        stream: bool = False,
+        spooler: Optional[Spooler] = None,
+        spool_name: Optional[str] = None,
+        key_size: Optional[int] = None,
+        on_url_failure: Optional[Callable[[str], None]] = None,
+        on_url_switch: Optional[Callable[[str], None]] = None,
+        **kwargs: Any,
+    ) -> HTTPFile | HTTPStreamFile:
+        if mode != "rb":
+            raise NotImplementedError
+        block_size = block_size if block_size is not None else self.block_size
+        kw = self.kwargs.copy()
+        kw["asynchronous"] = self.asynchronous
+        kw.update(kwargs)
+        if size is None:
+            size = key_size
+        elif key_size is not None and size != key_size:
+            raise SizeMismatchError(
+                f"{path}: cached size {size} does not match expected size {key_size}"
+            )
+        info: dict[str, Any] = {}
+        if not size:
+            info.update(self.info(path, **kwargs))
+            size = info["size"]
+            if key_size is not None and size != key_size:
+                raise SizeMismatchError(
+                    f"{path}: server reports size {size}, expected {key_size}"
+                )
+        session = sync(self.loop, self.set_session)
+        if not info.get("partial", True):
+            # The server sent "Accept-Ranges: none"
+            range_support.record_ignored(host_of(path))
+        if block_size and size and (info.get("partial", True) or spooler is not None):
+            return AnnexHTTPFile(
+                self,
+                path,
+                session=session,
+                block_size=block_size,
+                mode=mode,
+                size=size,
+                cache_type=cache_type or self.cache_type,
+                cache_options=cache_options or self.cache_options,
+                loop=self.loop,
+                alternates=alternates,
+                hedge=hedge,
+                hedge_percentile=hedge_percentile,
+                coalesce_gap=coalesce_gap,
+                readahead_segments=readahead_segments,
+                segment_size=segment_size,
+                stream=stream,
+                spooler=spooler,
+                spool_name=spool_name,
+                on_url_failure=on_url_failure,
+                on_url_switch=on_url_switch,
+                **kw,
+            )
+        else:
+            return HTTPStreamFile(
+                self,
+                path,
+                mode=mode,
+                loop=self.loop,
+                session=session,
+                **kw,
+            )
+
+
+class AnnexHTTPFile(HTTPFile):
+    """`HTTPFile` that knows of alternate URLs for its content.
+
+    If fetching a block from the file's URL fails, the alternate URLs are
+    tried in turn, and the first one to succeed becomes the file's URL for
+    all further reads.
+
+    Besides reading at the file position through the block cache, the file
+    can be read from several threads at once with ``pread()``; see
+    `async_fetch_ranges()`.
+
+    If the file has a ``spooler`` and its server is found to ignore range
+    requests, the file is downloaded completely once, and blocks are read
+    from the download.
+    """
+
+    url: str
+
+    def __init__(
+        self,
+        fs: AnnexHTTPFileSystem,
+        url: str,
+        alternates: Optional[AlternatesProvider] = None,
+        hedge: bool = False,
+        hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE,
+        coalesce_gap: Optional[int] = None,
+        readahead_segments: int = 0,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        stream: bool = False,
+        spooler: Optional[Spooler] = None,
+        spool_name: Optional[str] = None,
+        on_url_failure: Optional[Callable[[str], None]] = None,
+        on_url_switch: Optional[Callable[[str], None]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._alternates_provider = alternates
+        self.on_url_failure = on_url_failure
+        self.on_url_switch = on_url_switch
+        self._alternates: Optional[list[str]] = None
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.coalesce_gap = coalesce_gap
+        self.spooler = spooler
+        self.spool_name = spool_name or url
+        self._spooled: Optional[Path] = None
+        #: Whether failed requests are retried with the alternate URLs
+        self._failover = True
+        #: Held while reading through the block cache
+        self._cache_lock = Lock()
+        super().__init__(fs, url, **kwargs)
+        self.coalescer: Optional[RangeCoalescer] = None
+        if coalesce_gap is not None:
+            self.coalescer = RangeCoalescer(self.async_fetch_ranges, self.loop)
+        self.readahead: Optional[SegmentedReader | StreamingReader] = None
+        if stream:
+            self.readahead = StreamingReader(self.open_stream, self.size, self.loop)
+        elif readahead_segments > 0 and self.size >= 2 * segment_size:
+            self.readahead = SegmentedReader(
+                self.async_fetch_range,
+                self.size,
+                self.loop,
+                segment_size=segment_size,
+                segments=readahead_segments,
+            )
+
+    def read(self, length: int = -1) -> bytes:
+        if self.readahead is not None and length >= 0 and not self.closed:
+            data = self.readahead.read(self.loc, length)
+            if data is not None:
+                self.loc += len(data)
+                return data
+        with self._cache_lock:
+            out: bytes = super().read(length)
+        return out
+
+    def close(self) -> None:
+        if self.readahead is not None:
+            self.readahead.close()
+        super().close()
+
+    def probe(self) -> None:
+        """Read the first block of the file through the block cache from the
+        file's own URL, without failing over to the alternate URLs.
+
+        This is for files opened with a size known beforehand, for which no
+        request is made on opening: it checks that the URL actually serves
+        the file, while fetching data that is usually read first anyway.  As
+        when a file's size is requested on opening, any failure (an error
+        status, a connection failure, or a size differing from the expected
+        one) is raised as `FileNotFoundError`, so that other sources are
+        tried.
+        """
+        self._failover = False
+        try:
+            self.cache._fetch(0, 1)
+        except FAILOVER_ERRORS as e:
+            if isinstance(e, SizeMismatchError):
+                # The server answered as expected as far as the request hooks
+                # can tell, so this has not been counted against the host yet
+                host_health.record_failure(host_of(self.url))
+            raise FileNotFoundError(ENOENT, f"{self.url}: {e}") from e
+        finally:
+            self._failover = True
+
+    def pread(self, offset: int, size: int) -> bytes:
+        """Read up to ``size`` bytes at ``offset``, bypassing the file
+        position.  Unlike ``seek()`` & ``read()``, this may be called from
+        several threads at once.  Data already in the block cache is returned
+        from there if the cache is not being read from at the moment;
+        otherwise, the data is fetched without adding it to the cache, and if
+        the file was opened with a ``coalesce_gap``, reads pending at the same
+        time are fetched together."""
+        end = min(offset + size, self.size)
+        if offset >= end:
+            return b""
+        if self._cache_lock.acquire(blocking=False):
+            try:
+                cached = self._read_cached(offset, end)
+            finally:
+                self._cache_lock.release()
+            if cached is not None:
+                return cached
+        if self.coalescer is None:
+            data: bytes = self._fetch_range(offset, end)
+            return data
+        return self.coalescer.read(offset, end)
+
+    def _read_cached(self, start: int, end: int) -> Optional[bytes]:
+        """Return bytes ``start`` through ``end - 1`` if they are all in the
+        block cache, or `None` otherwise"""
+        cache = self.cache
+        if isinstance(cache, (BytesCache, ReadAheadCache)):
+            if cache.start is not None and cache.start <= start and end <= cache.end:
+                data: bytes = cache.cache[start - cache.start : end - cache.start]
+                return data
+        elif isinstance(cache, MMapCache):
+            blocks = range(start // cache.blocksize, (end - 1) // cache.blocksize + 1)
+            if cache.cache is not None and cache.blocks.issuperset(blocks):
+                return bytes(cache.cache[start:end])
+        return None
+
+    async def open_stream(self, offset: int) -> Optional[Any]:
+        """Request the file's content from ``offset`` to the end and return
+        the response, with its body unread, or `None` if the server does not
+        answer with that"""
+        if self.spooling:
+            return None
+        lgr.debug("%s: streaming from offset %d", self.url, offset)
+        kwargs = self.kwargs.copy()
+        headers = kwargs.pop("headers", {}).copy()
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        target = redirect_cache.get(self.url) or self.fs.encode_url(self.url)
+        r = await self.session.get(target, headers=headers, **kwargs)
+        if (r.status == 200 and offset == 0) or (
+            r.status == 206 and self._parse_content_range(r.headers)[0] == offset
+        ):
+            if r.history:
+                redirect_cache.store(self.url, r.url)
+            return r
+        lgr.debug(
+            "%s: cannot stream from offset %d: status %d", self.url, offset, r.status
+        )
+        r.close()
+        return None
+
+    async def async_fetch_ranges(self, ranges: list[tuple[int, int]]) -> list[bytes]:
+        """Fetch several ranges ``(start, end)`` of the file with as few
+        requests as possible.
+
+        Ranges at most ``coalesce_gap`` bytes apart are merged into one, with
+        the data in the gaps downloaded and discarded.  If more than one
+        merged range remains, they are requested together in a multi-range
+        request unless the host is known not to support those; otherwise (or
+        if that fails), the merged ranges are fetched concurrently with
+        `async_fetch_range()`, which fails over to alternate URLs.
+        """
+        groups = merge_ranges(ranges, self.coalesce_gap or 0)
+        datas: Optional[list[bytes]] = None
+        if (
+            len(groups) > 1
+            and not self.spooling
+            and multirange_support.get(host_of(self.url)) is not False
+        ):
+            datas = await self._fetch_multirange(groups)
+        if datas is None:
+            datas = await asyncio.gather(
+                *(self.async_fetch_range(g.start, g.end) for g in groups)
+            )
+        return split_groups(ranges, groups, datas)
+
+    async def _fetch_multirange(
+        self, groups: list[RangeGroup]
+    ) -> Optional[list[bytes]]:
+        """Fetch ``groups`` from the file's URL with multi-range requests,
+        returning `None` if the server does not answer them as such"""
+        batches = [
+            groups[i : i + MAX_RANGES_PER_REQUEST]
+            for i in range(0, len(groups), MAX_RANGES_PER_REQUEST)
+        ]
+        results = await asyncio.gather(*map(self._fetch_multirange_batch, batches))
+        datas: list[bytes] = []
+        for r in results:
+            if r is None:
+                return None
+            datas.extend(r)
+        return datas
+
+    async def _fetch_multirange_batch(
+        self, groups: list[RangeGroup]
+    ) -> Optional[list[bytes]]:
+        url = self.url
+        host = host_of(url)
+        lgr.debug("%s: fetching %d ranges in one request", url, len(groups))
+        kwargs = self.kwargs.copy()
+        headers = kwargs.pop("headers", {}).copy()
+        headers["Range"] = multirange_header(groups)
+        target = redirect_cache.get(url) or self.fs.encode_url(url)
+        try:
+            r = await self.session.get(target, headers=headers, **kwargs)
+        except FAILOVER_ERRORS as e:
+            lgr.debug("%s: multi-range request failed: %s", url, e)
+            return None
+        async with r:
+            if r.status != 206:
+                # Either an error (left to the per-range requests to deal
+                # with) or the complete file, which is not downloaded
+                if r.status == 200:
+                    multirange_support.set(host, False)
+                return None
+            if r.history:
+                redirect_cache.store(url, r.url)
+            try:
+                body = await r.read()
+            except FAILOVER_ERRORS as e:
+                lgr.debug("%s: multi-range request failed: %s", url, e)
+                return None
+            try:
+                boundary = get_boundary(r.headers.get("Content-Type", ""))
+                if boundary is None:
+                    # The server merged all ranges into one
+                    start = self._parse_content_range(r.headers)[0]
+                    if start is None:
+                        raise MultipartError("206 response without Content-Range")
+                    parts = {start: body}
+                else:
+                    parts = parse_byteranges(body, boundary)
+                datas = [extract_range(parts, g.start, g.end) for g in groups]
+            except MultipartError as e:
+                lgr.debug("%s: unusable multi-range response: %s", url, e)
+                multirange_support.set(host, False)
+                return None
+        multirange_support.set(host, True)
+        return datas
+
+    async def get_alternates(self) -> list[str]:
+        if self._alternates is None:
+            if self._alternates_provider is None:
+                self._alternates = []
+            else:
+                # The provider may consult git-annex, so keep it off the loop
+                alts = await asyncio.get_running_loop().run_in_executor(
+                    None, self._alternates_provider
+                )
+                self._alternates = [u for u in alts if u != self.url]
+        return self._alternates
+
+    @property
+    def spooling(self) -> bool:
+        """Whether reads are served from a complete download of the file"""
+        return self.spooler is not None and (
+            self._spooled is not None or range_support.ignores_ranges(host_of(self.url))
+        )
+
+    async def async_fetch_range(self, start: int, end: int) -> bytes:
+        # Reads at or past the end of the file are answered without a request
+        end = min(end, self.size)
+        if start >= end:
+            return b""
+        if self.spooling:
+            return await self._read_spooled(start, end)
+        return await self._fetch_range_with_failover(start, end)
+
+    def spool(self) -> Path:
+        """Download the complete file (unless already done) and return the
+        path to the copy, from which all further reads are served"""
+        if self.spooler is None:
+            raise ValueError("File has no spooler")
+        path: Path = sync(self.loop, self._spool)
+        return path
+
+    async def _spool(self) -> Path:
+        if self._spooled is None:
+            assert self.spooler is not None
+            self._spooled = await self.spooler.spool(
+                self.spool_name, self.size, self._download
+            )
+        return self._spooled
+
+    async def _read_spooled(self, start: int, end: int) -> bytes:
+        def pread(path: Path) -> bytes:
+            with path.open("rb") as fp:
+                fp.seek(start)
+                return fp.read(end - start)
+
+        spooled = await self._spool()
+        loop = asyncio.get_running_loop()
+        try:
+            data: bytes = await loop.run_in_executor(None, pread, spooled)
+        except FileNotFoundError:
+            # The copy has been evicted from the spool since; download again
+            lgr.debug("%s: spooled copy is gone; spooling again", self.url)
+            self._spooled = None
+            spooled = await self._spool()
+            data = await loop.run_in_executor(None, pread, spooled)
+        return data
+
+    async def _download(self, path: Path) -> None:
+        """Download the complete file to ``path``, failing over to alternate
+        URLs"""
+        urls = [self.url]
+        if self._failover:
+            urls += host_health.order(await self.get_alternates())
+        for i, url in enumerate(urls):
+            lgr.info("%s: downloading complete file", url)
+            target = redirect_cache.get(url) or self.fs.encode_url(url)
+            try:
+                async with self.session.get(target, **self.kwargs) as r:
+                    r.raise_for_status()
+                    await write_body(r, path)
+            except FAILOVER_ERRORS as e:
+                if i == len(urls) - 1:
+                    raise
+                lgr.warning("%s: download failed: %s; trying next URL", url, e)
+            else:
+                return
+
+    async def _fetch_range_with_failover(self, start: int, end: int) -> bytes:
+        if self._failover and not host_health.is_available(host_of(self.url)):
+            # Skip the file's URL while its host is failing, unless no
+            # alternate is on a healthy host
+            for alt in host_health.order(await self.get_alternates()):
+                if host_health.is_available(host_of(alt)):
+                    self._switch_url(alt)
+                    break
+        try:
+            if (
+                self.hedge
+                and self._failover
+                and (alternates := await self.get_alternates())
+            ):
+                return await self._hedged_fetch_range(alternates[0], start, end)
+            return await self.fetch_range_from(self.url, start, end)
+        except FAILOVER_ERRORS as e:
+            await self._notify(self.on_url_failure, self.url)
+            if not self._failover or not (alternates := await self.get_alternates()):
+                raise
+            lgr.warning(
+                "%s: fetching range %d-%d failed: %s; trying alternate URLs",
+                self.url,
+                start,
+                end,
+                e,
+            )
+            for alt in host_health.order(alternates):
+                try:
+                    data = await self.fetch_range_from(alt, start, end)
+                except FAILOVER_ERRORS as e2:
+                    lgr.debug("%s: fetching range failed: %s", alt, e2)
+                else:
+                    self._switch_url(alt)
+                    await self._notify(self.on_url_switch, alt)
+                    return data
+            raise
+
+    @staticmethod
+    async def _notify(callback: Optional[Callable[[str], None]], url: str) -> None:
+        if callback is not None:
+            # This may write to an on-disk cache, so keep it off the loop
+            await asyncio.get_running_loop().run_in_executor(None, callback, url)
+
+    def _switch_url(self, url: str) -> None:
+        """Make ``url`` the file's URL for all further requests; blocks that
+        have already been fetched remain cached"""
+        lgr.info("%s: switching to alternate URL %s", self.url, url)
+        assert self._alternates is not None
+        self._alternates = [u for u in self._alternates if u != url] + [self.url]
+        self.url = url
+
+    async def _hedged_fetch_range(self, alternate: str, start: int, end: int) -> bytes:
+        """Fetch a range from the file's URL; if it does not answer in time,
+        also request the range from ``alternate`` and use whichever answers
+        first"""
+        deadline = range_latency.percentile(host_of(self.url), self.hedge_percentile)
+        if deadline is None:
+            deadline = DEFAULT_HEDGE_DEADLINE
+        deadline = max(deadline, MIN_HEDGE_DEADLINE)
+        primary = asyncio.ensure_future(self.fetch_range_from(self.url, start, end))
+        done, _ = await asyncio.wait({primary}, timeout=deadline)
+        if done:
+            return primary.result()
+        lgr.debug(
+            "%s: range %d-%d not answered within %.3fs; hedging with %s",
+            self.url,
+            start,
+            end,
+            deadline,
+            alternate,
+        )
+        hedge_stats.issued += 1
+        hedge = asyncio.ensure_future(self.fetch_range_from(alternate, start, end))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for fut in done:
+                    if fut.exception() is None:
+                        if fut is hedge:
+                            hedge_stats.won += 1
+                        return fut.result()
+                    lgr.debug("Hedged range request failed: %s", fut.exception())
+            # Both failed; report the original request's error
+            return primary.result()
+        finally:
+            for fut in pending:
+                fut.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def fetch_range_from(self, url: str, start: int, end: int) -> bytes:
+        """Download bytes ``start`` through ``end - 1`` from ``url``.
+
+        This is `HTTPFile.async_fetch_range()` generalized to URLs other than
+        the file's own.  If ``url`` was recently seen to redirect, the request
+        is sent directly to the redirect target (see `RedirectCache`).
+        """
+        if (target := redirect_cache.get(url)) is not None:
+            try:
+                return await self._fetch_range_at(url, target, start, end)
+            except aiohttp.ClientResponseError as e:
+                lgr.debug("%s: cached redirect target failed: %s; re-resolving", url, e)
+                redirect_cache.forget(url)
+        return await self._fetch_range_at(url, self.fs.encode_url(url), start, end)
+
+    async def _fetch_range_at(
+        self, url: str, target: yarl.URL, start: int, end: int
+    ) -> bytes:
+        lgr.debug("%s: fetching range %d-%d", url, start, end)
+        kwargs = self.kwargs.copy()
+        headers = kwargs.pop("headers", {}).copy()
+        headers["Range"] = f"bytes={start}-{end - 1}"
+        t0 = time.monotonic()
+        r = await self.session.get(target, headers=headers, **kwargs)
+        async with r:
+            if r.status == 416:
+                # range request outside file
+                if start < self.size:
+                    raise SizeMismatchError(
+                        f"{url}: server has no byte {start}, but the file is"
+                        f" {self.size} bytes long"
+                    )
+                return b""
+            r.raise_for_status()
+            if r.history:
+                redirect_cache.store(url, r.url)
+            range_latency.record(host_of(url), time.monotonic() - t0)
+            response_is_range = (
+                r.status == 206
+                or self._parse_content_range(r.headers)[0] == start
+                or int(r.headers.get("Content-Length", end + 1)) <= end - start
+            )
+            if response_is_range:
+                total = self._parse_content_range(r.headers)[2]
+                if total is not None and total != self.size:
+                    raise SizeMismatchError(
+                        f"{url}: server reports size {total}, expected {self.size}"
+                    )
+                out: bytes = await r.read()
+            elif self.spooler is not None:
+                range_support.record_ignored(host_of(url))
+                # Spool the complete content that the server is sending
+                # anyway (unless the file is being spooled already)
+                self._spooled = await self.spooler.spool(
+                    self.spool_name, self.size, partial(write_body, r)
+                )
+                return await self._read_spooled(start, end)
+            elif start > 0:
+                range_support.record_ignored(host_of(url))
+                raise ValueError(
+                    "The HTTP server doesn't appear to support range requests."
+                    " Only reading this file from the beginning is supported."
+                )
+            else:
+                # Not a range response, but we want the start of the file, so
+                # we can read the required amount anyway.
+                chunks = []
+                cl = 0
+                while cl < end - start:
+                    chunk = await r.content.read(2**20)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    cl += len(chunk)
+                out = b"".join(chunks)[: end - start]
+            return out
+
+    _fetch_range = sync_wrapper(async_fetch_range)
+
+
+async def write_body(r: Any, path: Path) -> None:
+    """Write the body of response ``r`` to ``path``.  The file is opened,
+    written, and closed in the default executor, so that a slow disk doesn't
+    stall the event loop shared by all open files."""
+    loop = asyncio.get_running_loop()
+    fp = await loop.run_in_executor(None, path.open, "wb")
+    try:
+        while chunk := await r.content.read(SPOOL_CHUNK_SIZE):
+            await loop.run_in_executor(None, fp.write, chunk)
+    finally:
+        await loop.run_in_executor(None, fp.close)
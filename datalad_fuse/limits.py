@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+import logging
+from threading import Lock
+import time
+from typing import Any, Optional, Protocol, TypeVar
+
+from datalad import cfg
+
+from .health import THROTTLE_STATUSES
+
+lgr = logging.getLogger("datalad.fuse.limits")
+
+#: Default number of requests that may be awaiting a response from a host
+#: before its window has adapted
+DEFAULT_INITIAL_CONCURRENCY = 16
+
+#: Default upper bound on a host's concurrency window
+DEFAULT_MAX_CONCURRENCY = 64
+
+#: Lower bound on a host's concurrency window
+MIN_CONCURRENCY = 1
+
+#: Factor by which a host's window shrinks upon throttling or congestion
+BACKOFF_RATIO = 0.5
+
+#: A response taking more than this many times a host's baseline latency is
+#: taken as a sign of congestion ...
+LATENCY_TOLERANCE = 2.0
+
+#: ... provided that it also exceeds the baseline by this many seconds
+MIN_LATENCY_INFLATION = 0.05
+
+#: Weight with which a host's baseline latency follows slower responses
+BASELINE_DRIFT = 0.01
+
+#: Weight of the most recent response in the moving average of latencies
+LATENCY_ALPHA = 0.3
+
+
+class Response(Protocol):
+    status: int
+
+
+R = TypeVar("R", bound=Response)
+
+
+@dataclass
+class HostWindow:
+    #: Number of requests allowed to await a response at once
+    limit: float
+    in_flight: int = 0
+    waiters: deque[asyncio.Future[None]] = field(default_factory=deque)
+    #: Latency of the host when not congested (roughly the lowest seen)
+    baseline: Optional[float] = None
+    #: Moving average of the host's latency
+    latency: Optional[float] = None
+    #: Time (per `time.monotonic()`) at which the window last shrank
+    last_decrease: float = 0.0
+    #: Token bucket state for rate limiting
+    tokens: Optional[float] = None
+    refilled: float = 0.0
+
+
+class HostLimiter:
+    """Process-wide per-host limits on concurrent requests and request rate.
+
+    Each host has a window bounding the number of requests awaiting a
+    response from it, adapted by additive increase/multiplicative decrease:
+    every successful response grows the window by ``1/window`` (i.e., by one
+    per window's worth of responses), while a throttling response (429 or
+    503), a timeout, or a response much slower than the host's baseline
+    latency halves it, at most once per round trip.  Requests beyond the
+    window wait for a slot in order of arrival, so the load on each host
+    converges to what it can sustain.
+
+    If ``rate`` is set, requests to each host are furthermore limited to
+    ``rate`` per second by a token bucket holding up to ``max(1, rate)``
+    tokens.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        initial: int = DEFAULT_INITIAL_CONCURRENCY,
+        maximum: int = DEFAULT_MAX_CONCURRENCY,
+        rate: Optional[float] = None,
+    ) -> None:
+        self.enabled = enabled
+        self.initial = initial
+        self.maximum = max(maximum, MIN_CONCURRENCY)
+        self.rate = rate or None
+        self._windows: dict[str, HostWindow] = {}
+        self._lock = Lock()
+
+    def configure(self, config: Any) -> None:
+        """Set ``enabled``, ``maximum``, and ``rate`` from the
+        ``datalad.fusefs.adaptive-concurrency``, ``max-concurrency``, and
+        ``rate-limit`` options in ``config``"""
+        maximum = int(
+            config.get("datalad.fusefs.max-concurrency", DEFAULT_MAX_CONCURRENCY)
+        )
+        with self._lock:
+            self.enabled = config.getbool(
+                "datalad.fusefs", "adaptive-concurrency", True
+            )
+            self.maximum = max(maximum, MIN_CONCURRENCY)
+            self.rate = float(config.get("datalad.fusefs.rate-limit", 0)) or None
+            for w in self._windows.values():
+                w.limit = min(w.limit, float(self.maximum))
+
+    def _get(self, host: str) -> HostWindow:
+        # Must be called with the lock held
+        w = self._windows.get(host)
+        if w is None:
+            w = self._windows[host] = HostWindow(
+                limit=float(min(self.initial, self.maximum))
+            )
+        return w
+
+    def window(self, host: str) -> float:
+        """Return the current size of the host's concurrency window"""
+        with self._lock:
+            return self._get(host).limit
+
+    async def acquire(self, host: str) -> None:
+        """Wait until a request may be sent to ``host``.  Every successful
+        call must be followed by a call to `release()`."""
+        if self.rate is not None:
+            await self._take_token(host)
+        if not self.enabled:
+            return
+        with self._lock:
+            w = self._get(host)
+            if w.in_flight < int(w.limit) and not w.waiters:
+                w.in_flight += 1
+                return
+            fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+            w.waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self._lock:
+                if fut in w.waiters:
+                    w.waiters.remove(fut)
+                    dispatched = False
+                else:
+                    dispatched = not fut.cancelled()
+            if dispatched:
+                # A slot was handed to us just before we were cancelled
+                self.release(host)
+            raise
+
+    async def call(self, host: str, send: Callable[[], Awaitable[R]]) -> R:
+        """Send a request to ``host`` with ``send()`` within the host's limits
+        and adapt the limits to the outcome"""
+        await self.acquire(host)
+        start = time.monotonic()
+        try:
+            r = await send()
+        except BaseException as e:
+            self.release(host, congested=isinstance(e, asyncio.TimeoutError))
+            raise
+        self.release(
+            host,
+            latency=time.monotonic() - start,
+            throttled=r.status in THROTTLE_STATUSES,
+        )
+        return r
+
+    def release(
+        self,
+        host: str,
+        latency: Optional[float] = None,
+        throttled: bool = False,
+        congested: bool = False,
+    ) -> None:
+        """Release a slot acquired with `acquire()`, adapting the host's
+        window to the outcome of the request: ``latency`` is the time the
+        response took (`None` if the request failed), ``throttled`` is true
+        if the server answered with a throttling status, and ``congested`` is
+        true if the request timed out"""
+        if not self.enabled:
+            return
+        with self._lock:
+            w = self._get(host)
+            w.in_flight -= 1
+            now = time.monotonic()
+            if latency is not None and not throttled:
+                inflated = (
+                    w.baseline is not None
+                    and latency > LATENCY_TOLERANCE * w.baseline
+                    and latency - w.baseline > MIN_LATENCY_INFLATION
+                )
+                if w.baseline is None or latency < w.baseline:
+                    w.baseline = latency
+                else:
+                    w.baseline += BASELINE_DRIFT * (latency - w.baseline)
+                if w.latency is None:
+                    w.latency = latency
+                else:
+                    w.latency += LATENCY_ALPHA * (latency - w.latency)
+                congested = congested or inflated
+            if throttled or congested:
+                # Responses to requests sent before the last decrease do not
+                # reflect it yet
+                if now - w.last_decrease >= (w.latency or 0.0):
+                    w.limit = max(float(MIN_CONCURRENCY), w.limit * BACKOFF_RATIO)
+                    w.last_decrease = now
+                    lgr.debug(
+                        "%s: %s; reducing concurrency window to %g",
+                        host,
+                        "throttled" if throttled else "congested",
+                        w.limit,
+                    )
+            elif latency is not None:
+                w.limit = min(float(self.maximum), w.limit + 1 / w.limit)
+            self._dispatch(host, w)
+
+    def _dispatch(self, host: str, w: HostWindow) -> None:
+        # Must be called with the lock held
+        while w.waiters and w.in_flight < int(w.limit):
+            fut = w.waiters.popleft()
+            w.in_flight += 1
+            fut.get_loop().call_soon_threadsafe(self._wake, host, fut)
+
+    def _wake(self, host: str, fut: asyncio.Future[None]) -> None:
+        if fut.done():
+            # The waiter was cancelled after being handed a slot
+            self.release(host)
+        else:
+            fut.set_result(None)
+
+    async def _take_token(self, host: str) -> None:
+        assert self.rate is not None
+        burst = max(1.0, self.rate)
+        while True:
+            with self._lock:
+                w = self._get(host)
+                now = time.monotonic()
+                if w.tokens is None:
+                    w.tokens = burst
+                else:
+                    w.tokens = min(burst, w.tokens + (now - w.refilled) * self.rate)
+                w.refilled = now
+                if w.tokens >= 1:
+                    w.tokens -= 1
+                    return
+                wait = (1 - w.tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._windows.clear()
+
+
+host_limiter = HostLimiter()
+host_limiter.configure(cfg)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Iterable
+import logging
+from typing import Optional
+
+from fsspec.asyn import sync
+from fsspec.implementations.http import HTTPFileSystem
+
+lgr = logging.getLogger("datalad.fuse.probe")
+
+#: Default delay (in seconds) before the next candidate URL is probed while
+#: the previous ones have not answered yet
+DEFAULT_STAGGER = 0.25
+
+
+async def probe_url(fs: HTTPFileSystem, url: str) -> None:
+    """Check that ``url`` serves content by requesting its first byte.
+
+    Raises `FileNotFoundError` if the server reports the URL as missing and
+    another exception if the request fails in some other way.
+    """
+    session = await fs.set_session()
+    async with session.get(
+        fs.encode_url(url), headers={"Range": "bytes=0-0"}, **fs.kwargs
+    ) as r:
+        if r.status == 416:
+            # The range cannot be satisfied because the content is empty
+            return
+        fs._raise_not_found_for_status(r, url)
+
+
+async def async_probe_first(
+    fs: HTTPFileSystem, urls: Iterable[str], stagger: float = DEFAULT_STAGGER
+) -> tuple[Optional[str], dict[str, BaseException]]:
+    """Probe ``urls`` concurrently and return the first one to answer.
+
+    Probing starts with the first URL; each subsequent URL is started either
+    once the previously started ones have all been pending for ``stagger``
+    seconds or as soon as one of them fails.  Once a URL answers
+    successfully, all other outstanding probes are cancelled.
+
+    Returns a pair of the winning URL (or `None` if all failed) and a `dict`
+    mapping URLs that were found to fail to the corresponding exceptions.
+    """
+    todo = iter(urls)
+    errors: dict[str, BaseException] = {}
+    running: dict[asyncio.Future, str] = {}
+
+    def start_next() -> bool:
+        url = next(todo, None)
+        if url is None:
+            return False
+        lgr.debug("Probing %s", url)
+        running[asyncio.ensure_future(probe_url(fs, url))] = url
+        return True
+
+    start_next()
+    try:
+        while running:
+            done, _ = await asyncio.wait(
+                running, timeout=stagger, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                start_next()
+                continue
+            winner = None
+            for fut in done:
+                url = running.pop(fut)
+                if (exc := fut.exception()) is None:
+                    winner = url
+                else:
+                    lgr.debug("Probe of %s failed: %s", url, exc)
+                    errors[url] = exc
+            if winner is not None:
+                lgr.debug("First URL to answer: %s", winner)
+                return (winner, errors)
+            for _ in done:
+                start_next()
+        return (None, errors)
+    finally:
+        for fut in running:
+            fut.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+def probe_first(
+    fs: HTTPFileSystem, urls: Iterable[str], stagger: float = DEFAULT_STAGGER
+) -> tuple[Optional[str], dict[str, BaseException]]:
+    """Synchronous wrapper around `async_probe_first()`"""
+    r: tuple[Optional[str], dict[str, BaseException]] = sync(
+        fs.loop, async_probe_first, fs, urls, stagger
+    )
+    return r
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import statistics
+from threading import Lock
+import time
+from typing import NamedTuple, Optional
+
+from fsspec.asyn import sync
+from fsspec.implementations.http import HTTPFileSystem
+
+from .health import host_of
+
+lgr = logging.getLogger("datalad.fuse.profile")
+
+#: Default number of bytes read from each URL to measure throughput
+DEFAULT_PROFILE_BYTES = 4 * 1024 * 1024
+
+#: Default number of keys sampled by ``fsspec-profile``
+DEFAULT_PROFILE_SAMPLES = 5
+
+#: Default lifetime (in seconds) of a host's measurements
+DEFAULT_PROFILE_TTL = 7 * 24 * 3600
+
+#: Size of the reads whose duration is estimated in order to rank hosts;
+#: this is fsspec's default block size, i.e., the size of the ranged
+#: requests made for reads from an HTTP file
+REFERENCE_READ_SIZE = 5 * 1024 * 1024
+
+
+class Measurement(NamedTuple):
+    #: Seconds until the first byte of the response body was received
+    ttfb: float
+    #: Bytes per second received after the first byte
+    throughput: Optional[float]
+    #: Number of bytes received
+    size: int
+
+
+class HostProfile(NamedTuple):
+    host: str
+    #: Median time to first byte in seconds
+    ttfb: float
+    #: Median throughput in bytes per second, if enough data was received to
+    #: measure it
+    throughput: Optional[float]
+    samples: int
+    measured: float
+
+    @property
+    def score(self) -> float:
+        """Estimated number of seconds for a read of `REFERENCE_READ_SIZE`
+        bytes (lower is better)"""
+        if self.throughput:
+            return self.ttfb + REFERENCE_READ_SIZE / self.throughput
+        else:
+            return self.ttfb
+
+
+async def async_measure_url(fs: HTTPFileSystem, url: str, nbytes: int) -> Measurement:
+    """Request the first ``nbytes`` bytes of ``url`` and measure the time to
+    the first byte and the throughput of the rest of the response.
+
+    Raises `FileNotFoundError` if the server reports the URL as missing and
+    another exception if the request fails in some other way.
+    """
+    session = await fs.set_session()
+    start = time.monotonic()
+    async with session.get(
+        fs.encode_url(url), headers={"Range": f"bytes=0-{nbytes - 1}"}, **fs.kwargs
+    ) as r:
+        fs._raise_not_found_for_status(r, url)
+        first = await r.content.readany()
+        ttfb = time.monotonic() - start
+        received = 0
+        while received + len(first) < nbytes:
+            chunk = await r.content.readany()
+            if not chunk:
+                break
+            received += len(chunk)
+        elapsed = time.monotonic() - start - ttfb
+    throughput = received / elapsed if received and elapsed > 0 else None
+    return Measurement(ttfb, throughput, len(first) + received)
+
+
+def measure_url(fs: HTTPFileSystem, url: str, nbytes: int) -> Measurement:
+    """Synchronous wrapper around `async_measure_url()`"""
+    r: Measurement = sync(fs.loop, async_measure_url, fs, url, nbytes)
+    return r
+
+
+def summarize(host: str, measurements: Sequence[Measurement]) -> HostProfile:
+    """Combine a host's measurements into a `HostProfile`"""
+    throughputs = [m.throughput for m in measurements if m.throughput is not None]
+    return HostProfile(
+        host=host,
+        ttfb=statistics.median(m.ttfb for m in measurements),
+        throughput=statistics.median(throughputs) if throughputs else None,
+        samples=len(measurements),
+        measured=time.time(),
+    )
+
+
+class RemoteProfile:
+    """Persistent ranking of remote hosts by measured performance.
+
+    Hosts are profiled by ``fsspec-profile``, which measures the time to
+    first byte and the throughput of ranged reads from the URLs of sampled
+    keys.  Candidate URLs are then tried in order of the estimated duration
+    of a block read from their hosts.  Measurements older than ``ttl``
+    seconds are ignored.
+
+    The profile is stored in an SQLite database; if it cannot be created
+    (e.g., read-only dataset), an in-memory database is used instead.
+    """
+
+    def __init__(
+        self, path: str | Path | None, ttl: float = DEFAULT_PROFILE_TTL
+    ) -> None:
+        self.path = Path(path) if path is not None else None
+        self.ttl = ttl
+        self._lock = Lock()
+        self._db = self._connect()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS hosts ("
+                " host TEXT PRIMARY KEY,"
+                " ttfb REAL NOT NULL,"
+                " throughput REAL,"
+                " samples INTEGER NOT NULL,"
+                " measured REAL NOT NULL"
+                ")"
+            )
+        self._cache: Optional[dict[str, HostProfile]] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.path is not None:
+            try:
+                os.makedirs(self.path.parent, exist_ok=True)
+                return sqlite3.connect(
+                    str(self.path), timeout=10, check_same_thread=False
+                )
+            except (OSError, sqlite3.Error) as e:
+                lgr.warning(
+                    "Could not open remote profile at %s: %s; using in-memory"
+                    " profile",
+                    self.path,
+                    e,
+                )
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def get_all(self) -> dict[str, HostProfile]:
+        """Return the current profiles of all hosts"""
+        with self._lock:
+            if self._cache is None:
+                rows = self._db.execute(
+                    "SELECT host, ttfb, throughput, samples, measured FROM hosts"
+                    " WHERE measured >= ?",
+                    (time.time() - self.ttl,),
+                ).fetchall()
+                self._cache = {r[0]: HostProfile(*r) for r in rows}
+            return dict(self._cache)
+
+    def ranking(self) -> list[HostProfile]:
+        """Return the current profiles of all hosts, best first"""
+        return sorted(self.get_all().values(), key=lambda p: p.score)
+
+    def store(self, profiles: Sequence[HostProfile]) -> None:
+        try:
+            with self._lock, self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO hosts"
+                    " (host, ttfb, throughput, samples, measured)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    profiles,
+                )
+                self._cache = None
+        except sqlite3.Error as e:
+            lgr.debug("Failed to store remote profile: %s", e)
+
+    def order(self, urls: Sequence[str]) -> list[str]:
+        """Order ``urls`` by the profiles of their hosts.
+
+        URLs of unprofiled hosts are ranked as if their hosts were of
+        average performance.  The sort is stable, so URLs of equally ranked
+        hosts (e.g., all of them if nothing has been profiled) keep their
+        relative order.
+        """
+        profiles = self.get_all()
+        if not profiles:
+            return list(urls)
+        scores = {u: p.score if (p := profiles.get(host_of(u))) else None for u in urls}
+        known = [s for s in scores.values() if s is not None]
+        if not known:
+            return list(urls)
+        default = sum(known) / len(known)
+        return sorted(urls, key=lambda u: default if (s := scores[u]) is None else s)
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM hosts")
+            self._cache = None
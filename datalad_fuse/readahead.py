@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+import logging
+from typing import Any, Optional, Protocol
+
+import aiohttp
+from fsspec.asyn import sync
+
+lgr = logging.getLogger("datalad.fuse.readahead")
+
+#: Default number of segments of a file fetched concurrently ahead of a
+#: sequential reader
+DEFAULT_READAHEAD_SEGMENTS = 8
+
+#: Default size (in bytes) of each segment.  A file being read sequentially
+#: thus holds at most ``segments * segment_size`` bytes in memory.
+DEFAULT_SEGMENT_SIZE = 8 * 2**20
+
+#: Default number of bytes that must be read sequentially before a file is
+#: streamed
+DEFAULT_STREAM_TRIGGER = 2**20
+
+#: Number of bytes that a stream skips ahead in order to serve a read beyond
+#: its position; a read further ahead ends the stream
+MAX_STREAM_SKIP = 2**20
+
+#: Errors upon which a broken stream is reopened
+STREAM_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+
+class ScanDetector:
+    """Detects sequential scans of a file from the offsets of its reads.
+
+    A read that starts where the previous one ended, or within the previous
+    one (as ``readline()`` does after reading too far), continues the scan,
+    which then counts the bytes of the read beyond those read before.
+    """
+
+    def __init__(self) -> None:
+        self._start: Optional[int] = None
+        self._end = 0
+        #: Number of bytes read sequentially so far
+        self.streak = 0
+
+    def note(self, offset: int, end: int) -> bool:
+        """Note a read of bytes ``offset`` through ``end - 1`` and return
+        whether it continues the scan"""
+        continues = self._start is not None and self._start <= offset <= self._end
+        if continues:
+            self.streak += max(0, end - self._end)
+            self._end = max(self._end, end)
+        else:
+            self.streak = 0
+            self._end = end
+        self._start = offset
+        return continues
+
+    def reset(self) -> None:
+        self.streak = 0
+
+
+class SegmentedReader:
+    """Fetches ahead of a sequential reader with concurrent range requests.
+
+    The file is divided into segments of ``segment_size`` bytes.  Once reads
+    have continued each other (see `ScanDetector`) for ``segment_size``
+    bytes, the reader is taken to be scanning the file, and the ``segments``
+    segments starting at the current read are fetched concurrently with
+    ``fetch_range()``.  Reads are answered from those segments, in whatever
+    order they arrive; each segment is dropped once it has been read
+    completely (or once reads have moved on by two segments), and the next
+    segment after the last one held is requested in its place, so that at
+    most ``segments`` segments are held or in flight at a time.  A read
+    outside of the segments held ends the scan.
+
+    ``read()`` may be called from any number of threads other than the one
+    running ``loop``.
+    """
+
+    def __init__(
+        self,
+        fetch_range: Callable[[int, int], Awaitable[bytes]],
+        size: int,
+        loop: asyncio.AbstractEventLoop,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        segments: int = DEFAULT_READAHEAD_SEGMENTS,
+    ) -> None:
+        self.fetch_range = fetch_range
+        self.size = size
+        self.loop = loop
+        self.segment_size = segment_size
+        self.segments = segments
+        # Only accessed from within the loop:
+        #: segment offset -> fetch of the segment
+        self._fetches: dict[int, asyncio.Future[bytes]] = {}
+        #: segment offset -> number of bytes of the segment read so far
+        self._consumed: dict[int, int] = {}
+        self._scan = ScanDetector()
+
+    @property
+    def engaged(self) -> bool:
+        """Whether the file is being scanned, i.e., whether reads are being
+        answered from segments fetched ahead"""
+        return bool(self._fetches)
+
+    def read(self, offset: int, size: int) -> Optional[bytes]:
+        """Read up to ``size`` bytes at ``offset`` if the file is being
+        scanned; otherwise, return `None` after noting the read, which the
+        caller must then make by other means"""
+        data: Optional[bytes] = sync(self.loop, self.async_read, offset, size)
+        return data
+
+    async def async_read(self, offset: int, size: int) -> Optional[bytes]:
+        end = min(offset + size, self.size)
+        if offset >= end:
+            return None
+        sequential = self._scan.note(offset, end)
+        if not self._fetches:
+            if self._scan.streak <= self.segment_size:
+                return None
+            lgr.debug(
+                "Sequential read reached offset %d; fetching %d segments ahead",
+                offset,
+                self.segments,
+            )
+        elif not sequential and self._segment(offset) not in self._fetches:
+            lgr.debug("Read at offset %d left the segments fetched ahead", offset)
+            self._stop()
+            self._scan.reset()
+            return None
+        self._schedule(offset)
+        chunks = []
+        pos = offset
+        while pos < end:
+            start = self._segment(pos)
+            data = await self._get(start)
+            chunks.append(data[pos - start : end - start])
+            self._consume(start, len(chunks[-1]))
+            if len(data) < min(self.segment_size, self.size - start):
+                # Short response; the file is shorter than expected
+                break
+            pos = start + len(data)
+        return b"".join(chunks)
+
+    async def _get(self, start: int) -> bytes:
+        while True:
+            fut = self._fetches.get(start)
+            if fut is None:
+                # Dropped by a concurrent read further ahead
+                fut = self._fetch(start)
+            try:
+                data: bytes = await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise
+                # Cancelled by a concurrent read leaving the segments; fetch
+                # the segment on its own
+            except Exception:
+                # Fetch the segment again on the next read of it
+                if self._fetches.get(start) is fut:
+                    del self._fetches[start]
+                raise
+            else:
+                return data
+
+    def _segment(self, offset: int) -> int:
+        return offset - offset % self.segment_size
+
+    def _fetch(self, start: int) -> asyncio.Future[bytes]:
+        fut = asyncio.ensure_future(
+            self.fetch_range(start, min(start + self.segment_size, self.size))
+        )
+        # Errors of fetches that are dropped before being read are of no
+        # interest
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return fut
+
+    def _schedule(self, offset: int) -> None:
+        first = self._segment(offset)
+        for start in [s for s in self._fetches if s < first - self.segment_size]:
+            self._drop(start)
+        start = first
+        while len(self._fetches) < self.segments and start < self.size:
+            if start not in self._fetches:
+                self._fetches[start] = self._fetch(start)
+            start += self.segment_size
+
+    def _consume(self, start: int, n: int) -> None:
+        if start not in self._fetches:
+            return
+        consumed = self._consumed.get(start, 0) + n
+        if consumed >= min(self.segment_size, self.size - start):
+            self._drop(start)
+        else:
+            self._consumed[start] = consumed
+
+    def _drop(self, start: int) -> None:
+        # Not cancelled, as a concurrent read may still be waiting for it
+        del self._fetches[start]
+        self._consumed.pop(start, None)
+
+    def _stop(self) -> None:
+        for fut in self._fetches.values():
+            fut.cancel()
+        self._fetches.clear()
+        self._consumed.clear()
+
+    def close(self) -> None:
+        """Cancel all fetches in flight"""
+        self.loop.call_soon_threadsafe(self._stop)
+
+
+class Stream(Protocol):
+    """The parts of a response used by `StreamingReader`"""
+
+    content: Any
+
+    def close(self) -> Any:
+        """Close the response's connection without reading the rest"""
+
+
+class StreamingReader:
+    """Serves a sequential scan of a file from a single open-ended GET.
+
+    Once reads have continued each other (see `ScanDetector`) for
+    ``trigger`` bytes, ``open_stream(offset)`` is used to request the rest of the file
+    from the current read on, and reads are answered from the body of the
+    response as it arrives, without a round trip per block.  The data of the
+    last read is kept, so that reads may go back into it (as ``readline()``
+    does); reads up to `MAX_STREAM_SKIP` bytes ahead skip the data in
+    between.  Any other read ends the stream, leaving reads to range
+    requests until the file is being scanned again.  If the stream breaks
+    (e.g., the connection is lost or the request times out), it is reopened
+    at the current read once.
+
+    ``read()`` may be called from any number of threads other than the one
+    running ``loop``.
+    """
+
+    def __init__(
+        self,
+        open_stream: Callable[[int], Awaitable[Optional[Stream]]],
+        size: int,
+        loop: asyncio.AbstractEventLoop,
+        trigger: int = DEFAULT_STREAM_TRIGGER,
+    ) -> None:
+        self.open_stream = open_stream
+        self.size = size
+        self.loop = loop
+        self.trigger = trigger
+        # Only accessed from within the loop:
+        self._lock: Optional[asyncio.Lock] = None
+        self._stream: Optional[Stream] = None
+        #: Offset of the next byte of the stream
+        self._pos = 0
+        #: Data of the stream up to ``_pos``, starting at ``_buf_start``
+        self._buf = b""
+        self._buf_start = 0
+        self._scan = ScanDetector()
+
+    @property
+    def engaged(self) -> bool:
+        """Whether the file is being scanned, i.e., whether reads are being
+        answered from a stream"""
+        return self._stream is not None
+
+    def read(self, offset: int, size: int) -> Optional[bytes]:
+        """Read up to ``size`` bytes at ``offset`` if the file is being
+        scanned; otherwise, return `None` after noting the read, which the
+        caller must then make by other means"""
+        data: Optional[bytes] = sync(self.loop, self.async_read, offset, size)
+        return data
+
+    async def async_read(self, offset: int, size: int) -> Optional[bytes]:
+        end = min(offset + size, self.size)
+        if offset >= end:
+            return None
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._scan.note(offset, end)
+            if self._stream is None:
+                if self._scan.streak <= self.trigger:
+                    return None
+            elif not self._buf_start <= offset <= self._pos + MAX_STREAM_SKIP:
+                lgr.debug("Read at offset %d left the stream; closing it", offset)
+                self._close()
+                self._scan.reset()
+                return None
+            for _ in range(2):
+                if self._stream is None and not await self._open(offset):
+                    break
+                try:
+                    return await self._read(offset, end)
+                except STREAM_ERRORS as e:
+                    lgr.debug("Stream broke at offset %d: %s", self._pos, e)
+                    self._close()
+            self._scan.reset()
+            return None
+
+    async def _open(self, offset: int) -> bool:
+        lgr.debug("Streaming from offset %d", offset)
+        try:
+            stream = await self.open_stream(offset)
+        except STREAM_ERRORS as e:
+            lgr.debug("Could not open stream: %s", e)
+            return False
+        if stream is None:
+            return False
+        self._stream = stream
+        self._pos = self._buf_start = offset
+        self._buf = b""
+        return True
+
+    async def _read(self, offset: int, end: int) -> bytes:
+        if offset > self._pos:
+            await self._read_stream(offset - self._pos)
+            self._buf = b""
+            self._buf_start = offset
+        if end > self._pos:
+            more = await self._read_stream(end - self._pos)
+            self._buf = self._buf[offset - self._buf_start :] + more
+            self._buf_start = offset
+        return self._buf[offset - self._buf_start : end - self._buf_start]
+
+    async def _read_stream(self, n: int) -> bytes:
+        assert self._stream is not None
+        chunks = []
+        while n > 0:
+            chunk = await self._stream.content.read(n)
+            if not chunk:
+                raise aiohttp.ClientPayloadError(
+                    f"Stream ended early at offset {self._pos}"
+                )
+            chunks.append(chunk)
+            self._pos += len(chunk)
+            n -= len(chunk)
+        return b"".join(chunks)
+
+    def _close(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        self._buf = b""
+
+    def close(self) -> None:
+        """Close the stream, if any"""
+        self.loop.call_soon_threadsafe(self._close)
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from functools import partial
+import logging
+import random
+from threading import Lock
+import time
+from typing import Any, Optional, Protocol, TypeVar
+
+import aiohttp
+from datalad import cfg
+
+from .health import host_health, host_of
+from .limits import HostLimiter, host_limiter
+
+lgr = logging.getLogger("datalad.fuse.retry")
+
+#: Default maximum number of attempts made for a request
+DEFAULT_RETRY_ATTEMPTS = 5
+
+#: Default minimum number of seconds to wait before retrying a request
+DEFAULT_RETRY_BASE_DELAY = 0.5
+
+#: Default maximum number of seconds to wait before retrying a request
+DEFAULT_RETRY_MAX_DELAY = 30.0
+
+#: Default maximum ``Retry-After`` (in seconds) that is waited out; requests
+#: told to wait longer fail right away
+DEFAULT_MAX_RETRY_AFTER = 30.0
+
+#: Default number of retries a host earns per request made to it
+DEFAULT_RETRY_BUDGET = 0.2
+
+#: Number of retries a host can make in a burst before its budget is earned
+RETRY_BUDGET_BURST = 10.0
+
+#: Statuses indicating a transient condition, upon which a request is retried.
+#: Any other error status (e.g., 404) is considered permanent.
+RETRYABLE_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+#: Methods that can safely be sent again
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class Response(Protocol):
+    """The parts of a response inspected in order to decide on a retry"""
+
+    status: int
+    headers: Any
+
+    def release(self) -> Any:
+        """Release the connection of a response that is discarded"""
+
+
+R = TypeVar("R", bound=Response)
+
+
+@dataclass
+class RetryPolicy:
+    """How requests that fail transiently are retried.
+
+    A request is retried if it is answered with one of `RETRYABLE_STATUSES`
+    or if the server closed a kept-alive connection before answering.  Other
+    errors, such as connection failures and timeouts, are left to the
+    caller, which can fail over to another URL more quickly than a retry
+    would succeed.  The delays between attempts follow the "decorrelated
+    jitter" scheme (each delay is random between ``base_delay`` and three
+    times the previous one, up to ``max_delay``), so that clients that
+    failed together do not retry together.  A ``Retry-After`` sent by the
+    server is waited out, unless it exceeds ``max_retry_after``.
+    """
+
+    attempts: int = DEFAULT_RETRY_ATTEMPTS
+    base_delay: float = DEFAULT_RETRY_BASE_DELAY
+    max_delay: float = DEFAULT_RETRY_MAX_DELAY
+    max_retry_after: float = DEFAULT_MAX_RETRY_AFTER
+
+    @classmethod
+    def from_config(cls, config: Any = cfg) -> RetryPolicy:
+        """Read the policy from the ``datalad.fusefs.retry-*`` configuration
+        options"""
+        return cls(
+            attempts=int(
+                config.get("datalad.fusefs.retry-attempts", DEFAULT_RETRY_ATTEMPTS)
+            ),
+            base_delay=float(
+                config.get("datalad.fusefs.retry-base-delay", DEFAULT_RETRY_BASE_DELAY)
+            ),
+            max_delay=float(
+                config.get("datalad.fusefs.retry-max-delay", DEFAULT_RETRY_MAX_DELAY)
+            ),
+            max_retry_after=float(
+                config.get(
+                    "datalad.fusefs.retry-max-retry-after", DEFAULT_MAX_RETRY_AFTER
+                )
+            ),
+        )
+
+    def configure(self, config: Any) -> None:
+        """Update the policy in place from the ``datalad.fusefs.retry-*``
+        options in ``config``, so that sessions already using it follow
+        suit"""
+        new = self.from_config(config)
+        self.attempts = new.attempts
+        self.base_delay = new.base_delay
+        self.max_delay = new.max_delay
+        self.max_retry_after = new.max_retry_after
+
+    def is_retryable_status(self, status: int) -> bool:
+        return status in RETRYABLE_STATUSES
+
+    def is_retryable_error(self, e: BaseException) -> bool:
+        # A stale pooled connection closed by the server; a new one will
+        # likely succeed.
+        return isinstance(e, aiohttp.ServerDisconnectedError)
+
+    def backoff(self, previous: float) -> float:
+        """Return the delay before the next attempt, given the previous
+        delay"""
+        return min(
+            self.max_delay,
+            random.uniform(self.base_delay, max(self.base_delay, previous * 3)),
+        )
+
+
+class RetryBudget:
+    """Per-host limit on the share of requests that are retries.
+
+    Each request to a host adds ``ratio`` to the host's balance (up to
+    ``burst``), and each retry takes one from it; when the balance is below
+    one, requests are not retried.  Against a host that is failing or
+    throttling every request, retries thus add at most ``ratio`` times the
+    original load rather than multiplying it.
+    """
+
+    def __init__(
+        self, ratio: float = DEFAULT_RETRY_BUDGET, burst: float = RETRY_BUDGET_BURST
+    ) -> None:
+        self.ratio = ratio
+        self.burst = burst
+        self._balances: dict[str, float] = {}
+        self._lock = Lock()
+
+    def configure(self, config: Any) -> None:
+        """Set ``ratio`` from the ``datalad.fusefs.retry-budget`` option in
+        ``config``"""
+        self.ratio = float(
+            config.get("datalad.fusefs.retry-budget", DEFAULT_RETRY_BUDGET)
+        )
+
+    def deposit(self, host: str) -> None:
+        with self._lock:
+            balance = self._balances.get(host, self.burst)
+            self._balances[host] = min(self.burst, balance + self.ratio)
+
+    def withdraw(self, host: str) -> bool:
+        """Take a retry from the host's budget if one is available"""
+        with self._lock:
+            balance = self._balances.get(host, self.burst)
+            if balance < 1:
+                return False
+            self._balances[host] = balance - 1
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._balances.clear()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a ``Retry-After`` header value (a number of seconds or an HTTP
+    date) into a number of seconds from now"""
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+async def send_with_retries(
+    send: Callable[[int], Awaitable[R]],
+    method: str,
+    url: str,
+    policy: RetryPolicy,
+    budget: RetryBudget,
+    limiter: HostLimiter = host_limiter,
+) -> R:
+    """Call ``send(attempt)`` to send a request, retrying it as specified by
+    ``policy`` and allowed by ``budget``, and return the final response.
+    Each attempt is made within the host's limits as kept by ``limiter``."""
+    host = host_of(url)
+    budget.deposit(host)
+    delay = policy.base_delay
+    attempt = 1
+    while True:
+        retry_after: Optional[float] = None
+        error: Optional[Exception] = None
+        failed: Optional[R] = None
+        try:
+            r = await limiter.call(host, partial(send, attempt))
+        except Exception as e:
+            if not policy.is_retryable_error(e):
+                raise
+            reason = f"{type(e).__name__}: {e}"
+            error = e
+        else:
+            if not policy.is_retryable_status(r.status):
+                return r
+            reason = f"status {r.status}"
+            retry_after = parse_retry_after(r.headers.get("Retry-After"))
+            failed = r
+        if attempt >= policy.attempts:
+            why: Optional[str] = f"{attempt} attempts made"
+        elif method.upper() not in IDEMPOTENT_METHODS:
+            why = "method is not idempotent"
+        elif retry_after is not None and retry_after > policy.max_retry_after:
+            why = f"server asked to wait {retry_after:g} seconds"
+        elif not host_health.is_available(host):
+            why = "host is being skipped"
+        elif not budget.withdraw(host):
+            why = "retry budget for host exhausted"
+        else:
+            why = None
+        if why is not None:
+            lgr.debug("Not retrying %s %s after %s: %s", method, url, reason, why)
+            if failed is not None:
+                return failed
+            assert error is not None
+            raise error
+        delay = policy.backoff(delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        lgr.warning(
+            "%s %s failed with %s; retrying in %.2f seconds", method, url, reason, delay
+        )
+        if failed is not None:
+            failed.release()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+retry_policy = RetryPolicy.from_config()
+
+retry_budget = RetryBudget()
+retry_budget.configure(cfg)
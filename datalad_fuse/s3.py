@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import logging
+from threading import Lock
+from typing import Any, NamedTuple, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+import boto3
+from botocore import UNSIGNED
+from botocore.config import Config as BotocoreConfig
+from botocore.exceptions import BotoCoreError
+
+from .transport import connection_pool
+
+lgr = logging.getLogger("datalad.fuse.s3")
+
+#: Lifetime (in seconds) of presigned URLs generated when credentials are used
+PRESIGN_EXPIRES = 6 * 3600
+
+
+class S3Location(NamedTuple):
+    bucket: str
+    key: str
+    version_id: Optional[str] = None
+
+
+def is_s3_url(s: str) -> bool:
+    return s.lower().startswith("s3://")
+
+
+def parse_s3_url(url: str) -> S3Location:
+    """Parse an ``s3://bucket/key[?versionId=...]`` URL as registered by
+    git-annex"""
+    parsed = urlparse(url)
+    if parsed.scheme.lower() != "s3" or not parsed.netloc:
+        raise ValueError(f"Not an S3 URL: {url!r}")
+    key = unquote(parsed.path.lstrip("/"))
+    if not key:
+        raise ValueError(f"S3 URL does not name an object: {url!r}")
+    version_id = parse_qs(parsed.query).get("versionId", [None])[0]
+    return S3Location(parsed.netloc, key, version_id)
+
+
+class S3Resolver:
+    """Translates ``s3://`` URLs into HTTP(S) URLs that can be read with
+    ranged GETs by `AnnexHTTPFile`, so that S3 objects get the same caching,
+    hedging, and failover as any other URL.
+
+    By default, requests are anonymous (for public buckets) and the URL is
+    simply the object's address at ``endpoint_url`` (AWS if not set).  If
+    ``anonymous`` is false, credentials are taken from boto3's usual sources
+    (environment, ``~/.aws``, instance metadata) and the URL is presigned for
+    `PRESIGN_EXPIRES` seconds.
+
+    One boto3 client is created per endpoint, region, and credential mode
+    and shared by all resolvers in the process.
+    """
+
+    _clients: dict[tuple[Optional[str], Optional[str], bool], Any] = {}
+    _clients_lock = Lock()
+
+    def __init__(
+        self,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        anonymous: bool = True,
+    ) -> None:
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.anonymous = anonymous
+
+    def get_client(self) -> Any:
+        ckey = (self.endpoint_url, self.region, self.anonymous)
+        with self._clients_lock:
+            try:
+                return self._clients[ckey]
+            except KeyError:
+                config = BotocoreConfig(
+                    signature_version=UNSIGNED if self.anonymous else "s3v4",
+                    # S3 stand-ins (MinIO, moto, ...) generally only support
+                    # path-style addressing
+                    s3={"addressing_style": "path" if self.endpoint_url else "auto"},
+                    # Same connection limit as for other HTTP requests
+                    max_pool_connections=connection_pool.config.limit_per_host,
+                    tcp_keepalive=True,
+                )
+                client = self._clients[ckey] = boto3.client(
+                    "s3",
+                    endpoint_url=self.endpoint_url,
+                    region_name=self.region,
+                    config=config,
+                )
+                return client
+
+    def to_http(self, url: str) -> str:
+        """Return an HTTP(S) URL for reading the object at S3 URL ``url``.
+
+        Raises `ValueError` if ``url`` cannot be translated (e.g., it is
+        malformed or credentials are required but unavailable).
+        """
+        loc = parse_s3_url(url)
+        params = {"Bucket": loc.bucket, "Key": loc.key}
+        if loc.version_id is not None:
+            params["VersionId"] = loc.version_id
+        try:
+            http_url: str = self.get_client().generate_presigned_url(
+                "get_object", Params=params, ExpiresIn=PRESIGN_EXPIRES
+            )
+        except BotoCoreError as e:
+            raise ValueError(f"Cannot generate URL for {url}: {e}")
+        lgr.debug("Translated %s to %s", url, http_url)
+        return http_url
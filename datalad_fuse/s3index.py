@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+import logging
+import os
+from pathlib import Path
+import sqlite3
+from threading import Lock
+import time
+from typing import Any
+
+lgr = logging.getLogger("datalad.fuse.s3index")
+
+#: Default lifetime (in seconds) of a listing of object versions
+DEFAULT_INDEX_TTL = 24 * 3600
+
+#: Default lifetime (in seconds) of a listing that failed or found nothing
+DEFAULT_NEGATIVE_INDEX_TTL = 300
+
+
+class S3VersionIndex:
+    """Persistent index of the object versions in (parts of) S3 buckets.
+
+    A prefix of a bucket is listed once (see
+    `DatasetAdapter._list_s3_versions()`) and all versions found under it
+    are stored, so that later lookups of objects under that prefix -- in
+    this or another process -- need no further requests until the listing
+    is older than ``ttl`` seconds.  A listing that failed or found no
+    versions is remembered for ``negative_ttl`` seconds, during which the
+    prefix is not listed again and holds no versions.
+
+    The index is stored in an SQLite database; if it cannot be created
+    (e.g., read-only dataset), an in-memory database is used instead.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None,
+        ttl: float = DEFAULT_INDEX_TTL,
+        negative_ttl: float = DEFAULT_NEGATIVE_INDEX_TTL,
+    ) -> None:
+        self.path = Path(path) if path is not None else None
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = Lock()
+        self._db = self._connect()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS listings ("
+                " host TEXT NOT NULL,"
+                " bucket TEXT NOT NULL,"
+                " prefix TEXT NOT NULL,"
+                " listed REAL NOT NULL,"
+                " PRIMARY KEY (host, bucket, prefix)"
+                ")"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS misses ("
+                " host TEXT NOT NULL,"
+                " bucket TEXT NOT NULL,"
+                " prefix TEXT NOT NULL,"
+                " listed REAL NOT NULL,"
+                " PRIMARY KEY (host, bucket, prefix)"
+                ")"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS versions ("
+                " host TEXT NOT NULL,"
+                " bucket TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " version_id TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " etag TEXT NOT NULL,"
+                " is_latest INTEGER NOT NULL,"
+                " PRIMARY KEY (host, bucket, key, version_id)"
+                ")"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.path is not None:
+            try:
+                os.makedirs(self.path.parent, exist_ok=True)
+                return sqlite3.connect(
+                    str(self.path), timeout=10, check_same_thread=False
+                )
+            except (OSError, sqlite3.Error) as e:
+                lgr.warning(
+                    "Could not open S3 version index at %s: %s; using in-memory"
+                    " index",
+                    self.path,
+                    e,
+                )
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def covers(self, host: str, bucket: str, key: str) -> bool:
+        """Whether a current listing (or failed listing) of a prefix
+        containing ``key`` exists"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM listings WHERE host = ? AND bucket = ?"
+                " AND substr(?, 1, length(prefix)) = prefix AND listed >= ?"
+                " UNION ALL"
+                " SELECT 1 FROM misses WHERE host = ? AND bucket = ?"
+                " AND substr(?, 1, length(prefix)) = prefix AND listed >= ?"
+                " LIMIT 1",
+                (
+                    host,
+                    bucket,
+                    key,
+                    now - self.ttl,
+                    host,
+                    bucket,
+                    key,
+                    now - self.negative_ttl,
+                ),
+            ).fetchone()
+        return row is not None
+
+    def store(
+        self, host: str, bucket: str, prefix: str, versions: Iterable[dict[str, Any]]
+    ) -> None:
+        """Replace the indexed versions under ``prefix`` with ``versions``
+        (as returned by `DatasetAdapter._list_s3_versions()`)"""
+        rows = [
+            (
+                host,
+                bucket,
+                v["Key"],
+                v["VersionId"],
+                v["Size"],
+                v["ETag"],
+                int(v["IsLatest"]),
+            )
+            for v in versions
+        ]
+        lgr.debug(
+            "Indexing %d object versions under s3://%s/%s at %s",
+            len(rows),
+            bucket,
+            prefix,
+            host,
+        )
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    "DELETE FROM versions WHERE host = ? AND bucket = ?"
+                    " AND substr(key, 1, ?) = ?",
+                    (host, bucket, len(prefix), prefix),
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO versions"
+                    " (host, bucket, key, version_id, size, etag, is_latest)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO listings (host, bucket, prefix, listed)"
+                    " VALUES (?, ?, ?, ?)",
+                    (host, bucket, prefix, time.time()),
+                )
+                self._db.execute(
+                    "DELETE FROM misses WHERE host = ? AND bucket = ? AND prefix = ?",
+                    (host, bucket, prefix),
+                )
+        except sqlite3.Error as e:
+            lgr.debug("Failed to index versions under %s: %s", prefix, e)
+
+    def record_miss(self, host: str, bucket: str, prefix: str) -> None:
+        """Record that listing ``prefix`` failed or found no versions, dropping
+        any versions indexed under it"""
+        lgr.debug(
+            "Listing s3://%s/%s at %s found nothing; not listing it again for"
+            " %g seconds",
+            bucket,
+            prefix,
+            host,
+            self.negative_ttl,
+        )
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    "DELETE FROM versions WHERE host = ? AND bucket = ?"
+                    " AND substr(key, 1, ?) = ?",
+                    (host, bucket, len(prefix), prefix),
+                )
+                self._db.execute(
+                    "DELETE FROM listings WHERE host = ? AND bucket = ?"
+                    " AND prefix = ?",
+                    (host, bucket, prefix),
+                )
+                self._db.execute(
+                    "INSERT OR REPLACE INTO misses (host, bucket, prefix, listed)"
+                    " VALUES (?, ?, ?, ?)",
+                    (host, bucket, prefix, time.time()),
+                )
+        except sqlite3.Error as e:
+            lgr.debug("Failed to record missing versions under %s: %s", prefix, e)
+
+    def get_versions(self, host: str, bucket: str, key: str) -> list[dict[str, Any]]:
+        """Return the indexed versions of object ``key`` in the format of
+        `DatasetAdapter._list_s3_versions()`"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, version_id, size, etag, is_latest FROM versions"
+                " WHERE host = ? AND bucket = ? AND key = ?",
+                (host, bucket, key),
+            ).fetchall()
+        return [
+            {
+                "Key": k,
+                "VersionId": vid,
+                "Size": size,
+                "ETag": etag,
+                "IsLatest": bool(latest),
+            }
+            for k, vid, size, etag, latest in rows
+        ]
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM listings")
+            self._db.execute("DELETE FROM misses")
+            self._db.execute("DELETE FROM versions")
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable
+import hashlib
+import logging
+import os
+from pathlib import Path
+import shutil
+from threading import Lock
+from typing import Optional
+
+lgr = logging.getLogger("datalad.fuse.spool")
+
+#: Number of bytes of a spooled object read from the response at a time
+SPOOL_CHUNK_SIZE = 2**20
+
+#: Default total size (in bytes) of the spooled objects kept in a spool
+#: directory
+DEFAULT_SPOOL_SIZE = 10 * 2**30
+
+
+class RangeSupport:
+    """Process-wide record of the hosts that ignore the ``Range`` header of
+    requests, answering them with the complete content instead"""
+
+    def __init__(self) -> None:
+        self._ignoring: set[str] = set()
+        self._lock = Lock()
+
+    def ignores_ranges(self, host: str) -> bool:
+        with self._lock:
+            return host in self._ignoring
+
+    def record_ignored(self, host: str) -> None:
+        with self._lock:
+            if host not in self._ignoring:
+                lgr.info(
+                    "%s does not support range requests; files from it will be"
+                    " downloaded completely",
+                    host,
+                )
+                self._ignoring.add(host)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ignoring.clear()
+
+
+class SpoolError(IOError):
+    """Raised when a download to the spool does not yield the expected
+    number of bytes"""
+
+
+class Spooler:
+    """Directory of complete copies of objects from servers that do not
+    support range requests, so that reads of them at any offset can be
+    served locally.
+
+    Objects are named by their annex key (or URL).  Each object is only
+    downloaded once: concurrent requests for the same object wait for the
+    same download, and a completed download is kept until `clear()` or
+    until it is evicted.  If ``max_size`` is not `None`, then whenever a
+    download completes, the least recently spooled objects are deleted until
+    the objects in the directory total at most ``max_size`` bytes (though
+    the object just downloaded is always kept).
+    """
+
+    def __init__(
+        self, directory: str | Path, max_size: Optional[int] = DEFAULT_SPOOL_SIZE
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_size = max_size
+        # Only accessed from within the fsspec event loop:
+        self._downloads: dict[str, asyncio.Future[Path]] = {}
+
+    def path_for(self, name: str) -> Path:
+        return self.directory / hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+    async def spool(
+        self, name: str, size: int, download: Callable[[Path], Awaitable[None]]
+    ) -> Path:
+        """Return the path to the spooled copy of object ``name``, which is
+        ``size`` bytes long, first calling ``download(path)`` to write it to
+        ``path`` if it is not spooled yet"""
+        path = self.path_for(name)
+        if path.exists() and path.stat().st_size == size:
+            try:
+                # Mark the object as recently used
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            else:
+                return path
+        fut = self._downloads.get(name)
+        if fut is None:
+            fut = asyncio.ensure_future(self._download(path, size, download))
+            self._downloads[name] = fut
+            fut.add_done_callback(lambda _: self._downloads.pop(name, None))
+        else:
+            lgr.debug("%s: waiting for download to spool in progress", name)
+        return await asyncio.shield(fut)
+
+    async def _download(
+        self, path: Path, size: int, download: Callable[[Path], Awaitable[None]]
+    ) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        part = path.with_name(f"{path.name}.{os.getpid()}.part")
+        try:
+            await download(part)
+            if (got := part.stat().st_size) != size:
+                raise SpoolError(f"Downloaded {got} bytes, expected {size}")
+            os.replace(part, path)
+        finally:
+            if part.exists():
+                part.unlink()
+        if self.max_size is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.evict, path)
+        return path
+
+    def evict(self, keep: Optional[Path] = None) -> None:
+        """Delete the least recently spooled objects other than ``keep`` until
+        the objects in the directory total at most ``max_size`` bytes"""
+        if self.max_size is None:
+            return
+        objects = []
+        for p in self.directory.iterdir():
+            if p.suffix == ".part":
+                continue
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            objects.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in objects)
+        for _, size, p in sorted(objects):
+            if total <= self.max_size:
+                break
+            if p == keep:
+                continue
+            lgr.debug("Evicting %s from spool", p.name)
+            p.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+range_support = RangeSupport()
@@ -1,14 +1,20 @@
 from contextlib import contextmanager
-from dataclasses import dataclass
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from dataclasses import dataclass, field
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer,
+    SimpleHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
 import logging
 import multiprocessing
 import os
 import os.path
 from pathlib import Path
 import re
+from threading import Lock, Thread
 import time
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
 
 from datalad.api import Dataset, clone
 import pytest
@@ -223,3 +229,129 @@ def big_url_dataset(tmp_home, tmp_path_factory):  # noqa: U100
     for path, url, _ in BIG_URLS:
         ds.repo.add_url_to_file(path, url, options=["--relaxed"])
     yield (ds, {path: digest for path, _, digest in BIG_URLS})
+
+
+@dataclass
+class RangeServer:
+    """In-process HTTP server with per-path knobs for misbehaving"""
+
+    url: str = ""
+    #: path -> content
+    files: Dict[str, bytes] = field(default_factory=dict)
+    #: path -> seconds to wait before answering
+    delays: Dict[str, float] = field(default_factory=dict)
+    #: paths for which the Range header is ignored
+    no_range: Set[str] = field(default_factory=set)
+    #: paths for which requests for several ranges are answered with a
+    #: multipart/byteranges response rather than the whole content
+    multirange: Set[str] = field(default_factory=set)
+    #: path -> status code to answer with instead of the content
+    errors: Dict[str, int] = field(default_factory=dict)
+    #: path -> extra headers to send with error responses
+    error_headers: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    #: path -> URL or path to redirect to with a 302
+    redirects: Dict[str, str] = field(default_factory=dict)
+    #: (method, path, Range header) of every request received
+    requests: List[Tuple[str, str, Optional[str]]] = field(default_factory=list)
+    lock: Lock = field(default_factory=Lock)
+
+    def count(self, path: str, method: str = "GET") -> int:
+        with self.lock:
+            return sum(1 for m, p, _ in self.requests if (m, p) == (method, path))
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self) -> None:
+        self.respond(body=False)
+
+    def do_GET(self) -> None:
+        self.respond(body=True)
+
+    def respond(self, body: bool) -> None:
+        state: RangeServer = self.server.state  # type: ignore[attr-defined]
+        path = self.path
+        rng = self.headers.get("Range")
+        with state.lock:
+            state.requests.append((self.command, path, rng))
+        if delay := state.delays.get(path):
+            time.sleep(delay)
+        if (location := state.redirects.get(path)) is not None:
+            self.send_response(302)
+            self.send_header("Location", location)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        path = path.partition("?")[0]
+        if (status := state.errors.get(path)) is not None or path not in state.files:
+            self.send_response(status or 404)
+            for k, v in state.error_headers.get(path, {}).items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        content = state.files[path]
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", rng or "")
+        ranges = re.findall(r"(\d+)-(\d+)", rng or "")
+        if path in state.multirange and len(ranges) > 1:
+            boundary = "RANGE_BOUNDARY"
+            parts = []
+            for a, b in ranges:
+                start, last = int(a), min(int(b), len(content) - 1)
+                parts.append(
+                    (
+                        f"--{boundary}\r\n"
+                        f"Content-Range: bytes {start}-{last}/{len(content)}\r\n"
+                        "\r\n"
+                    ).encode()
+                    + content[start : last + 1]
+                    + b"\r\n"
+                )
+            self.send_response(206)
+            self.send_header(
+                "Content-Type", f"multipart/byteranges; boundary={boundary}"
+            )
+            data = b"".join(parts) + f"--{boundary}--\r\n".encode()
+        elif m and path not in state.no_range:
+            start = int(m[1])
+            end = min(int(m[2]) + 1 if m[2] else len(content), len(content))
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(content)}")
+            data = content[start:end]
+        else:
+            self.send_response(200)
+            data = content
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if body:
+            try:
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    def log_message(self, *_args) -> None:
+        pass
+
+
+@pytest.fixture
+def range_server():
+    state = RangeServer()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeRequestHandler)
+    httpd.daemon_threads = True
+    httpd.state = state  # type: ignore[attr-defined]
+    thread = Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    state.url = f"http://127.0.0.1:{httpd.server_port}"  # noqa: E231
+    try:
+        yield state
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
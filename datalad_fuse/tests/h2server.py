@@ -0,0 +1,201 @@
+"""
+Minimal HTTP/2 server (cleartext, prior knowledge) serving in-memory files
+with support for range requests, for testing and benchmarking the HTTP/2
+transport.  Requires the ``h2`` package.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import re
+from threading import Lock, Thread
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import (
+    ConnectionTerminated,
+    RequestReceived,
+    StreamEnded,
+    StreamReset,
+    WindowUpdated,
+)
+from h2.exceptions import ProtocolError
+
+
+@dataclass
+class H2Server:
+    url: str = ""
+    #: path -> content
+    files: Dict[str, bytes] = field(default_factory=dict)
+    #: path -> seconds to wait before answering
+    delays: Dict[str, float] = field(default_factory=dict)
+    #: (method, path, Range header) of every request received
+    requests: List[Tuple[str, str, Optional[str]]] = field(default_factory=list)
+    #: Number of connections accepted
+    connections: int = 0
+    lock: Lock = field(default_factory=Lock)
+
+
+class H2Protocol(asyncio.Protocol):
+    def __init__(self, state: H2Server) -> None:
+        self.state = state
+        self.conn = H2Connection(
+            config=H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        self.transport: Optional[asyncio.Transport] = None
+        self.headers: Dict[int, Dict[str, str]] = {}
+        #: stream ID -> response body not yet sent due to flow control
+        self.pending: Dict[int, memoryview] = {}
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        assert isinstance(transport, asyncio.Transport)
+        self.transport = transport
+        with self.state.lock:
+            self.state.connections += 1
+        self.conn.initiate_connection()
+        self.flush()
+
+    def data_received(self, data: bytes) -> None:
+        try:
+            events = self.conn.receive_data(data)
+        except ProtocolError:
+            self.flush()
+            assert self.transport is not None
+            self.transport.close()
+            return
+        for ev in events:
+            if isinstance(ev, RequestReceived):
+                self.headers[ev.stream_id] = dict(ev.headers)
+            elif isinstance(ev, StreamEnded):
+                if (headers := self.headers.pop(ev.stream_id, None)) is not None:
+                    self.handle(ev.stream_id, headers)
+            elif isinstance(ev, WindowUpdated):
+                if ev.stream_id == 0:
+                    for stream_id in list(self.pending):
+                        self.send_pending(stream_id)
+                else:
+                    self.send_pending(ev.stream_id)
+            elif isinstance(ev, StreamReset):
+                self.pending.pop(ev.stream_id, None)
+            elif isinstance(ev, ConnectionTerminated):
+                assert self.transport is not None
+                self.transport.close()
+        self.flush()
+
+    def flush(self) -> None:
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(self.conn.data_to_send())
+
+    def handle(self, stream_id: int, headers: Dict[str, str]) -> None:
+        method = headers[":method"]
+        path = headers[":path"]
+        rng = headers.get("range")
+        with self.state.lock:
+            self.state.requests.append((method, path, rng))
+        if delay := self.state.delays.get(path):
+            asyncio.get_running_loop().call_later(
+                delay, self.respond, stream_id, method, path, rng
+            )
+        else:
+            self.respond(stream_id, method, path, rng)
+
+    def respond(
+        self, stream_id: int, method: str, path: str, rng: Optional[str]
+    ) -> None:
+        if self.transport is None or self.transport.is_closing():
+            return
+        content = self.state.files.get(path)
+        if content is None:
+            self.send(stream_id, 404, [], b"", method)
+            return
+        m = re.fullmatch(r"bytes=(\d+)-(\d*)", rng or "")
+        if m:
+            start = int(m[1])
+            end = min(int(m[2]) + 1 if m[2] else len(content), len(content))
+            if start >= len(content):
+                self.send(
+                    stream_id,
+                    416,
+                    [("content-range", f"bytes */{len(content)}")],
+                    b"",
+                    method,
+                )
+                return
+            self.send(
+                stream_id,
+                206,
+                [("content-range", f"bytes {start}-{end - 1}/{len(content)}")],
+                content[start:end],
+                method,
+            )
+        else:
+            self.send(stream_id, 200, [], content, method)
+
+    def send(
+        self,
+        stream_id: int,
+        status: int,
+        headers: List[Tuple[str, str]],
+        body: bytes,
+        method: str,
+    ) -> None:
+        try:
+            self.conn.send_headers(
+                stream_id,
+                [
+                    (":status", str(status)),
+                    ("content-length", str(len(body))),
+                    ("accept-ranges", "bytes"),
+                    *headers,
+                ],
+                end_stream=method == "HEAD" or not body,
+            )
+        except ProtocolError:
+            # The stream was reset in the meantime
+            return
+        if method != "HEAD" and body:
+            self.pending[stream_id] = memoryview(body)
+            self.send_pending(stream_id)
+        self.flush()
+
+    def send_pending(self, stream_id: int) -> None:
+        data = self.pending.get(stream_id)
+        while data is not None:
+            size = min(
+                self.conn.local_flow_control_window(stream_id),
+                self.conn.max_outbound_frame_size,
+                len(data),
+            )
+            if size <= 0:
+                self.pending[stream_id] = data
+                return
+            chunk, data = data[:size], data[size:]
+            self.conn.send_data(stream_id, bytes(chunk), end_stream=not data)
+            if not data:
+                del self.pending[stream_id]
+                data = None
+        self.flush()
+
+
+@contextmanager
+def h2_server() -> Iterator[H2Server]:
+    """Run an `H2Server` on a local port in a background thread"""
+    state = H2Server()
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        loop.create_server(lambda: H2Protocol(state), "127.0.0.1", 0)
+    )
+    port = server.sockets[0].getsockname()[1]
+    state.url = f"http://127.0.0.1:{port}"  # noqa: E231
+    thread = Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield state
+    finally:
+        loop.call_soon_threadsafe(server.close)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
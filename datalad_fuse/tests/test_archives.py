@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import io
+import os
+from pathlib import Path
+import re
+import tarfile
+from typing import Optional
+import zipfile
+
+from datalad.api import Dataset
+import pytest
+
+from datalad_fuse.archives import (
+    ArchiveIndex,
+    ArchiveMember,
+    open_member,
+    parse_archive_url,
+)
+from datalad_fuse.fsspec import DatasetAdapter, FileState, get_client
+from datalad_fuse.httpfile import AnnexHTTPFileSystem
+
+MEMBERS = {
+    "dir/small.txt": b"This is a small member.\n",
+    "dir/large.bin": os.urandom(2**20 + 17),
+    "other.bin": os.urandom(3 * 2**20),
+}
+
+
+def make_tar(mode: str = "w") -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode=mode) as tf:  # type: ignore[call-overload]
+        for path, content in MEMBERS.items():
+            ti = tarfile.TarInfo(path)
+            ti.size = len(content)
+            tf.addfile(ti, io.BytesIO(content))
+    return buf.getvalue()
+
+
+def make_zip(compression: int = zipfile.ZIP_STORED) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=compression) as zf:
+        for path, content in MEMBERS.items():
+            zf.writestr(path, content)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        (
+            "dl+archive:MD5E-s1024--abc.tar.gz#path=dir/a%20b.txt&size=12",
+            ArchiveMember("MD5E-s1024--abc.tar.gz", "dir/a b.txt", 12),
+        ),
+        (
+            "dl+archive:MD5E-s1024--abc.zip#path=a.txt",
+            ArchiveMember("MD5E-s1024--abc.zip", "a.txt", None),
+        ),
+        (
+            "dl+archive:MD5E-s1024--abc.zip#a.txt",
+            ArchiveMember("MD5E-s1024--abc.zip", "a.txt", None),
+        ),
+    ],
+)
+def test_parse_archive_url(url: str, expected: ArchiveMember) -> None:
+    assert parse_archive_url(url) == expected
+
+
+@pytest.mark.parametrize(
+    "url", ["http://example.com/a.zip", "dl+archive:#path=a.txt", "dl+archive:K#"]
+)
+def test_parse_archive_url_invalid(url: str) -> None:
+    with pytest.raises(ValueError):
+        parse_archive_url(url)
+
+
+@pytest.mark.parametrize(
+    "archive,fmt",
+    [
+        (make_tar(), "tar"),
+        (make_tar("w:gz"), "compressed"),
+        (make_zip(), "zip"),
+        (make_zip(zipfile.ZIP_DEFLATED), "zip"),
+    ],
+)
+def test_open_member(archive: bytes, fmt: str) -> None:
+    index = ArchiveIndex(None)
+    for _ in range(2):
+        for path, content in MEMBERS.items():
+            member = ArchiveMember("KEY", path)
+            with open_member(io.BytesIO(archive), member, index, path) as f:
+                assert f.size == len(content)
+                assert f.read() == content
+                f.seek(len(content) // 2)
+                assert f.read(10) == content[len(content) // 2 :][:10]
+                f.seek(3)
+                assert f.read(10) == content[3:13]
+        assert index.get_format("KEY") == fmt
+    with pytest.raises(FileNotFoundError):
+        open_member(io.BytesIO(archive), ArchiveMember("KEY", "nonexistent"), index, "")
+
+
+@pytest.mark.parametrize("archive", [make_tar(), make_zip()], ids=["tar", "zip"])
+def test_member_read_is_ranged(range_server, archive: bytes) -> None:
+    fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    range_server.files["/archive"] = archive
+    index = ArchiveIndex(None)
+    content = MEMBERS["dir/large.bin"]
+    for _ in range(2):
+        f = fs.open(f"{range_server.url}/archive", size=len(archive), block_size=2**16)
+        with open_member(f, ArchiveMember("KEY", "dir/large.bin"), index, "") as fp:
+            fp.seek(2**20)
+            assert fp.read() == content[2**20 :]
+    fetched = 0
+    for method, _, rng in range_server.requests:
+        assert method == "GET"
+        m = re.fullmatch(r"bytes=(\d+)-(\d+)", rng or "")
+        assert m is not None
+        fetched += int(m[2]) - int(m[1]) + 1
+    # Only the headers/directory and the tail of the member were read
+    assert fetched < 2**20
+
+
+def test_open_via_archive_url(
+    range_server, tmp_path: Path, tmp_home: Path  # noqa: U100
+) -> None:
+    ds = Dataset(tmp_path / "ds").create()
+    archive = make_tar()
+    (ds.pathobj / "archive.tar").write_bytes(archive)
+    (ds.pathobj / "small.txt").write_bytes(MEMBERS["dir/small.txt"])
+    (ds.pathobj / "large.bin").write_bytes(MEMBERS["dir/large.bin"])
+    ds.save(message="Add data")
+    archive_key = ds.repo.call_annex_oneline(["lookupkey", "archive.tar"])
+    ds.repo.call_annex(["registerurl", archive_key, f"{range_server.url}/a.tar"])
+    range_server.files["/a.tar"] = archive
+    for fname, member in [
+        ("small.txt", "dir/small.txt"),
+        ("large.bin", "dir/large.bin"),
+    ]:
+        key = ds.repo.call_annex_oneline(["lookupkey", fname])
+        url = f"dl+archive:{archive_key}#path={member}&size={len(MEMBERS[member])}"
+        ds.repo.call_annex(["registerurl", key, url])
+    ds.repo.call_annex(["drop", "--force", "archive.tar", "small.txt", "large.bin"])
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        assert dsap.get_file_state("small.txt")[0] is FileState.NO_CONTENT
+        with dsap.open("small.txt", mode="r") as fp:
+            assert fp.read() == MEMBERS["dir/small.txt"].decode()
+        with dsap.open("large.bin") as fp:
+            fp.seek(1000)
+            assert fp.read(1000) == MEMBERS["dir/large.bin"][1000:2000]
+        assert dsap.archive_index.get_member(archive_key, "dir/large.bin") is not None
+    finally:
+        dsap.close()
+
+
+def test_open_via_compressed_archive_url(
+    range_server, tmp_path: Path, tmp_home: Path  # noqa: U100
+) -> None:
+    ds = Dataset(tmp_path / "ds").create()
+    archive = make_tar("w:gz")
+    (ds.pathobj / "archive.tar.gz").write_bytes(archive)
+    (ds.pathobj / "large.bin").write_bytes(MEMBERS["dir/large.bin"])
+    ds.save(message="Add data")
+    archive_key = ds.repo.call_annex_oneline(["lookupkey", "archive.tar.gz"])
+    ds.repo.call_annex(["registerurl", archive_key, f"{range_server.url}/a.tgz"])
+    range_server.files["/a.tgz"] = archive
+    key = ds.repo.call_annex_oneline(["lookupkey", "large.bin"])
+    ds.repo.call_annex(
+        ["registerurl", key, f"dl+archive:{archive_key}#path=dir/large.bin"]
+    )
+    ds.repo.call_annex(["drop", "--force", "archive.tar.gz", "large.bin"])
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        with dsap.open("large.bin") as fp:
+            fp.seek(2**20)
+            assert fp.read() == MEMBERS["dir/large.bin"][2**20 :]
+            fp.seek(1000)
+            assert fp.read(1000) == MEMBERS["dir/large.bin"][1000:2000]
+        assert dsap.archive_index.get_format(archive_key) == "compressed"
+        assert dsap.spooler.path_for(archive_key).read_bytes() == archive
+    finally:
+        dsap.close()
+    # The archive was downloaded once rather than read with range requests
+    # (besides the first block, which is fetched on opening):
+    assert [rng for _, p, rng in range_server.requests if p == "/a.tgz"][1:] == [None]
+
+
+def test_archive_index_persistence(tmp_path: Path) -> None:
+    path = tmp_path / "archives.sqlite"
+    index = ArchiveIndex(path)
+    index.store("KEY", "tar", [("a.txt", 512, 10)])
+    index.close()
+    index = ArchiveIndex(path)
+    assert index.get_format("KEY") == "tar"
+    assert index.get_member("KEY", "a.txt") == (512, 10)
+    member: Optional[tuple[int, int]] = index.get_member("KEY", "b.txt")
+    assert member is None
+    index.close()
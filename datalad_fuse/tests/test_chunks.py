@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import io
+import os
+from pathlib import Path
+import shutil
+from threading import Lock
+import time
+from typing import IO, Optional
+
+from datalad.api import Dataset
+import pytest
+
+from datalad_fuse.chunks import ChunkedFile, ChunkLayout, parse_chunk_log
+from datalad_fuse.fsspec import DatasetAdapter, FileState
+from datalad_fuse.utils import AnnexKey
+
+CONTENT = os.urandom(300_000)
+
+CHUNK_SIZE = 65536
+
+
+def test_parse_chunk_log() -> None:
+    log = (
+        "1600000000s aaaa:1024 10\n"
+        "1600000100s aaaa:1024 0\n"
+        "1600000050s aaaa:2048 5\n"
+        "1600000200s bbbb:4096 3\n"
+        "1600000300s bbbb:8192 2\n"
+        "garbage\n"
+    )
+    assert parse_chunk_log(log) == {
+        "aaaa": [ChunkLayout(2048, 5)],
+        "bbbb": [ChunkLayout(8192, 2), ChunkLayout(4096, 3)],
+    }
+
+
+@pytest.mark.parametrize(
+    "key,size",
+    [
+        ("MD5E-s300000--0123456789abcdef.bin", 300000),
+        ("MD5E-s300000-S65536-C1--0123456789abcdef.bin", 65536),
+        ("MD5E-s300000-S65536-C5--0123456789abcdef.bin", 300000 - 4 * 65536),
+        ("MD5E--0123456789abcdef.bin", None),
+    ],
+)
+def test_content_size(key: str, size: Optional[int]) -> None:
+    assert AnnexKey.parse(key).content_size == size
+
+
+def test_chunked_file_reads() -> None:
+    opened = []
+    lock = Lock()
+
+    def open_chunk(number: int) -> IO[bytes]:
+        with lock:
+            opened.append(number)
+        start = (number - 1) * CHUNK_SIZE
+        return io.BytesIO(CONTENT[start : start + CHUNK_SIZE])
+
+    with ChunkedFile(len(CONTENT), CHUNK_SIZE, open_chunk, "test") as f:
+        assert f.chunk_count == 5
+        f.seek(CHUNK_SIZE - 10)
+        assert f.read(20) == CONTENT[CHUNK_SIZE - 10 : CHUNK_SIZE + 10]
+        f.seek(1000)
+        assert f.read(3 * CHUNK_SIZE) == CONTENT[1000 : 1000 + 3 * CHUNK_SIZE]
+        f.seek(len(CONTENT) - 5)
+        assert f.read(100) == CONTENT[-5:]
+        assert f.read(100) == b""
+        f.seek(0)
+        assert f.read() == CONTENT
+    # Each chunk was opened only once, despite prefetching
+    assert sorted(opened) == [1, 2, 3, 4, 5]
+
+
+def test_chunked_file_short_chunk() -> None:
+    def open_chunk(_number: int) -> IO[bytes]:
+        return io.BytesIO(b"x" * 10)
+
+    with ChunkedFile(len(CONTENT), CHUNK_SIZE, open_chunk, "test") as f:
+        with pytest.raises(OSError):
+            f.read(100)
+
+
+def test_chunked_file_prefetches_one_chunk() -> None:
+    opened = []
+    lock = Lock()
+
+    def open_chunk(number: int) -> IO[bytes]:
+        with lock:
+            opened.append(number)
+        return io.BytesIO(b"x" * 10)
+
+    with ChunkedFile(10 * 1000, 10, open_chunk, "test") as f:
+        assert f.read(5) == b"x" * 5
+        time.sleep(0.5)
+        # Only the chunk read and the next one were opened:
+        assert sorted(opened) == [1, 2]
+
+
+def test_chunked_file_closes_old_chunks() -> None:
+    files: dict[int, io.BytesIO] = {}
+
+    def open_chunk(number: int) -> IO[bytes]:
+        start = (number - 1) * 1000
+        f = files[number] = io.BytesIO(CONTENT[start : start + 1000])
+        return f
+
+    with ChunkedFile(len(CONTENT), 1000, open_chunk, "test", max_open=3) as f:
+        assert f.read(20_000) == CONTENT[:20_000]
+        # Let the last prefetch finish:
+        time.sleep(0.5)
+        assert len(f._chunks) <= 3
+        assert sum(1 for fp in files.values() if not fp.closed) <= 3
+        f.seek(0)
+        assert f.read(10) == CONTENT[:10]
+    assert all(fp.closed for fp in files.values())
+
+
+@pytest.fixture
+def chunked_dataset(tmp_path: Path, tmp_home: Path) -> Dataset:  # noqa: U100
+    ds = Dataset(tmp_path / "ds").create()
+    (ds.pathobj / "data.bin").write_bytes(CONTENT)
+    ds.save(message="Add data")
+    directory = tmp_path / "directory-remote"
+    directory.mkdir()
+    ds.repo.call_annex(
+        [
+            "initremote",
+            "dirremote",
+            "type=directory",
+            f"directory={directory}",
+            "encryption=none",
+            "chunk=64KiB",
+        ]
+    )
+    ds.repo.call_annex(["copy", "--to", "dirremote", "data.bin"])
+    ds.repo.call_annex(["drop", "data.bin"])
+    return ds
+
+
+def test_open_chunked_local(chunked_dataset: Dataset) -> None:
+    dsap = DatasetAdapter(chunked_dataset.path, caching=False)
+    try:
+        assert dsap.get_file_state("data.bin")[0] is FileState.NO_CONTENT
+        with dsap.open("data.bin") as fp:
+            assert isinstance(fp, ChunkedFile)
+            fp.seek(CHUNK_SIZE - 100)
+            assert fp.read(200) == CONTENT[CHUNK_SIZE - 100 : CHUNK_SIZE + 100]
+            fp.seek(0)
+            assert fp.read() == CONTENT
+    finally:
+        dsap.close()
+
+
+def test_open_chunked_http(
+    chunked_dataset: Dataset, range_server, tmp_path: Path
+) -> None:
+    ds = chunked_dataset
+    directory = tmp_path / "directory-remote"
+    ds.repo.call_annex(
+        [
+            "initremote",
+            "httpmirror",
+            "--sameas=dirremote",
+            "type=httpalso",
+            f"url={range_server.url}/mirror/",
+        ]
+    )
+    for p in directory.rglob("*"):
+        if p.is_file():
+            range_server.files[f"/mirror/{p.relative_to(directory).as_posix()}"] = (
+                p.read_bytes()
+            )
+    # Make sure the chunks can only be obtained over HTTP
+    shutil.rmtree(directory)
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        with dsap.open("data.bin") as fp:
+            assert isinstance(fp, ChunkedFile)
+            fp.seek(CHUNK_SIZE * 2 - 100)
+            assert fp.read(CHUNK_SIZE) == CONTENT[CHUNK_SIZE * 2 - 100 :][:CHUNK_SIZE]
+            fp.seek(0)
+            assert fp.read() == CONTENT
+    finally:
+        dsap.close()
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import pytest
+
+from datalad_fuse.coalesce import (
+    MultipartError,
+    extract_range,
+    merge_ranges,
+    multirange_support,
+    parse_byteranges,
+    split_groups,
+)
+from datalad_fuse.fsspec import get_client
+from datalad_fuse.httpfile import AnnexHTTPFile, AnnexHTTPFileSystem
+
+CONTENT = os.urandom(4 * 2**20)
+
+
+@pytest.fixture
+def fs() -> AnnexHTTPFileSystem:
+    return AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+
+
+@pytest.fixture(autouse=True)
+def clean_multirange_support():
+    multirange_support.clear()
+    yield
+    multirange_support.clear()
+
+
+def test_merge_ranges() -> None:
+    ranges = [(300, 400), (0, 100), (150, 200), (1000, 1100), (50, 120)]
+    groups = merge_ranges(ranges, 50)
+    assert [(g.start, g.end, g.members) for g in groups] == [
+        (0, 200, [1, 4, 2]),
+        (300, 400, [0]),
+        (1000, 1100, [3]),
+    ]
+    datas = [CONTENT[g.start : g.end] for g in groups]
+    assert split_groups(ranges, groups, datas) == [CONTENT[s:e] for s, e in ranges]
+
+
+def test_parse_byteranges() -> None:
+    body = (
+        b"\r\n--SEP\r\nContent-Type: text/plain\r\n"
+        b"Content-Range: bytes 0-4/100\r\n\r\nhello\r\n"
+        b"--SEP\r\ncontent-range: bytes 50-59/100\r\n\r\n--SEP--ish\r\n"
+        b"--SEP--\r\n"
+    )
+    parts = parse_byteranges(body, "SEP")
+    assert parts == {0: b"hello", 50: b"--SEP--ish"}
+    assert extract_range(parts, 1, 3) == b"el"
+    assert extract_range(parts, 55, 60) == b"--ish"
+    with pytest.raises(MultipartError):
+        extract_range(parts, 3, 7)
+    with pytest.raises(MultipartError):
+        parse_byteranges(body[:70], "SEP")
+
+
+def concurrent_preads(fp: AnnexHTTPFile, offsets: list[int], size: int) -> list[bytes]:
+    assert fp.coalescer is not None
+    # Make sure that all reads arrive within one window:
+    fp.coalescer.window = 0.2
+    with ThreadPoolExecutor(max_workers=len(offsets)) as pool:
+        return list(pool.map(lambda o: fp.pread(o, size), offsets))
+
+
+def test_nearby_reads_merged(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    offsets = [i * 8192 for i in range(8)]
+    with fs.open(
+        f"{range_server.url}/a", size=len(CONTENT), block_size=2**20, coalesce_gap=8192
+    ) as fp:
+        datas = concurrent_preads(fp, offsets, 4096)
+    assert datas == [CONTENT[o : o + 4096] for o in offsets]
+    assert range_server.requests == [("GET", "/a", "bytes=0-61439")]
+
+
+def test_distant_reads_multirange(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    range_server.multirange.add("/a")
+    offsets = [i * 2**19 for i in range(8)]
+    with fs.open(
+        f"{range_server.url}/a", size=len(CONTENT), block_size=2**20, coalesce_gap=0
+    ) as fp:
+        datas = concurrent_preads(fp, offsets, 100)
+    assert datas == [CONTENT[o : o + 100] for o in offsets]
+    assert range_server.count("/a") == 1
+    assert multirange_support.get(range_server.url) is True
+
+
+def test_multirange_unsupported(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    offsets = [i * 2**19 for i in range(4)]
+    with fs.open(
+        f"{range_server.url}/a", size=len(CONTENT), block_size=2**20, coalesce_gap=0
+    ) as fp:
+        datas = concurrent_preads(fp, offsets, 100)
+        assert datas == [CONTENT[o : o + 100] for o in offsets]
+        # One multi-range request answered with the whole file, then one
+        # request per range:
+        assert range_server.count("/a") == 1 + len(offsets)
+        assert multirange_support.get(range_server.url) is False
+        datas = concurrent_preads(fp, [o + 1 for o in offsets], 100)
+        assert datas == [CONTENT[o + 1 : o + 101] for o in offsets]
+        assert range_server.count("/a") == 1 + 2 * len(offsets)
+
+
+def test_pread_past_eof(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    with fs.open(
+        f"{range_server.url}/a", size=len(CONTENT), block_size=2**20, coalesce_gap=0
+    ) as fp:
+        assert fp.pread(len(CONTENT) - 10, 100) == CONTENT[-10:]
+        assert fp.pread(len(CONTENT), 100) == b""
+    assert range_server.count("/a") == 1
+
+
+def test_pread_from_block_cache(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    with fs.open(
+        f"{range_server.url}/a", size=len(CONTENT), block_size=2**20, coalesce_gap=0
+    ) as fp:
+        assert fp.read(100) == CONTENT[:100]
+        for offset in [8192, 1000, 16384, 4096]:
+            assert fp.pread(offset, 4096) == CONTENT[offset : offset + 4096]
+    assert range_server.count("/a") == 1
@@ -3,6 +3,7 @@
 Tests cover:
 - remote.log parsing (_get_exporttree_remotes)
 - S3 version listing via boto3 (_list_s3_versions)
+- S3 version index lookups (_get_s3_versions)
 - Version matching by size (_match_s3_version)
 - URL construction (get_exporttree_urls)
 """
@@ -14,6 +15,8 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 from datalad_fuse.fsspec import DatasetAdapter
+from datalad_fuse.s3 import S3Resolver
+from datalad_fuse.s3index import S3VersionIndex
 from datalad_fuse.utils import AnnexKey
 
 
@@ -49,6 +52,9 @@ def adapter():
     da.path = "/fake/dataset"
     da.annex = None
     da.caching = False
+    da.s3_index = S3VersionIndex(None)
+    da.s3_index_scope = "prefix"
+    da.offline = False
     return da
 
 
@@ -94,6 +100,18 @@ def test_get_exporttree_remotes_git_failure(adapter):
 # --- S3 version listing (boto3) ---
 
 
+@pytest.fixture(autouse=True)
+def fresh_s3_clients(monkeypatch):
+    """Keep pooled boto3 clients (possibly mocks) from leaking between tests."""
+    monkeypatch.setattr(S3Resolver, "_clients", {})
+
+
+def mock_paginating_client(*pages):
+    client = MagicMock()
+    client.get_paginator.return_value.paginate.return_value = list(pages)
+    return client
+
+
 SAMPLE_BOTO3_VERSIONS_RESPONSE = {
     "Versions": [
         {
@@ -125,8 +143,7 @@ SAMPLE_BOTO3_VERSIONS_RESPONSE = {
 @pytest.mark.ai_generated
 def test_list_s3_versions_parsing():
     """Parse boto3 list_object_versions response correctly."""
-    mock_client = MagicMock()
-    mock_client.list_object_versions.return_value = SAMPLE_BOTO3_VERSIONS_RESPONSE
+    mock_client = mock_paginating_client(SAMPLE_BOTO3_VERSIONS_RESPONSE)
 
     with patch("boto3.client", return_value=mock_client):
         versions = DatasetAdapter._list_s3_versions(
@@ -134,20 +151,54 @@ def test_list_s3_versions_parsing():
             "ds000113/sub-01/anat/sub-01_T1w.nii.gz",
         )
 
-    # Should have 2 versions (the .bak key is filtered out)
-    assert len(versions) == 2
+    mock_client.get_paginator.assert_called_once_with("list_object_versions")
+    # All versions under the prefix are listed, including the .bak key
+    assert len(versions) == 3
+    assert versions[0]["Key"] == "ds000113/sub-01/anat/sub-01_T1w.nii.gz"
     assert versions[0]["VersionId"] == "abc123"
     assert versions[0]["Size"] == 12345678
     assert versions[0]["IsLatest"] is True
     assert versions[1]["VersionId"] == "def456"
     assert versions[1]["Size"] == 9999999
+    assert versions[2]["Key"] == "ds000113/sub-01/anat/sub-01_T1w.nii.gz.bak"
+
+
+@pytest.mark.ai_generated
+def test_list_s3_versions_paginated():
+    """Versions from all pages of the listing are returned."""
+    mock_client = mock_paginating_client(
+        {"Versions": SAMPLE_BOTO3_VERSIONS_RESPONSE["Versions"][:2]},
+        {"Versions": SAMPLE_BOTO3_VERSIONS_RESPONSE["Versions"][2:]},
+    )
+
+    with patch("boto3.client", return_value=mock_client):
+        versions = DatasetAdapter._list_s3_versions("openneuro.org", "ds000113/")
+
+    mock_client.get_paginator.return_value.paginate.assert_called_once_with(
+        Bucket="openneuro.org", Prefix="ds000113/"
+    )
+    assert [v["VersionId"] for v in versions] == ["abc123", "def456", "ignored"]
+
+
+@pytest.mark.ai_generated
+def test_list_s3_versions_client_pooled():
+    """One boto3 client is created per host and reused."""
+    mock_client = mock_paginating_client()
+
+    with patch("boto3.client", return_value=mock_client) as mock_factory:
+        DatasetAdapter._list_s3_versions("openneuro.org", "ds000113/")
+        DatasetAdapter._list_s3_versions("openneuro.org", "ds000114/")
+
+    assert mock_factory.call_count == 1
 
 
 @pytest.mark.ai_generated
 def test_list_s3_versions_network_error():
     """Graceful handling of network errors."""
     mock_client = MagicMock()
-    mock_client.list_object_versions.side_effect = Exception("timeout")
+    mock_client.get_paginator.return_value.paginate.side_effect = Exception(
+        "timeout"
+    )
 
     with patch("boto3.client", return_value=mock_client):
         versions = DatasetAdapter._list_s3_versions(
@@ -161,8 +212,7 @@ def test_list_s3_versions_network_error():
 @pytest.mark.ai_generated
 def test_list_s3_versions_custom_host():
     """Verify custom S3 endpoint host is used."""
-    mock_client = MagicMock()
-    mock_client.list_object_versions.return_value = {"Versions": []}
+    mock_client = mock_paginating_client({"Versions": []})
 
     with patch("boto3.client", return_value=mock_client) as mock_factory:
         DatasetAdapter._list_s3_versions(
@@ -175,6 +225,153 @@ def test_list_s3_versions_custom_host():
     assert call_kwargs[1]["endpoint_url"] == "https://storage.googleapis.com"
 
 
+# --- Version index ---
+
+
+INDEXED_VERSIONS = [
+    {
+        "Key": "ds000113/sub-01/anat/sub-01_T1w.nii.gz",
+        "VersionId": "abc123",
+        "Size": 12345678,
+        "ETag": '"aaa"',
+        "IsLatest": True,
+    },
+    {
+        "Key": "ds000113/sub-02/anat/sub-02_T1w.nii.gz",
+        "VersionId": "def456",
+        "Size": 100,
+        "ETag": '"bbb"',
+        "IsLatest": True,
+    },
+]
+
+
+@pytest.mark.ai_generated
+def test_get_s3_versions_lists_prefix_once(adapter):
+    """The whole fileprefix is listed once and reused for other keys."""
+    with patch.object(
+        DatasetAdapter, "_list_s3_versions", return_value=INDEXED_VERSIONS
+    ) as mock_list:
+        v1 = adapter._get_s3_versions(
+            "openneuro.org",
+            "ds000113/sub-01/anat/sub-01_T1w.nii.gz",
+            "ds000113/",
+            "s3.amazonaws.com",
+        )
+        v2 = adapter._get_s3_versions(
+            "openneuro.org",
+            "ds000113/sub-02/anat/sub-02_T1w.nii.gz",
+            "ds000113/",
+            "s3.amazonaws.com",
+        )
+        v3 = adapter._get_s3_versions(
+            "openneuro.org",
+            "ds000113/sub-03/anat/sub-03_T1w.nii.gz",
+            "ds000113/",
+            "s3.amazonaws.com",
+        )
+
+    mock_list.assert_called_once_with(
+        "openneuro.org", "ds000113/", "s3.amazonaws.com"
+    )
+    assert [v["VersionId"] for v in v1] == ["abc123"]
+    assert [v["VersionId"] for v in v2] == ["def456"]
+    assert v3 == []
+
+
+@pytest.mark.ai_generated
+def test_get_s3_versions_directory_scope(adapter):
+    """With directory scope, only the object's directory is listed."""
+    adapter.s3_index_scope = "directory"
+    with patch.object(
+        DatasetAdapter, "_list_s3_versions", return_value=INDEXED_VERSIONS[:1]
+    ) as mock_list:
+        adapter._get_s3_versions(
+            "openneuro.org",
+            "ds000113/sub-01/anat/sub-01_T1w.nii.gz",
+            "ds000113/",
+            "s3.amazonaws.com",
+        )
+        adapter._get_s3_versions(
+            "openneuro.org",
+            "ds000113/sub-02/anat/sub-02_T1w.nii.gz",
+            "ds000113/",
+            "s3.amazonaws.com",
+        )
+
+    assert [c.args[1] for c in mock_list.call_args_list] == [
+        "ds000113/sub-01/anat/",
+        "ds000113/sub-02/anat/",
+    ]
+
+
+@pytest.mark.ai_generated
+def test_get_s3_versions_listing_failure_cached(adapter):
+    """A failed listing is not retried until the negative TTL expires."""
+    with patch.object(DatasetAdapter, "_list_s3_versions", return_value=[]) as m:
+        for _ in range(2):
+            assert (
+                adapter._get_s3_versions(
+                    "openneuro.org",
+                    "ds000113/sub-01/anat/sub-01_T1w.nii.gz",
+                    "ds000113/",
+                    "s3.amazonaws.com",
+                )
+                == []
+            )
+        assert m.call_count == 1
+        adapter.s3_index.negative_ttl = -1
+        adapter._get_s3_versions(
+            "openneuro.org",
+            "ds000113/sub-01/anat/sub-01_T1w.nii.gz",
+            "ds000113/",
+            "s3.amazonaws.com",
+        )
+        assert m.call_count == 2
+
+
+@pytest.mark.ai_generated
+def test_s3_version_index_persistence(tmp_path):
+    """Indexed versions survive reopening and expire with the TTL."""
+    path = tmp_path / "s3versions.sqlite"
+    index = S3VersionIndex(path)
+    index.store("s3.amazonaws.com", "openneuro.org", "ds000113/", INDEXED_VERSIONS)
+    index.close()
+
+    index = S3VersionIndex(path)
+    key = "ds000113/sub-02/anat/sub-02_T1w.nii.gz"
+    assert index.covers("s3.amazonaws.com", "openneuro.org", key)
+    assert not index.covers("s3.amazonaws.com", "openneuro.org", "ds000114/x")
+    assert index.get_versions("s3.amazonaws.com", "openneuro.org", key) == [
+        INDEXED_VERSIONS[1]
+    ]
+    index.close()
+
+    index = S3VersionIndex(path, ttl=-1)
+    assert not index.covers("s3.amazonaws.com", "openneuro.org", key)
+    index.close()
+
+
+@pytest.mark.ai_generated
+def test_s3_version_index_miss(tmp_path):
+    """A failed listing replaces the versions under its prefix until a new
+    listing succeeds."""
+    index = S3VersionIndex(tmp_path / "s3versions.sqlite")
+    key = "ds000113/sub-02/anat/sub-02_T1w.nii.gz"
+    index.store("s3.amazonaws.com", "openneuro.org", "ds000113/", INDEXED_VERSIONS)
+    index.record_miss("s3.amazonaws.com", "openneuro.org", "ds000113/")
+    assert index.covers("s3.amazonaws.com", "openneuro.org", key)
+    assert index.get_versions("s3.amazonaws.com", "openneuro.org", key) == []
+    index.negative_ttl = -1
+    assert not index.covers("s3.amazonaws.com", "openneuro.org", key)
+    index.store("s3.amazonaws.com", "openneuro.org", "ds000113/", INDEXED_VERSIONS)
+    assert index.covers("s3.amazonaws.com", "openneuro.org", key)
+    assert index.get_versions("s3.amazonaws.com", "openneuro.org", key) == [
+        INDEXED_VERSIONS[1]
+    ]
+    index.close()
+
+
 # --- Version matching ---
 
 
@@ -261,9 +458,7 @@ def test_get_exporttree_urls_construction(adapter):
                 }
             ],
         ),
-        patch.object(
-            DatasetAdapter, "_list_s3_versions", return_value=versions
-        ),
+        patch.object(adapter, "_get_s3_versions", return_value=versions),
     ):
         urls = list(adapter.get_exporttree_urls("sub-01/anat/sub-01_T1w.nii.gz", key))
 
@@ -338,9 +533,7 @@ def test_get_exporttree_urls_ambiguous_skips(adapter):
                 }
             ],
         ),
-        patch.object(
-            DatasetAdapter, "_list_s3_versions", return_value=versions
-        ),
+        patch.object(adapter, "_get_s3_versions", return_value=versions),
     ):
         urls = list(adapter.get_exporttree_urls("sub-01/anat/sub-01_T1w.nii.gz", key))
 
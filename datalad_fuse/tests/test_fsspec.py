@@ -0,0 +1,374 @@
+from __future__ import annotations
+
+import errno
+from pathlib import Path
+import socket
+from typing import Any, Optional
+
+import aiohttp
+from datalad import cfg
+from datalad.api import Dataset
+from fsspec.caching import MMapCache
+import pytest
+
+from datalad_fuse.fsspec import (
+    RESOLVE_AHEAD_INTERVAL,
+    DatasetAdapter,
+    FileState,
+    FsspecAdapter,
+    apply_client_config,
+    split_layout,
+)
+from datalad_fuse.health import host_health
+from datalad_fuse.httpfile import OfflineError, offline_stats
+from datalad_fuse.limits import host_limiter
+from datalad_fuse.retry import RetryPolicy, retry_budget, retry_policy
+from datalad_fuse.trace import tracing
+from datalad_fuse.transport import PoolConfig, connection_pool
+
+SAMPLE_KEY = "MD5E-s1064--8804d3d11f17e33bd912f1f0947afdb9.json"
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        (
+            f"http://example.com/ds/annex/objects/4d1/a3e/{SAMPLE_KEY}/{SAMPLE_KEY}",
+            ("http://example.com/ds", "lower"),
+        ),
+        (
+            f"http://example.com/ds/annex/objects/p0/4v/{SAMPLE_KEY}/{SAMPLE_KEY}",
+            ("http://example.com/ds", "mixed"),
+        ),
+        (
+            f"http://example.com/ds/.git/annex/objects/4d1/a3e/{SAMPLE_KEY}/{SAMPLE_KEY}",
+            ("http://example.com/ds", ".git/lower"),
+        ),
+        (
+            f"http://example.com/ds/.git/annex/objects/p0/4v/{SAMPLE_KEY}/{SAMPLE_KEY}",
+            ("http://example.com/ds", ".git/mixed"),
+        ),
+        ("http://example.com/ds/text.txt", None),
+        (f"http://example.com/ds/annex/objects/p0/{SAMPLE_KEY}/{SAMPLE_KEY}", None),
+    ],
+)
+def test_split_layout(url: str, expected: Optional[tuple[str, str]]) -> None:
+    assert split_layout(url) == expected
+
+
+def test_learn_layout(url_dataset) -> None:
+    ds, data_files = url_dataset
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        remote_files = [
+            fname
+            for fname in sorted(data_files)
+            if dsap.get_file_state(fname)[0] is FileState.NO_CONTENT
+        ]
+        if not remote_files:
+            pytest.skip("All files are present locally")
+        first, *rest = remote_files
+        with dsap.open(first) as fp:
+            assert fp.read() == data_files[first]
+        layouts = {root: layout for root, layout in dsap._layouts.items() if layout}
+        for fname in rest:
+            _, key = dsap.get_file_state(fname)
+            for url in dsap.get_urls(str(key)):
+                split = split_layout(url)
+                if split is not None and split[0] in layouts:
+                    # The first candidate for a remote is the learned layout
+                    assert split[1] == layouts[split[0]]
+                    break
+    finally:
+        dsap.close()
+
+
+def test_cached_read(url_dataset) -> None:
+    ds, data_files = url_dataset
+    for _ in range(2):
+        dsap = DatasetAdapter(ds.path, caching=True)
+        try:
+            for fname, content in data_files.items():
+                with dsap.open(fname) as fp:
+                    assert fp.read() == content
+        finally:
+            dsap.close()
+
+
+def test_mmapcache_without_multi_fetcher(tmp_path) -> None:
+    # `DatasetAdapter` relies on fsspec's `MMapCache` falling back to its
+    # single-range fetcher when ``multi_fetcher`` is cleared
+    data = bytes(range(256)) * 16
+    fetched = []
+
+    def fetcher(start: int, end: int) -> bytes:
+        fetched.append((start, end))
+        return data[start:end]
+
+    def multi_fetcher(_ranges):
+        raise AssertionError("multi_fetcher should not be used")
+
+    cache = MMapCache(
+        256,
+        fetcher,
+        len(data),
+        str(tmp_path / "cache"),
+        set(),
+        multi_fetcher=multi_fetcher,
+    )
+    assert cache.multi_fetcher is multi_fetcher
+    cache.multi_fetcher = None
+    assert cache._fetch(300, 400) == data[300:400]
+    # Blocks 0, 2, and 3 are missing, which are not contiguous:
+    assert cache._fetch(0, 1000) == data[:1000]
+    assert len(fetched) > 1
+
+
+def test_offline(url_dataset, monkeypatch) -> None:
+    ds, data_files = url_dataset
+    monkeypatch.setattr(
+        "datalad_fuse.fsspec.probe_first",
+        lambda *_args, **_kwargs: pytest.fail("Network access in offline mode"),
+    )
+    dsap = DatasetAdapter(ds.path, caching=False, offline=True)
+    try:
+        for fname, content in data_files.items():
+            if dsap.get_file_state(fname)[0] is FileState.HAS_CONTENT:
+                with dsap.open(fname) as fp:
+                    assert fp.read() == content
+            else:
+                misses = offline_stats.misses
+                with pytest.raises(OfflineError) as excinfo:
+                    dsap.open(fname)
+                assert excinfo.value.errno == errno.ENOENT
+                assert offline_stats.misses == misses + 1
+    finally:
+        dsap.close()
+
+
+def test_offline_cached(url_dataset) -> None:
+    ds, data_files = url_dataset
+    remote_files = []
+    dsap = DatasetAdapter(ds.path, caching=True)
+    try:
+        for fname, content in data_files.items():
+            if dsap.get_file_state(fname)[0] is FileState.NO_CONTENT:
+                remote_files.append(fname)
+                with dsap.open(fname) as fp:
+                    assert fp.read() == content
+    finally:
+        dsap.close()
+    if not remote_files:
+        pytest.skip("All files are present locally")
+    ds.config.set("datalad.fusefs.offline", "true", scope="local")
+    dsap = DatasetAdapter(ds.path, caching=True)
+    try:
+        assert dsap.offline
+        for fname in remote_files:
+            with dsap.open(fname) as fp:
+                assert fp.read() == data_files[fname]
+    finally:
+        dsap.close()
+
+
+def test_resolve_ahead(url_dataset, monkeypatch) -> None:
+    ds, data_files = url_dataset
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        remote_files = [
+            fname
+            for fname in sorted(data_files)
+            if dsap.get_file_state(fname)[0] is FileState.NO_CONTENT
+        ]
+        if not remote_files:
+            fname = next(iter(data_files))
+            dsap.resolve_ahead(fname)
+            dsap._queued[fname][1].result()
+            assert not dsap._resolved
+            pytest.skip("All files are present locally")
+        for fname in remote_files:
+            dsap.resolve_ahead(fname)
+        for fname in remote_files:
+            dsap._queued[fname][1].result()
+            _, key = dsap.get_file_state(fname)
+            assert dsap._resolved[str(key)].result() is not None
+        monkeypatch.setattr(
+            "datalad_fuse.fsspec.probe_first",
+            lambda *_args, **_kwargs: pytest.fail("URLs probed again on open"),
+        )
+        for fname in remote_files:
+            with tracing() as tracer:
+                with dsap.open(fname) as fp:
+                    assert fp.read() == data_files[fname]
+            assert "resolved_ahead" in {s["step"] for s in tracer.steps}
+        assert not dsap._resolved
+        # The URLs are now in the URL cache, so there is nothing to resolve:
+        dsap._queued.clear()
+        dsap.resolve_ahead(remote_files[0])
+        dsap._queued[remote_files[0]][1].result()
+        assert not dsap._resolved
+    finally:
+        dsap.close()
+
+
+def test_resolve_ahead_throttled(url_dataset, monkeypatch) -> None:
+    ds, data_files = url_dataset
+    dsap = DatasetAdapter(ds.path, caching=False)
+    lookups = []
+    real_get_file_state = dsap.get_file_state
+
+    def get_file_state(relpath: str) -> Any:
+        lookups.append(relpath)
+        return real_get_file_state(relpath)
+
+    monkeypatch.setattr(dsap, "get_file_state", get_file_state)
+    try:
+        fname = sorted(data_files)[0]
+        for _ in range(5):
+            dsap.resolve_ahead(fname)
+        dsap._queued[fname][1].result()
+        # Looking the path up is left to the background, and only done once:
+        assert lookups == [fname]
+        when, task = dsap._queued[fname]
+        dsap._queued[fname] = (when - RESOLVE_AHEAD_INTERVAL, task)
+        dsap.resolve_ahead(fname)
+        dsap._queued[fname][1].result()
+        assert lookups == [fname, fname]
+    finally:
+        dsap.close()
+
+
+def test_dead_url(range_server, tmp_path: Path, tmp_home: Path) -> None:  # noqa: U100
+    ds = Dataset(tmp_path / "ds").create()
+    (ds.pathobj / "a.dat").write_bytes(b"0123456789" * 100)
+    ds.save(message="Add data")
+    key = ds.repo.call_annex_oneline(["lookupkey", "a.dat"])
+    ds.repo.call_annex(["registerurl", key, f"{range_server.url}/gone"])
+    ds.repo.call_annex(["drop", "--force", "a.dat"])
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        dsap.resolve_ahead("a.dat")
+        with pytest.raises(IOError, match="Could not find a usable URL"):
+            dsap.open("a.dat")
+        assert dsap.url_cache.get_working(key) is None
+        assert dsap.url_cache.is_dead(key, f"{range_server.url}/gone")
+    finally:
+        dsap.close()
+    # The size was known from the key, so no HEAD request was needed:
+    assert range_server.count("/gone", "HEAD") == 0
+    assert range_server.count("/gone") == 1
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["uncached", "cached"])
+@pytest.mark.parametrize("failure", ["down", "forbidden", "size"])
+def test_unusable_url(
+    range_server,
+    tmp_path: Path,
+    tmp_home: Path,  # noqa: U100
+    failure: str,
+    cached: bool,
+) -> None:
+    content = b"0123456789" * 100
+    ds = Dataset(tmp_path / "ds").create()
+    (ds.pathobj / "a.dat").write_bytes(content)
+    ds.save(message="Add data")
+    key = ds.repo.call_annex_oneline(["lookupkey", "a.dat"])
+    if failure == "down":
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        bad = f"http://127.0.0.1:{port}/a.dat"
+    elif failure == "forbidden":
+        range_server.errors["/bad"] = 403
+        bad = f"{range_server.url}/bad"
+    else:
+        range_server.files["/bad"] = content + b"garbage"
+        bad = f"{range_server.url}/bad"
+    ds.repo.call_annex(["registerurl", key, bad])
+    ds.repo.call_annex(["drop", "--force", "a.dat"])
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        if cached:
+            dsap.url_cache.record_success(key, bad)
+        if cached:
+            # A cached URL is only checked on reading, so with no other
+            # source, the error from reading it is what is reported:
+            with dsap.open("a.dat") as fp:
+                with pytest.raises((IOError, aiohttp.ClientError)):
+                    fp.read()
+        else:
+            # With no other source, the failure is reported as such:
+            with pytest.raises(IOError, match="Could not find a usable URL"):
+                with dsap.open("a.dat") as fp:
+                    fp.read()
+        assert dsap.url_cache.get_working(key) is None
+        # With a good URL, that is used instead:
+        range_server.files["/good"] = content
+        ds.repo.call_annex(["registerurl", key, f"{range_server.url}/good"])
+        if cached:
+            dsap.url_cache.record_success(key, bad)
+        with dsap.open("a.dat") as fp:
+            assert fp.read() == content
+        assert dsap.url_cache.get_working(key) == f"{range_server.url}/good"
+    finally:
+        dsap.close()
+        host_health.clear()
+
+
+def test_cached_url_not_probed(
+    range_server, tmp_path: Path, tmp_home: Path  # noqa: U100
+) -> None:
+    content = b"0123456789" * 100
+    ds = Dataset(tmp_path / "ds").create()
+    (ds.pathobj / "a.dat").write_bytes(content)
+    ds.save(message="Add data")
+    key = ds.repo.call_annex_oneline(["lookupkey", "a.dat"])
+    range_server.files["/a.dat"] = content
+    url = f"{range_server.url}/a.dat"
+    ds.repo.call_annex(["registerurl", key, url])
+    ds.repo.call_annex(["drop", "--force", "a.dat"])
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        with dsap.open("a.dat") as fp:
+            assert fp.read() == content
+        assert dsap.url_cache.get_working(key) == url
+        assert range_server.count("/a.dat") == 1
+        # Reopening via the cached URL makes no requests until read from:
+        with dsap.open("a.dat") as fp:
+            assert range_server.count("/a.dat") == 1
+            assert fp.read() == content
+        assert range_server.count("/a.dat") == 2
+    finally:
+        dsap.close()
+
+
+def test_client_config(tmp_path: Path, tmp_home: Path) -> None:  # noqa: U100
+    ds = Dataset(tmp_path / "ds").create()
+    ds.config.set("datalad.fusefs.retry-attempts", "2", scope="local")
+    ds.config.set("datalad.fusefs.retry-budget", "0.5", scope="local")
+    ds.config.set("datalad.fusefs.breaker-threshold", "7", scope="local")
+    ds.config.set("datalad.fusefs.max-concurrency", "3", scope="local")
+    ds.config.set("datalad.fusefs.rate-limit", "10", scope="local")
+    ds.config.set("datalad.fusefs.http-connections-per-host", "4", scope="local")
+    ds.create("sub")
+    try:
+        with FsspecAdapter(ds.path, caching=False) as fsa:
+            fsa.resolve_dataset(ds.pathobj / ".datalad" / "config")
+            assert retry_policy.attempts == 2
+            assert retry_budget.ratio == 0.5
+            assert host_health.failure_threshold == 7
+            assert host_limiter.maximum == 3
+            assert host_limiter.rate == 10
+            assert connection_pool.config.limit_per_host == 4
+            # A subdataset without these options doesn't reset them:
+            fsa.resolve_dataset(ds.pathobj / "sub" / ".datalad" / "config")
+            assert len(fsa.datasets) == 2
+            assert retry_policy.attempts == 2
+            assert retry_budget.ratio == 0.5
+            assert host_health.failure_threshold == 7
+            assert host_limiter.maximum == 3
+            assert connection_pool.config.limit_per_host == 4
+    finally:
+        apply_client_config(cfg)
+    assert retry_policy == RetryPolicy.from_config(cfg)
+    assert connection_pool.config == PoolConfig.from_config(cfg)
@@ -0,0 +1,113 @@
+from datalad.api import Dataset
+from datalad.tests.utils_pytest import assert_in_results
+import pytest
+
+from datalad_fuse.fsspec import DatasetAdapter
+from datalad_fuse.trace import trace_request, traced, tracing
+
+
+def test_traced_inactive():
+    with traced("step", foo=1) as info:
+        info["bar"] = 2
+    trace_request("GET", "http://example.com", 0, 1, status=200)
+
+
+def test_tracing():
+    with tracing() as tracer:
+        with traced("outer", foo=1) as info:
+            info["bar"] = 2
+            with pytest.raises(ValueError):
+                with traced("inner"):
+                    raise ValueError("Oops")
+        trace_request("HEAD", "http://example.com", tracer.start, 2, status=503)
+    explanation = tracer.as_dict()
+    assert [s["step"] for s in explanation["steps"]] == ["outer", "inner"]
+    assert explanation["steps"][0]["foo"] == 1
+    assert explanation["steps"][0]["bar"] == 2
+    assert explanation["steps"][1]["error"] == "ValueError: Oops"
+    assert explanation["requests"] == [
+        {
+            "method": "HEAD",
+            "url": "http://example.com",
+            "start": 0.0,
+            "latency": explanation["requests"][0]["latency"],
+            "attempt": 2,
+            "status": 503,
+        }
+    ]
+    # Nothing is recorded once tracing has finished:
+    with traced("after"):
+        pass
+    assert len(tracer.steps) == 2
+
+
+def test_explain(url_dataset):
+    ds, data_files = url_dataset
+    results = ds.fsspec_explain("text.txt", bytes=10)
+    assert_in_results(results, action="fsspec-explain", type="dataset", status="ok")
+    (res,) = results
+    explanation = res["explanation"]
+    steps = {s["step"]: s for s in explanation["steps"]}
+    assert "resolve_dataset" in steps
+    assert "get_file_state" in steps
+    assert steps["read"]["received"] == 10
+    assert explanation["total"] >= steps["read"]["duration"]
+    transfer = explanation["transfer"]
+    if ds.repo.file_has_content("text.txt"):
+        assert transfer["kind"] == "local"
+        assert explanation["requests"] == []
+    else:
+        assert transfer["kind"] == "url"
+        assert transfer["size"] == len(data_files["text.txt"])
+        assert "probe" in steps
+        assert steps["probe"]["winner"] == transfer["url"]
+        assert any(
+            r["url"] == transfer["url"] and r.get("status") in (200, 206)
+            for r in explanation["requests"]
+        )
+
+
+def test_explain_unavailable(tmp_home, tmp_path):  # noqa: U100
+    ds = Dataset(tmp_path / "ds").create()
+    (tmp_path / "ds" / "gone.txt").write_text("This content is dropped.\n")
+    ds.save(message="Add file")
+    ds.drop("gone.txt", reckless="kill")
+    results = ds.fsspec_explain("gone.txt", on_failure="ignore")
+    assert_in_results(results, action="fsspec-explain", status="error")
+    (res,) = results
+    assert "error" in res["explanation"]
+    assert "transfer" not in res["explanation"]
+    assert "get_file_state" in {s["step"] for s in res["explanation"]["steps"]}
+
+
+def test_explain_offline(range_server, tmp_home, tmp_path):  # noqa: U100
+    ds = Dataset(tmp_path / "ds").create()
+    (ds.pathobj / "a.dat").write_bytes(b"0123456789" * 100)
+    ds.save(message="Add data")
+    key = ds.repo.call_annex_oneline(["lookupkey", "a.dat"])
+    good = f"{range_server.url}/good"
+    bad = f"{range_server.url}/bad"
+    ds.repo.call_annex(["registerurl", key, bad])
+    ds.repo.call_annex(["registerurl", key, good])
+    ds.repo.call_annex(["drop", "--force", "a.dat"])
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        dsap.url_cache.record_failure(key, bad)
+        dsap.url_cache.record_success(key, good)
+    finally:
+        dsap.close()
+    results = ds.fsspec_explain("a.dat", offline=True)
+    assert_in_results(results, action="fsspec-explain", status="ok")
+    (res,) = results
+    explanation = res["explanation"]
+    assert explanation["state"] == "NO_CONTENT"
+    assert explanation["key"] == key
+    assert explanation["local_paths"] == []
+    assert explanation["cached_url"] == good
+    assert explanation["candidates"] == [
+        {"url": good, "dead": False, "cached": False},
+        {"url": bad, "dead": True, "cached": False},
+    ]
+    assert "transfer" not in explanation
+    assert explanation["requests"] == []
+    assert range_server.requests == []
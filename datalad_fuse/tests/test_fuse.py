@@ -1,6 +1,7 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import contextmanager
 import hashlib
+import os
 import os.path
 from pathlib import Path
 import subprocess
@@ -253,6 +254,31 @@ def test_parallel_access(tmp_path, big_url_dataset):
                 assert fut.result() == futures[fut]
 
 
+def test_nearby_reads_one_request(tmp_path, tmp_home, range_server):  # noqa: U100
+    from datalad_fuse.fuse_ import DataLadFUSE
+
+    content = os.urandom(2**20)
+    ds = Dataset(tmp_path / "ds").create()
+    (ds.pathobj / "a.dat").write_bytes(content)
+    ds.save(message="Add data")
+    key = ds.repo.call_annex_oneline(["lookupkey", "a.dat"])
+    range_server.files["/a.dat"] = content
+    ds.repo.call_annex(["registerurl", key, f"{range_server.url}/a.dat"])
+    ds.repo.call_annex(["drop", "--force", "a.dat"])
+    ops = DataLadFUSE(ds.path, caching=False)
+    path = str(ds.pathobj / "a.dat")
+    try:
+        fh = ops.open(path, os.O_RDONLY)
+        # Reads made one at a time at scattered offsets are served from the
+        # block cache rather than each being fetched on its own:
+        for offset in [8192, 0, 16384, 4096, 12288]:
+            assert ops.read(path, 4096, offset, fh) == content[offset : offset + 4096]
+        ops.release(path, fh)
+    finally:
+        ops.destroy()
+    assert range_server.count("/a.dat") == 1
+
+
 def sha256_file(path):
     dgst = hashlib.sha256()
     with open(path, "rb") as fp:
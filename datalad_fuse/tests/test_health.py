@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import time
+
+from fsspec.asyn import get_loop, sync
+from fsspec.implementations.http import HTTPFileSystem
+import pytest
+
+from datalad_fuse.fsspec import get_client
+from datalad_fuse.health import HostHealth, host_health, host_of
+from datalad_fuse.httpfile import AnnexHTTPFileSystem
+from datalad_fuse.retry import RetryPolicy
+
+
+def test_host_of() -> None:
+    assert host_of("https://user:pw@Example.com/a/b?c=d") == "https://example.com"
+    assert host_of("http://127.0.0.1:8080/x") == "http://127.0.0.1:8080"
+
+
+def test_order_by_latency() -> None:
+    health = HostHealth()
+    health.record_success("http://slow.test", 2.0)
+    health.record_success("http://fast.test", 0.1)
+    urls = [
+        "http://slow.test/a",
+        "http://unknown.test/a",
+        "http://fast.test/a",
+        "http://slow.test/b",
+    ]
+    assert health.order(urls) == [
+        "http://fast.test/a",
+        "http://unknown.test/a",
+        "http://slow.test/a",
+        "http://slow.test/b",
+    ]
+
+
+def test_circuit_breaker() -> None:
+    health = HostHealth(failure_threshold=2, cooldown=0.1)
+    urls = ["http://bad.test/a", "http://good.test/a"]
+    health.record_failure("http://bad.test")
+    assert health.is_available("http://bad.test")
+    health.record_failure("http://bad.test")
+    assert not health.is_available("http://bad.test")
+    assert health.order(urls) == ["http://good.test/a"]
+    # If all hosts are down, try them anyway:
+    assert health.order(urls[:1]) == urls[:1]
+    time.sleep(0.15)
+    assert health.is_available("http://bad.test")
+    # Half-open: a single further failure reopens the breaker
+    health.record_failure("http://bad.test")
+    assert not health.is_available("http://bad.test")
+    health.record_success("http://bad.test", 0.1)
+    assert health.is_available("http://bad.test")
+
+
+@pytest.fixture
+def clean_health():
+    host_health.clear()
+    yield host_health
+    host_health.clear()
+
+
+def test_throttling_is_not_failure() -> None:
+    health = HostHealth(failure_threshold=2)
+    for _ in range(5):
+        health.record_response("http://busy.test", 503, 0.1)
+        health.record_response("http://busy.test", 429, 0.1)
+    assert health.is_available("http://busy.test")
+    assert health.get("http://busy.test").errors == 0
+    health.record_response("http://busy.test", 500, 0.1)
+    health.record_response("http://busy.test", 502, 0.1)
+    assert not health.is_available("http://busy.test")
+
+
+def test_client_throttled_then_served(clean_health: HostHealth, range_server) -> None:
+    range_server.files["/a"] = b"data"
+    range_server.errors["/a"] = 503
+    range_server.error_headers["/a"] = {"Retry-After": "0"}
+    url = f"{range_server.url}/a"
+
+    async def fetch() -> list[int]:
+        session = await get_client()
+        session.policy = RetryPolicy(attempts=2, base_delay=0.01, max_delay=0.02)
+        statuses = []
+        try:
+            for i in range(clean_health.failure_threshold + 2):
+                if i == clean_health.failure_threshold + 1:
+                    del range_server.errors["/a"]
+                async with session.get(url) as r:
+                    statuses.append(r.status)
+        finally:
+            await session.close()
+        return statuses
+
+    statuses = sync(get_loop(), fetch)
+    assert statuses == [503] * (clean_health.failure_threshold + 1) + [200]
+    assert clean_health.is_available(host_of(url))
+
+
+def test_client_tries_failing_host(clean_health: HostHealth, range_server) -> None:
+    # A host that is being skipped is still sent requests for files that it
+    # alone serves
+    range_server.files["/a"] = b"data"
+    url = f"{range_server.url}/a"
+    for _ in range(clean_health.failure_threshold):
+        clean_health.record_failure(host_of(url))
+    assert not clean_health.is_available(host_of(url))
+    fs = HTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    assert fs.cat_file(url) == b"data"
+    assert clean_health.is_available(host_of(url))
+
+
+def test_file_skips_failing_host(clean_health: HostHealth, range_server) -> None:
+    range_server.files["/a"] = b"data" * 1000
+    range_server.files["/b"] = b"data" * 1000
+    # The same server under another host name:
+    other = range_server.url.replace("127.0.0.1", "localhost")
+    for _ in range(clean_health.failure_threshold):
+        clean_health.record_failure(range_server.url)
+    fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    with fs.open(
+        f"{range_server.url}/a",
+        size=4000,
+        block_size=1000,
+        alternates=lambda: [f"{other}/b"],
+    ) as fp:
+        assert fp.read(10) == b"data" * 2 + b"da"
+        assert fp.url == f"{other}/b"
+    assert range_server.count("/a") == 0
+
+
+def test_client_records_requests(clean_health: HostHealth, served_files) -> None:
+    fs = HTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    dfile = served_files[0]
+    assert fs.cat_file(dfile.url) == dfile.content
+    st = clean_health.get(host_of(dfile.url))
+    assert st.requests >= 1
+    assert st.errors == 0
+    assert st.latency is not None
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from pathlib import Path
+
+import aiohttp
+from datalad import cfg
+from datalad.api import Dataset
+from fsspec.asyn import sync
+import pytest
+
+from datalad_fuse.fsspec import FsspecAdapter, apply_client_config, get_client
+from datalad_fuse.httpfile import AnnexHTTPFileSystem
+from datalad_fuse.transport import (
+    HTTP2Session,
+    PoolConfig,
+    connection_pool,
+    new_http2_client,
+)
+
+pytest.importorskip("h2")
+pytest.importorskip("httpx")
+
+from datalad_fuse.tests.h2server import H2Server, h2_server  # noqa: E402
+
+CONTENT = bytes(range(256)) * 1024
+
+
+@pytest.fixture
+def h2server():
+    with h2_server() as server:
+        server.files["/data.bin"] = CONTENT
+        yield server
+
+
+@pytest.fixture
+def h2fs():
+    async def get_h2_client(**_kwargs):
+        return HTTP2Session(new_http2_client(PoolConfig(), http1=False))
+
+    return AnnexHTTPFileSystem(get_client=get_h2_client, skip_instance_cache=True)
+
+
+def test_http2_reads(h2server: H2Server, h2fs: AnnexHTTPFileSystem) -> None:
+    url = f"{h2server.url}/data.bin"
+    assert h2fs.info(url)["size"] == len(CONTENT)
+    assert h2fs.cat_file(url, start=1000, end=1100) == CONTENT[1000:1100]
+    with h2fs.open(url, block_size=4096) as fp:
+        fp.seek(len(CONTENT) - 10)
+        assert fp.read() == CONTENT[-10:]
+    assert h2fs.cat_file(url) == CONTENT
+    with pytest.raises(FileNotFoundError):
+        h2fs.info(f"{h2server.url}/missing.bin")
+    session = sync(h2fs.loop, h2fs.set_session)
+    r = sync(h2fs.loop, session.get, url)
+    assert r.version == "HTTP/2"
+    sync(h2fs.loop, r.aclose)
+
+
+def test_http2_multiplexing(h2server: H2Server, h2fs: AnnexHTTPFileSystem) -> None:
+    url = f"{h2server.url}/data.bin"
+    h2server.delays["/data.bin"] = 0.2
+    starts = list(range(0, len(CONTENT), 4096))
+    ranges = h2fs.cat_ranges(
+        [url] * len(starts), starts, [s + 100 for s in starts], batch_size=64
+    )
+    assert ranges == [CONTENT[s : s + 100] for s in starts]
+    # All concurrent range requests were sent over a single connection:
+    assert h2server.connections == 1
+    assert len(h2server.requests) == len(starts)
+
+
+def test_http2_error_status(h2server: H2Server, h2fs: AnnexHTTPFileSystem) -> None:
+    session = sync(h2fs.loop, h2fs.set_session)
+
+    async def get_missing() -> None:
+        async with session.get(f"{h2server.url}/missing.bin") as r:
+            r.raise_for_status()
+
+    with pytest.raises(aiohttp.ClientResponseError) as excinfo:
+        sync(h2fs.loop, get_missing)
+    assert excinfo.value.status == 404
+
+
+def test_get_client_http2(monkeypatch) -> None:
+    monkeypatch.setattr(
+        connection_pool, "config", replace(connection_pool.config, http2=True)
+    )
+    fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    session = sync(fs.loop, fs.set_session)
+    assert isinstance(session, HTTP2Session)
+    # The client is shared between sessions:
+    fs2 = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    assert sync(fs2.loop, fs2.set_session).client is session.client
+
+
+def test_http2_from_dataset_config(
+    tmp_path: Path, tmp_home: Path  # noqa: U100
+) -> None:
+    ds = Dataset(tmp_path / "ds").create()
+    ds.config.set("datalad.fusefs.http2", "true", scope="local")
+    try:
+        with FsspecAdapter(ds.path, caching=False) as fsa:
+            fsa.resolve_dataset(ds.pathobj / ".datalad" / "config")
+            assert connection_pool.config.http2
+            fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+            assert isinstance(sync(fs.loop, fs.set_session), HTTP2Session)
+    finally:
+        apply_client_config(cfg)
+    assert not connection_pool.config.http2
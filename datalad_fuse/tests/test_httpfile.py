@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+import os
+import time
+
+import aiohttp
+import pytest
+import yarl
+
+from datalad_fuse.fsspec import get_client
+from datalad_fuse.httpfile import (
+    AnnexHTTPFileSystem,
+    SizeMismatchError,
+    hedge_stats,
+    presigned_expiry,
+)
+
+CONTENT = os.urandom(3 * 2**20 + 123)
+
+
+@pytest.fixture
+def fs() -> AnnexHTTPFileSystem:
+    return AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+
+
+def test_plain_read(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    with fs.open(f"{range_server.url}/a", block_size=2**20) as fp:
+        fp.seek(2**20 + 5)
+        assert fp.read(1000) == CONTENT[2**20 + 5 : 2**20 + 1005]
+
+
+def test_hedged_read(
+    fs: AnnexHTTPFileSystem, range_server, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr("datalad_fuse.httpfile.DEFAULT_HEDGE_DEADLINE", 0.1)
+    range_server.files["/slow"] = CONTENT
+    range_server.files["/fast"] = CONTENT
+    range_server.delays["/slow"] = 3
+    issued, won = hedge_stats.issued, hedge_stats.won
+    with fs.open(
+        f"{range_server.url}/slow",
+        size=len(CONTENT),
+        block_size=2**20,
+        alternates=lambda: [f"{range_server.url}/fast"],
+        hedge=True,
+    ) as fp:
+        start = time.monotonic()
+        assert fp.read(100) == CONTENT[:100]
+        assert time.monotonic() - start < 2
+    assert hedge_stats.issued == issued + 1
+    assert hedge_stats.won == won + 1
+
+
+def test_no_hedge_without_alternates(
+    fs: AnnexHTTPFileSystem, range_server, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr("datalad_fuse.httpfile.DEFAULT_HEDGE_DEADLINE", 0.05)
+    range_server.files["/a"] = CONTENT
+    range_server.delays["/a"] = 0.2
+    issued = hedge_stats.issued
+    with fs.open(
+        f"{range_server.url}/a", size=len(CONTENT), block_size=2**20, hedge=True
+    ) as fp:
+        assert fp.read(100) == CONTENT[:100]
+    assert hedge_stats.issued == issued
+
+
+def test_failover(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    range_server.files["/b"] = CONTENT
+    with fs.open(
+        f"{range_server.url}/a",
+        size=len(CONTENT),
+        block_size=2**20,
+        cache_type="readahead",
+        alternates=lambda: [f"{range_server.url}/b"],
+    ) as fp:
+        assert fp.read(100) == CONTENT[:100]
+        range_server.errors["/a"] = 404
+        fp.seek(2 * 2**20)
+        assert fp.read(100) == CONTENT[2 * 2**20 : 2 * 2**20 + 100]
+        assert fp.url == f"{range_server.url}/b"
+        fp.seek(3 * 2**20)
+        assert fp.read(100) == CONTENT[3 * 2**20 : 3 * 2**20 + 100]
+    assert range_server.count("/a") == 2
+
+
+def test_failover_exhausted(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    range_server.errors["/b"] = 404
+    with fs.open(
+        f"{range_server.url}/a",
+        size=len(CONTENT),
+        block_size=2**20,
+        alternates=lambda: [f"{range_server.url}/b"],
+    ) as fp:
+        range_server.errors["/a"] = 404
+        with pytest.raises(aiohttp.ClientResponseError):
+            fp.read(100)
+
+
+def test_key_size(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    with fs.open(
+        f"{range_server.url}/a", block_size=2**20, key_size=len(CONTENT)
+    ) as fp:
+        assert fp.size == len(CONTENT)
+        fp.seek(2**20 + 5)
+        assert fp.read(1000) == CONTENT[2**20 + 5 : 2**20 + 1005]
+        # Reads at or past the end need no requests:
+        assert fp.pread(len(CONTENT), 100) == b""
+        fp.seek(len(CONTENT) + 10)
+        assert fp.read(100) == b""
+    assert range_server.count("/a", "HEAD") == 0
+    assert range_server.count("/a") == 1
+
+
+def test_probe(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    range_server.files["/b"] = CONTENT
+    with fs.open(
+        f"{range_server.url}/gone",
+        block_size=2**20,
+        key_size=len(CONTENT),
+        alternates=lambda: [f"{range_server.url}/b"],
+    ) as fp:
+        # The alternates are not tried:
+        with pytest.raises(FileNotFoundError):
+            fp.probe()
+    with fs.open(
+        f"{range_server.url}/a", block_size=2**20, key_size=len(CONTENT)
+    ) as fp:
+        fp.probe()
+        # The first block is cached:
+        assert fp.read(1000) == CONTENT[:1000]
+    assert range_server.count("/a") == 1
+    assert range_server.count("/b") == 0
+
+
+@pytest.mark.parametrize("key_size", [len(CONTENT) - 1, len(CONTENT) + 2**20])
+def test_key_size_mismatch(
+    fs: AnnexHTTPFileSystem, range_server, key_size: int
+) -> None:
+    range_server.files["/a"] = CONTENT
+    with fs.open(f"{range_server.url}/a", block_size=2**20, key_size=key_size) as fp:
+        fp.seek(len(CONTENT) - 10)
+        with pytest.raises(SizeMismatchError):
+            fp.read(5)
+
+
+def test_cached_size_mismatch(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    with pytest.raises(SizeMismatchError):
+        fs.open(f"{range_server.url}/a", size=len(CONTENT), key_size=len(CONTENT) - 1)
+
+
+@pytest.mark.parametrize(
+    "query,expected",
+    [
+        (
+            "X-Amz-Algorithm=AWS4-HMAC-SHA256&X-Amz-Date=20260101T000000Z"
+            "&X-Amz-Expires=3600&X-Amz-Signature=abc",
+            datetime(2026, 1, 1, 1, 0, 0, tzinfo=timezone.utc).timestamp(),
+        ),
+        (
+            "X-Goog-Date=20260101T000000Z&X-Goog-Expires=60",
+            datetime(2026, 1, 1, 0, 1, 0, tzinfo=timezone.utc).timestamp(),
+        ),
+        ("AWSAccessKeyId=x&Expires=1767225600&Signature=y", 1767225600.0),
+        ("versionId=abc", None),
+        ("X-Amz-Date=garbage&X-Amz-Expires=60", None),
+    ],
+)
+def test_presigned_expiry(query: str, expected: float | None) -> None:
+    url = yarl.URL(f"https://bucket.s3.amazonaws.com/key?{query}", encoded=True)
+    assert presigned_expiry(url) == expected
+
+
+def test_redirect_reused(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/target"] = CONTENT
+    expires = int(time.time()) + 3600
+    range_server.redirects["/a"] = f"/target?Expires={expires}&Signature=x"
+    with fs.open(f"{range_server.url}/a", size=len(CONTENT), block_size=2**20) as fp:
+        for i in range(3):
+            fp.seek(i * 2**20)
+            assert fp.read(10) == CONTENT[i * 2**20 : i * 2**20 + 10]
+    assert range_server.count("/a") == 1
+    assert range_server.count(f"/target?Expires={expires}&Signature=x") == 3
+
+
+def test_redirect_refreshed_before_expiry(
+    fs: AnnexHTTPFileSystem, range_server
+) -> None:
+    range_server.files["/target"] = CONTENT
+    # Expires within the refresh margin, so it is never reused
+    expires = int(time.time()) + 30
+    range_server.redirects["/a"] = f"/target?Expires={expires}"
+    with fs.open(f"{range_server.url}/a", size=len(CONTENT), block_size=2**20) as fp:
+        for i in range(2):
+            fp.seek(i * 2**20)
+            assert fp.read(10) == CONTENT[i * 2**20 : i * 2**20 + 10]
+    assert range_server.count("/a") == 2
+
+
+def test_redirect_target_gone(fs: AnnexHTTPFileSystem, range_server) -> None:
+    range_server.files["/t1"] = CONTENT
+    range_server.files["/t2"] = CONTENT
+    range_server.redirects["/a"] = "/t1"
+    with fs.open(f"{range_server.url}/a", size=len(CONTENT), block_size=2**20) as fp:
+        assert fp.read(10) == CONTENT[:10]
+        range_server.errors["/t1"] = 403
+        range_server.redirects["/a"] = "/t2"
+        fp.seek(2**20)
+        assert fp.read(10) == CONTENT[2**20 : 2**20 + 10]
+    assert range_server.count("/a") == 2
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import aiohttp
+from fsspec.asyn import get_loop, sync
+import pytest
+
+from datalad_fuse.health import host_health
+from datalad_fuse.limits import MIN_CONCURRENCY, HostLimiter
+from datalad_fuse.retry import RetryBudget, RetryPolicy
+from datalad_fuse.transport import RetrySession
+
+HOST = "http://a.test"
+
+
+class FakeResponse:
+    def __init__(self, status: int) -> None:
+        self.status = status
+
+
+def test_window_aimd() -> None:
+    limiter = HostLimiter(initial=4, maximum=5)
+
+    async def request(status: int, latency: float = 0.001) -> None:
+        async def send() -> FakeResponse:
+            await asyncio.sleep(latency)
+            return FakeResponse(status)
+
+        await limiter.call(HOST, send)
+
+    assert limiter.window(HOST) == 4
+    sync(get_loop(), request, 200)
+    assert limiter.window(HOST) == 4.25
+    for _ in range(20):
+        sync(get_loop(), request, 200)
+    assert limiter.window(HOST) == 5
+    sync(get_loop(), request, 429)
+    assert limiter.window(HOST) == 2.5
+    # A 404 is not throttling:
+    sync(get_loop(), request, 404)
+    assert limiter.window(HOST) == pytest.approx(2.9)
+    # Latency far above the baseline is taken as congestion:
+    time.sleep(0.1)
+    sync(get_loop(), request, 200, 0.2)
+    assert limiter.window(HOST) == pytest.approx(1.45)
+    # Throttling soon after a decrease (before the reduced window can have
+    # taken effect) does not shrink the window further:
+    sync(get_loop(), request, 503)
+    assert limiter.window(HOST) == pytest.approx(1.45)
+    time.sleep(0.1)
+    for _ in range(5):
+        sync(get_loop(), request, 503)
+    assert limiter.window(HOST) == MIN_CONCURRENCY
+
+
+def test_concurrency_bounded() -> None:
+    limiter = HostLimiter(initial=2, maximum=2)
+    active = 0
+    peak = 0
+
+    async def send() -> FakeResponse:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+        return FakeResponse(200)
+
+    async def main() -> None:
+        await asyncio.gather(*(limiter.call(HOST, send) for _ in range(8)))
+
+    sync(get_loop(), main)
+    assert peak == 2
+
+
+def test_cancelled_waiter_frees_slot() -> None:
+    limiter = HostLimiter(initial=1)
+
+    async def main() -> None:
+        await limiter.acquire(HOST)
+        waiter = asyncio.ensure_future(limiter.acquire(HOST))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        limiter.release(HOST)
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(limiter.acquire(HOST), 1)
+        limiter.release(HOST)
+
+    sync(get_loop(), main)
+
+
+def test_rate_limit() -> None:
+    limiter = HostLimiter(enabled=False, rate=20)
+
+    async def main() -> None:
+        for _ in range(30):
+            await limiter.acquire(HOST)
+
+    start = time.monotonic()
+    sync(get_loop(), main)
+    # 20 tokens are available at once; the remaining 10 take half a second
+    assert time.monotonic() - start >= 0.45
+
+
+def test_session_shrinks_window_on_throttling(range_server) -> None:
+    host_health.clear()
+    range_server.errors["/busy"] = 429
+    limiter = HostLimiter(initial=8)
+
+    async def fetch() -> int:
+        session = RetrySession(
+            aiohttp.ClientSession(),
+            policy=RetryPolicy(attempts=1),
+            budget=RetryBudget(),
+            limiter=limiter,
+        )
+        try:
+            async with session.get(f"{range_server.url}/busy") as r:
+                return int(r.status)
+        finally:
+            await session.close()
+
+    try:
+        assert sync(get_loop(), fetch) == 429
+    finally:
+        host_health.clear()
+    assert limiter.window(range_server.url) == 4
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import io
+from pathlib import Path
+from typing import Optional
+
+from datalad.api import Dataset, clone
+import pytest
+
+from datalad_fuse.fsspec import DatasetAdapter, FileState, local_path
+
+CONTENT = b"\x00This is binary content.\xff\n" * 64
+
+
+@pytest.fixture
+def annexed_dataset(tmp_path: Path, tmp_home: Path) -> Dataset:  # noqa: U100
+    ds = Dataset(tmp_path / "ds").create()
+    (ds.pathobj / "data.bin").write_bytes(CONTENT)
+    ds.save(message="Add data")
+    return ds
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        ("/data/ds", Path("/data/ds")),
+        ("../ds", Path("../ds")),
+        ("file:///data/my%20ds", Path("/data/my ds")),
+        ("https://example.com/ds.git", None),
+        ("ssh://example.com/data/ds", None),
+        ("example.com:data/ds", None),
+        ("user@example.com:/data/ds", None),
+    ],
+)
+def test_local_path(url: str, expected: Optional[Path]) -> None:
+    assert local_path(url) == expected
+
+
+def test_open_from_sibling_clone(annexed_dataset: Dataset, tmp_path: Path) -> None:
+    sibling = clone(annexed_dataset.path, tmp_path / "clone")
+    dsap = DatasetAdapter(sibling.path, caching=False)
+    try:
+        assert dsap.get_file_state("data.bin")[0] is FileState.NO_CONTENT
+        with dsap.open("data.bin") as fp:
+            assert isinstance(fp, io.BufferedReader)
+            assert Path(fp.name).is_relative_to(annexed_dataset.pathobj)
+            assert fp.read() == CONTENT
+    finally:
+        dsap.close()
+
+
+def test_open_from_directory_remote(annexed_dataset: Dataset, tmp_path: Path) -> None:
+    ds = annexed_dataset
+    directory = tmp_path / "directory-remote"
+    directory.mkdir()
+    ds.repo.call_annex(
+        [
+            "initremote",
+            "dirremote",
+            "type=directory",
+            f"directory={directory}",
+            "encryption=none",
+        ]
+    )
+    ds.repo.call_annex(["copy", "--to", "dirremote", "data.bin"])
+    ds.repo.call_annex(["drop", "data.bin"])
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        assert dsap.get_file_state("data.bin")[0] is FileState.NO_CONTENT
+        with dsap.open("data.bin") as fp:
+            assert Path(fp.name).is_relative_to(directory)
+            assert fp.read() == CONTENT
+    finally:
+        dsap.close()
+
+
+def test_local_remotes_honor_cost(annexed_dataset: Dataset, tmp_path: Path) -> None:
+    ds = annexed_dataset
+    directory = tmp_path / "directory-remote"
+    directory.mkdir()
+    ds.repo.call_annex(
+        [
+            "initremote",
+            "dirremote",
+            "type=directory",
+            f"directory={directory}",
+            "encryption=none",
+        ]
+    )
+    ds.repo.call_annex(["copy", "--to", "dirremote", "data.bin"])
+    sibling = clone(ds.path, tmp_path / "clone")
+    sibling.repo.call_annex(["enableremote", "dirremote", f"directory={directory}"])
+    for origin_cost, first in [("50", ds.pathobj), ("300", directory)]:
+        sibling.config.set("remote.origin.annex-cost", origin_cost, scope="local")
+        dsap = DatasetAdapter(sibling.path, caching=False)
+        try:
+            _, key = dsap.get_file_state("data.bin")
+            assert key is not None
+            paths = list(dsap.get_local_paths("data.bin", key))
+            assert len(paths) == 2
+            assert paths[0].is_relative_to(first)
+            with dsap.open("data.bin") as fp:
+                assert Path(fp.name).is_relative_to(first)
+                assert fp.read() == CONTENT
+        finally:
+            dsap.close()
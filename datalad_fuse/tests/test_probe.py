@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import time
+
+from fsspec.implementations.http import HTTPFileSystem
+import pytest
+
+from datalad_fuse.fsspec import get_client
+from datalad_fuse.probe import probe_first
+
+
+class ProbeHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path == "/slow":
+            time.sleep(3)
+        if self.path.startswith("/missing"):
+            self.send_error(404)
+            return
+        self.send_response(206)
+        self.send_header("Content-Range", "bytes 0-0/1")
+        self.send_header("Content-Length", "1")
+        self.end_headers()
+        self.wfile.write(b"x")
+
+    def log_message(self, *_args) -> None:
+        pass
+
+
+@pytest.fixture(scope="module")
+def probe_server() -> Iterator[str]:
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ProbeHandler)
+    httpd.daemon_threads = True
+    thread = Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{httpd.server_port}"  # noqa: E231
+    finally:
+        httpd.shutdown()
+
+
+def test_probe_first_skips_slow_and_missing(probe_server: str) -> None:
+    fs = HTTPFileSystem(get_client=get_client)
+    urls = [f"{probe_server}/slow", f"{probe_server}/missing", f"{probe_server}/good"]
+    start = time.monotonic()
+    winner, errors = probe_first(fs, urls, stagger=0.1)
+    assert time.monotonic() - start < 2
+    assert winner == f"{probe_server}/good"
+    assert list(errors) == [f"{probe_server}/missing"]
+    assert isinstance(errors[f"{probe_server}/missing"], FileNotFoundError)
+
+
+def test_probe_first_prefers_earlier(probe_server: str) -> None:
+    fs = HTTPFileSystem(get_client=get_client)
+    urls = [f"{probe_server}/a", f"{probe_server}/b"]
+    winner, errors = probe_first(fs, urls, stagger=1)
+    assert winner == f"{probe_server}/a"
+    assert errors == {}
+
+
+def test_probe_first_all_missing(probe_server: str) -> None:
+    fs = HTTPFileSystem(get_client=get_client)
+    urls = [f"{probe_server}/missing", f"{probe_server}/missing?2"]
+    winner, errors = probe_first(fs, urls, stagger=0.1)
+    assert winner is None
+    assert sorted(errors) == sorted(urls)
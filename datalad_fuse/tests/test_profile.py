@@ -0,0 +1,95 @@
+import time
+
+from datalad.tests.utils_pytest import assert_in_results
+import pytest
+
+from datalad_fuse.fsspec import DatasetAdapter
+from datalad_fuse.profile import (
+    REFERENCE_READ_SIZE,
+    HostProfile,
+    Measurement,
+    RemoteProfile,
+    summarize,
+)
+
+
+def mkprofile(host, ttfb, throughput, measured=None):
+    return HostProfile(
+        host=host,
+        ttfb=ttfb,
+        throughput=throughput,
+        samples=1,
+        measured=time.time() if measured is None else measured,
+    )
+
+
+def test_summarize():
+    p = summarize(
+        "http://example.com",
+        [
+            Measurement(0.1, 1000.0, 100),
+            Measurement(0.3, None, 1),
+            Measurement(0.2, 3000.0, 100),
+        ],
+    )
+    assert p.host == "http://example.com"
+    assert p.ttfb == pytest.approx(0.2)
+    assert p.throughput == pytest.approx(2000.0)
+    assert p.samples == 3
+    assert p.score == pytest.approx(0.2 + REFERENCE_READ_SIZE / 2000.0)
+
+
+def test_order(tmp_path):
+    profile = RemoteProfile(tmp_path / "profile.sqlite")
+    urls = [
+        "http://slow.example.com/a",
+        "http://unknown.example.com/a",
+        "http://fast.example.com/a",
+        "http://fast.example.com/b",
+    ]
+    assert profile.order(urls) == urls
+    profile.store(
+        [
+            mkprofile("http://slow.example.com", 0.05, 1e6),
+            mkprofile("http://fast.example.com", 0.2, 1e8),
+        ]
+    )
+    assert profile.order(urls) == [
+        "http://fast.example.com/a",
+        "http://fast.example.com/b",
+        "http://unknown.example.com/a",
+        "http://slow.example.com/a",
+    ]
+    assert [p.host for p in profile.ranking()] == [
+        "http://fast.example.com",
+        "http://slow.example.com",
+    ]
+    profile.close()
+    # The profile persists, but only for as long as the TTL:
+    profile = RemoteProfile(tmp_path / "profile.sqlite")
+    assert profile.order(urls)[0] == "http://fast.example.com/a"
+    profile.close()
+    profile = RemoteProfile(tmp_path / "profile.sqlite", ttl=0)
+    assert profile.order(urls) == urls
+    profile.close()
+
+
+def test_fsspec_profile(url_dataset):
+    ds, _ = url_dataset
+    results = ds.fsspec_profile(samples=10, bytes=1024)
+    assert_in_results(results, action="fsspec-profile", status="ok", rank=1)
+    (res,) = results
+    assert res["host"].startswith("http://127.0.0.1:")
+    assert res["ttfb"] > 0
+    assert res["samples"] >= 2
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        (p,) = dsap.profile.ranking()
+        assert p.host == res["host"]
+        assert p.samples == res["samples"]
+        urls = ["http://elsewhere.example.com/foo", f"{res['host']}/foo"]
+        assert dsap.order_urls(urls) == urls
+        dsap.profile.store([mkprofile("http://elsewhere.example.com", 100, None)])
+        assert dsap.order_urls(urls) == urls[::-1]
+    finally:
+        dsap.close()
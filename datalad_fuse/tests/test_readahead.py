@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import asyncio
+import os
+
+import aiohttp
+from fsspec.asyn import get_loop
+import pytest
+
+from datalad_fuse.fsspec import get_client
+from datalad_fuse.httpfile import AnnexHTTPFile, AnnexHTTPFileSystem
+from datalad_fuse.readahead import SegmentedReader, StreamingReader
+
+SEGMENT = 1024
+CONTENT = os.urandom(10 * SEGMENT + 100)
+
+
+class FakeSource:
+    def __init__(self, fail_at: int | None = None) -> None:
+        self.fetched: list[tuple[int, int]] = []
+        self.active = 0
+        self.peak = 0
+        self.fail_at = fail_at
+
+    async def fetch_range(self, start: int, end: int) -> bytes:
+        self.fetched.append((start, end))
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.active -= 1
+        if start == self.fail_at:
+            self.fail_at = None
+            raise OSError("Connection reset")
+        return CONTENT[start:end]
+
+
+def scan(reader: SegmentedReader, start: int = 0, size: int = 256) -> bytes:
+    """Read `CONTENT` sequentially from ``start``, making reads that the
+    reader declines directly"""
+    chunks = []
+    pos = start
+    while pos < len(CONTENT):
+        data = reader.read(pos, size)
+        if data is None:
+            data = CONTENT[pos : pos + size]
+        chunks.append(data)
+        pos += len(data)
+    return b"".join(chunks)
+
+
+def test_sequential_scan() -> None:
+    source = FakeSource()
+    reader = SegmentedReader(
+        source.fetch_range, len(CONTENT), get_loop(), segment_size=SEGMENT, segments=3
+    )
+    assert scan(reader) == CONTENT
+    # Engaged after the first segment's worth of reads:
+    starts = [s for s, _ in source.fetched]
+    assert starts == [i * SEGMENT for i in range(1, 11)]
+    assert source.fetched[-1] == (10 * SEGMENT, len(CONTENT))
+    assert 1 < source.peak <= 3
+
+
+def test_seek_ends_scan() -> None:
+    source = FakeSource()
+    reader = SegmentedReader(
+        source.fetch_range, len(CONTENT), get_loop(), segment_size=SEGMENT, segments=3
+    )
+    for pos in range(0, 2 * SEGMENT, 256):
+        reader.read(pos, 256)
+    assert reader.read(2 * SEGMENT, 256) == CONTENT[2 * SEGMENT : 2 * SEGMENT + 256]
+    # Reads need not be in order as long as they are within the segments
+    # fetched ahead (as with concurrent reads from the kernel's read-ahead):
+    assert reader.read(3 * SEGMENT, 10) == CONTENT[3 * SEGMENT : 3 * SEGMENT + 10]
+    assert reader.read(2 * SEGMENT + 256, 10) == CONTENT[2 * SEGMENT + 256 :][:10]
+    # Anything else ends the scan:
+    assert reader.read(9 * SEGMENT, 256) is None
+    assert reader.read(9 * SEGMENT + 256, 256) is None
+    assert source.active == 0
+
+
+def test_failed_segment_refetched() -> None:
+    source = FakeSource(fail_at=2 * SEGMENT)
+    reader = SegmentedReader(
+        source.fetch_range, len(CONTENT), get_loop(), segment_size=SEGMENT, segments=3
+    )
+    with pytest.raises(OSError):
+        scan(reader)
+    assert scan(reader, start=2 * SEGMENT) == CONTENT[2 * SEGMENT :]
+
+
+def test_readahead_file(range_server) -> None:
+    fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    range_server.files["/a"] = CONTENT
+    with fs.open(
+        f"{range_server.url}/a",
+        size=len(CONTENT),
+        block_size=SEGMENT,
+        readahead_segments=4,
+        segment_size=SEGMENT,
+    ) as fp:
+        assert fp.readahead is not None
+        chunks = []
+        while data := fp.read(512):
+            chunks.append(data)
+    assert b"".join(chunks) == CONTENT
+    segment_requests = {
+        rng
+        for m, p, rng in range_server.requests
+        if rng is not None and int(rng.partition("=")[2].split("-")[0]) % SEGMENT == 0
+    }
+    assert len(segment_requests) >= 10
+
+
+def test_no_readahead_for_small_file(range_server) -> None:
+    fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    range_server.files["/a"] = CONTENT
+    with fs.open(
+        f"{range_server.url}/a",
+        size=len(CONTENT),
+        readahead_segments=4,
+        segment_size=len(CONTENT),
+    ) as fp:
+        assert fp.readahead is None
+
+
+class FakeStream:
+    def __init__(self, offset: int, break_at: int | None) -> None:
+        self.content = self
+        self.pos = offset
+        self.break_at = break_at
+        self.closed = False
+
+    async def read(self, n: int) -> bytes:
+        if self.break_at is not None and self.pos >= self.break_at:
+            raise aiohttp.ClientPayloadError("Connection lost")
+        data = CONTENT[self.pos : self.pos + min(n, 100)]
+        self.pos += len(data)
+        return data
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_streaming_reopens_broken_stream() -> None:
+    streams: list[FakeStream] = []
+
+    async def open_stream(offset: int) -> FakeStream:
+        s = FakeStream(offset, break_at=5 * SEGMENT if not streams else None)
+        streams.append(s)
+        return s
+
+    reader = StreamingReader(open_stream, len(CONTENT), get_loop(), trigger=SEGMENT)
+    assert scan(reader) == CONTENT
+    assert len(streams) == 2
+    assert streams[0].closed
+
+
+def stream_file(fs: AnnexHTTPFileSystem, url: str) -> AnnexHTTPFile:
+    fp = fs.open(url, block_size=SEGMENT, stream=True)
+    assert isinstance(fp.readahead, StreamingReader)
+    fp.readahead.trigger = SEGMENT
+    return fp
+
+
+def streams(range_server) -> list[str | None]:
+    return [
+        rng
+        for _, _, rng in range_server.requests
+        if rng is not None and rng.endswith("-")
+    ]
+
+
+def test_streaming_file(range_server) -> None:
+    fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    range_server.files["/a"] = CONTENT
+    with stream_file(fs, f"{range_server.url}/a") as fp:
+        chunks = []
+        while data := fp.read(256):
+            chunks.append(data)
+        assert b"".join(chunks) == CONTENT
+    assert len(streams(range_server)) == 1
+    # Only the reads before the stream started were made with ranges:
+    assert range_server.count("/a") <= 3
+
+
+def test_streaming_readline(range_server) -> None:
+    fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    lines = [b"%d %s\n" % (i, b"x" * (i % 50)) for i in range(500)]
+    text = b"".join(lines)
+    range_server.files["/a"] = text
+    with stream_file(fs, f"{range_server.url}/a") as fp:
+        assert list(fp) == lines
+    assert len(streams(range_server)) == 1
+
+
+def test_streaming_seeks(range_server) -> None:
+    fs = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    range_server.files["/a"] = CONTENT
+    with stream_file(fs, f"{range_server.url}/a") as fp:
+        for _ in range(8):
+            fp.read(256)
+        assert fp.readahead.engaged
+        # A read a little ahead of the stream skips to it:
+        fp.seek(3000)
+        assert fp.read(256) == CONTENT[3000:3256]
+        assert fp.readahead.engaged
+        # Going back ends the stream:
+        fp.seek(100)
+        assert fp.read(256) == CONTENT[100:356]
+        assert not fp.readahead.engaged
+    assert len(streams(range_server)) == 1
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from email.utils import formatdate
+import time
+
+import aiohttp
+from fsspec.asyn import get_loop, sync
+import pytest
+
+from datalad_fuse.health import host_health
+from datalad_fuse.retry import (
+    RetryBudget,
+    RetryPolicy,
+    parse_retry_after,
+    send_with_retries,
+)
+from datalad_fuse.transport import RetrySession
+
+FAST = RetryPolicy(attempts=3, base_delay=0.01, max_delay=0.05)
+
+
+class FakeResponse:
+    def __init__(self, status: int, headers: dict[str, str] | None = None) -> None:
+        self.status = status
+        self.headers = headers or {}
+        self.released = False
+
+    def release(self) -> None:
+        self.released = True
+
+
+@pytest.fixture(autouse=True)
+def clean_health():
+    host_health.clear()
+    yield
+    host_health.clear()
+
+
+def test_parse_retry_after() -> None:
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("soon") is None
+    delay = parse_retry_after(formatdate(time.time() + 60, usegmt=True))
+    assert delay is not None
+    assert 55 < delay <= 60
+    assert parse_retry_after(formatdate(time.time() - 60, usegmt=True)) == 0.0
+
+
+def test_backoff_bounds() -> None:
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+    delay = policy.base_delay
+    for _ in range(20):
+        new = policy.backoff(delay)
+        assert 1.0 <= new <= min(10.0, delay * 3)
+        delay = new
+
+
+def test_budget() -> None:
+    budget = RetryBudget(ratio=0.5, burst=2)
+    assert budget.withdraw("http://a.test")
+    assert budget.withdraw("http://a.test")
+    assert not budget.withdraw("http://a.test")
+    assert budget.withdraw("http://b.test")
+    budget.deposit("http://a.test")
+    assert not budget.withdraw("http://a.test")
+    budget.deposit("http://a.test")
+    assert budget.withdraw("http://a.test")
+
+
+def run(
+    responses: list[FakeResponse], budget: RetryBudget | None = None
+) -> tuple[FakeResponse, list[int]]:
+    sent: list[int] = []
+
+    async def send(attempt: int) -> FakeResponse:
+        sent.append(attempt)
+        return responses[len(sent) - 1]
+
+    r = sync(
+        get_loop(),
+        send_with_retries,
+        send,
+        "GET",
+        "http://a.test/x",
+        FAST,
+        budget or RetryBudget(),
+    )
+    return r, sent
+
+
+def test_retry_transient_then_success() -> None:
+    responses = [FakeResponse(503), FakeResponse(429), FakeResponse(200)]
+    r, sent = run(responses)
+    assert r is responses[2]
+    assert sent == [1, 2, 3]
+    assert responses[0].released and responses[1].released
+
+
+def test_no_retry_on_permanent_status() -> None:
+    r, sent = run([FakeResponse(404)])
+    assert r.status == 404
+    assert sent == [1]
+
+
+def test_retry_gives_up_after_attempts() -> None:
+    r, sent = run([FakeResponse(503) for _ in range(3)])
+    assert r.status == 503
+    assert not r.released
+    assert sent == [1, 2, 3]
+
+
+def test_retry_after_too_long() -> None:
+    r, sent = run([FakeResponse(503, {"Retry-After": "3600"})])
+    assert r.status == 503
+    assert sent == [1]
+
+
+def test_retry_after_honored() -> None:
+    start = time.monotonic()
+    r, sent = run([FakeResponse(429, {"Retry-After": "1"}), FakeResponse(200)])
+    assert r.status == 200
+    assert sent == [1, 2]
+    assert time.monotonic() - start >= 1
+
+
+def test_retry_budget_exhausted() -> None:
+    budget = RetryBudget(ratio=0, burst=1)
+    r, sent = run([FakeResponse(503), FakeResponse(200)], budget=budget)
+    assert r.status == 200
+    assert sent == [1, 2]
+    r, sent = run([FakeResponse(503)], budget=budget)
+    assert r.status == 503
+    assert sent == [1]
+
+
+def test_retry_session(range_server) -> None:
+    range_server.errors["/busy"] = 503
+    range_server.error_headers["/busy"] = {"Retry-After": "0"}
+    range_server.errors["/gone"] = 404
+
+    async def fetch(path: str) -> int:
+        session = RetrySession(aiohttp.ClientSession(), policy=FAST)
+        try:
+            async with session.get(f"{range_server.url}{path}") as r:
+                return int(r.status)
+        finally:
+            await session.close()
+
+    assert sync(get_loop(), fetch, "/busy") == 503
+    assert range_server.count("/busy") == FAST.attempts
+    assert sync(get_loop(), fetch, "/gone") == 404
+    assert range_server.count("/gone") == 1
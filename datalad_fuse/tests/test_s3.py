@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+
+from datalad.api import Dataset
+import pytest
+
+from datalad_fuse.fsspec import DatasetAdapter, FileState
+from datalad_fuse.s3 import S3Location, S3Resolver, parse_s3_url
+
+CONTENT = b"\x00This is an S3 object.\xff\n" * 64
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        ("s3://bucket/key.dat", S3Location("bucket", "key.dat")),
+        ("s3://bucket/dir/my%20key.dat", S3Location("bucket", "dir/my key.dat")),
+        (
+            "s3://bucket/dir/key.dat?versionId=abc.123",
+            S3Location("bucket", "dir/key.dat", "abc.123"),
+        ),
+    ],
+)
+def test_parse_s3_url(url: str, expected: S3Location) -> None:
+    assert parse_s3_url(url) == expected
+
+
+@pytest.mark.parametrize("url", ["s3://bucket", "s3:///key", "http://bucket/key"])
+def test_parse_s3_url_invalid(url: str) -> None:
+    with pytest.raises(ValueError):
+        parse_s3_url(url)
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        ("s3://bucket/key.dat", "https://bucket.s3.amazonaws.com/key.dat"),
+        (
+            "s3://bucket/dir/key.dat?versionId=v1",
+            "https://bucket.s3.amazonaws.com/dir/key.dat?versionId=v1",
+        ),
+    ],
+)
+def test_to_http_anonymous(url: str, expected: str) -> None:
+    assert S3Resolver().to_http(url) == expected
+
+
+def test_clients_are_shared() -> None:
+    endpoint = "http://127.0.0.1:9"
+    assert (
+        S3Resolver(endpoint_url=endpoint).get_client()
+        is S3Resolver(endpoint_url=endpoint).get_client()
+    )
+
+
+@pytest.mark.parametrize("version_id", [None, "v1"])
+def test_open_s3_only(
+    range_server,
+    tmp_path: Path,
+    tmp_home: Path,  # noqa: U100
+    version_id: Optional[str],
+) -> None:
+    ds = Dataset(tmp_path / "ds").create()
+    (ds.pathobj / "data.bin").write_bytes(CONTENT)
+    ds.save(message="Add data")
+    key = ds.repo.call_annex_oneline(["lookupkey", "data.bin"])
+    s3_url = "s3://bucket/objects/data.bin"
+    if version_id is not None:
+        s3_url += f"?versionId={version_id}"
+    ds.repo.call_annex(["registerurl", key, s3_url])
+    ds.repo.call_annex(["drop", "--force", "data.bin"])
+    ds.config.set("datalad.fusefs.s3-endpoint", range_server.url, scope="local")
+    range_server.files["/bucket/objects/data.bin"] = CONTENT
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        assert dsap.get_file_state("data.bin")[0] is FileState.NO_CONTENT
+        with dsap.open("data.bin") as fp:
+            fp.seek(100)
+            assert fp.read(200) == CONTENT[100:300]
+    finally:
+        dsap.close()
+    path = "/bucket/objects/data.bin"
+    if version_id is not None:
+        path += f"?versionId={version_id}"
+    assert range_server.count(path) > 0
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import threading
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from datalad_fuse.fsspec import get_client
+from datalad_fuse.httpfile import AnnexHTTPFileSystem, write_body
+from datalad_fuse.spool import SPOOL_CHUNK_SIZE, Spooler, range_support
+
+CONTENT = os.urandom(64 * 1024 + 123)
+BLOCK = 4096
+
+
+@pytest.fixture
+def fs() -> AnnexHTTPFileSystem:
+    return AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+
+
+@pytest.fixture(autouse=True)
+def clean_range_support():
+    range_support.clear()
+    yield
+    range_support.clear()
+
+
+def test_spool_without_range_support(fs, range_server, tmp_path: Path) -> None:
+    range_server.files["/a"] = CONTENT
+    range_server.no_range.add("/a")
+    spooler = Spooler(tmp_path)
+    with fs.open(
+        f"{range_server.url}/a",
+        size=len(CONTENT),
+        block_size=BLOCK,
+        spooler=spooler,
+        spool_name="KEY-a",
+    ) as fp:
+        for offset in [5 * BLOCK + 7, 100, 12 * BLOCK, 0]:
+            fp.seek(offset)
+            assert fp.read(BLOCK) == CONTENT[offset : offset + BLOCK]
+    assert range_server.count("/a") == 1
+    assert range_support.ignores_ranges(range_server.url)
+    assert spooler.path_for("KEY-a").read_bytes() == CONTENT
+    # Files from the same host are spooled without trying a range request:
+    range_server.files["/b"] = CONTENT[::-1]
+    range_server.no_range.add("/b")
+    with fs.open(
+        f"{range_server.url}/b", size=len(CONTENT), block_size=BLOCK, spooler=spooler
+    ) as fp:
+        fp.seek(3 * BLOCK)
+        assert fp.read(10) == CONTENT[::-1][3 * BLOCK : 3 * BLOCK + 10]
+    assert [rng for _, p, rng in range_server.requests if p == "/b"] == [None]
+    # A spooled file is not downloaded again:
+    with fs.open(
+        f"{range_server.url}/a", size=len(CONTENT), spooler=spooler, spool_name="KEY-a"
+    ) as fp:
+        assert fp.read() == CONTENT
+    assert range_server.count("/a") == 1
+    spooler.clear()
+    assert not tmp_path.exists()
+
+
+def test_concurrent_readers_share_download(fs, range_server, tmp_path: Path) -> None:
+    range_server.files["/a"] = CONTENT
+    range_server.no_range.add("/a")
+    range_server.delays["/a"] = 0.2
+    range_support.record_ignored(range_server.url)
+    spooler = Spooler(tmp_path)
+
+    def read(offset: int) -> bytes:
+        with fs.open(
+            f"{range_server.url}/a",
+            size=len(CONTENT),
+            block_size=BLOCK,
+            spooler=spooler,
+            spool_name="KEY-a",
+        ) as fp:
+            fp.seek(offset)
+            data: bytes = fp.read(BLOCK)
+            return data
+
+    offsets = [i * BLOCK + i for i in range(8)]
+    with ThreadPoolExecutor(max_workers=len(offsets)) as pool:
+        datas = list(pool.map(read, offsets))
+    assert datas == [CONTENT[o : o + BLOCK] for o in offsets]
+    assert range_server.count("/a") == 1
+
+
+def test_spool_size_mismatch(fs, range_server, tmp_path: Path) -> None:
+    range_server.files["/a"] = CONTENT
+    range_server.no_range.add("/a")
+    spooler = Spooler(tmp_path)
+    with fs.open(
+        f"{range_server.url}/a",
+        size=len(CONTENT) + 1,
+        block_size=BLOCK,
+        spooler=spooler,
+    ) as fp:
+        fp.seek(BLOCK)
+        with pytest.raises(OSError, match="expected"):
+            fp.read(BLOCK)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_no_spooler_reads_from_start_only(fs, range_server) -> None:
+    range_server.files["/a"] = CONTENT
+    range_server.no_range.add("/a")
+    with fs.open(f"{range_server.url}/a", size=len(CONTENT), block_size=BLOCK) as fp:
+        assert fp.read(BLOCK) == CONTENT[:BLOCK]
+        fp.seek(5 * BLOCK)
+        with pytest.raises(ValueError):
+            fp.read(BLOCK)
+    assert range_support.ignores_ranges(range_server.url)
+
+
+def test_write_body_off_loop(tmp_path: Path) -> None:
+    chunks = [b"a" * SPOOL_CHUNK_SIZE, b"b" * 10]
+    writers = set()
+
+    class Content:
+        async def read(self, _n: int) -> bytes:
+            return chunks.pop(0) if chunks else b""
+
+    class RecordingPath:
+        def __init__(self, path: Path) -> None:
+            self.path = path
+
+        def open(self, mode: str) -> Any:
+            fp = self.path.open(mode)
+            write = fp.write
+
+            def recording_write(data: bytes) -> int:
+                writers.add(threading.get_ident())
+                return write(data)
+
+            fp.write = recording_write
+            return fp
+
+    async def main() -> int:
+        await write_body(SimpleNamespace(content=Content()), RecordingPath(path))
+        return threading.get_ident()
+
+    path = tmp_path / "body"
+    loop_thread = asyncio.run(main())
+    assert path.read_bytes() == b"a" * SPOOL_CHUNK_SIZE + b"b" * 10
+    # All writes happened outside of the thread running the event loop:
+    assert writers and loop_thread not in writers
+
+
+def test_spool_eviction(fs, range_server, tmp_path: Path) -> None:
+    for name in ["a", "b", "c"]:
+        range_server.files[f"/{name}"] = CONTENT
+        range_server.no_range.add(f"/{name}")
+    spooler = Spooler(tmp_path, max_size=2 * len(CONTENT))
+
+    def read(name: str) -> bytes:
+        with fs.open(
+            f"{range_server.url}/{name}",
+            size=len(CONTENT),
+            block_size=BLOCK,
+            spooler=spooler,
+            spool_name=f"KEY-{name}",
+        ) as fp:
+            fp.seek(BLOCK)
+            data: bytes = fp.read(BLOCK)
+            return data
+
+    assert read("a") == CONTENT[BLOCK : 2 * BLOCK]
+    os.utime(spooler.path_for("KEY-a"), (0, 0))
+    assert read("b") == CONTENT[BLOCK : 2 * BLOCK]
+    os.utime(spooler.path_for("KEY-b"), (1, 1))
+    # Using a spooled object marks it as recently used:
+    assert read("a") == CONTENT[BLOCK : 2 * BLOCK]
+    assert range_server.count("/a") == 1
+    assert read("c") == CONTENT[BLOCK : 2 * BLOCK]
+    assert spooler.path_for("KEY-a").exists()
+    assert not spooler.path_for("KEY-b").exists()
+    assert spooler.path_for("KEY-c").exists()
+
+
+def test_read_evicted(fs, range_server, tmp_path: Path) -> None:
+    range_server.files["/a"] = CONTENT
+    range_server.no_range.add("/a")
+    spooler = Spooler(tmp_path)
+    with fs.open(
+        f"{range_server.url}/a",
+        size=len(CONTENT),
+        block_size=BLOCK,
+        spooler=spooler,
+        spool_name="KEY-a",
+    ) as fp:
+        assert fp.read(BLOCK) == CONTENT[:BLOCK]
+        spooler.path_for("KEY-a").unlink()
+        fp.seek(5 * BLOCK)
+        assert fp.read(BLOCK) == CONTENT[5 * BLOCK : 6 * BLOCK]
+    assert range_server.count("/a") == 2
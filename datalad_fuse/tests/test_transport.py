@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from fsspec.asyn import sync
+from fsspec.implementations.http import HTTPFileSystem
+
+from datalad_fuse.fsspec import get_client
+from datalad_fuse.httpfile import AnnexHTTPFileSystem
+from datalad_fuse.transport import (
+    DEFAULT_CONNECTIONS,
+    ConnectionPool,
+    PoolConfig,
+    connection_pool,
+)
+
+
+class FakeConfig(dict):
+    def get(self, key, default=None):
+        return super().get(key, default)
+
+
+def test_pool_config() -> None:
+    config = PoolConfig.from_config(
+        FakeConfig(
+            {
+                "datalad.fusefs.http-connections-per-host": "4",
+                "datalad.fusefs.http-keepalive": "30",
+                "datalad.fusefs.http-dns-ttl": "60",
+            }
+        )
+    )
+    assert config == PoolConfig(
+        limit=DEFAULT_CONNECTIONS, limit_per_host=4, keepalive=30.0, dns_ttl=60
+    )
+
+
+def test_sessions_share_connections(served_files) -> None:
+    fs1 = AnnexHTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    fs2 = HTTPFileSystem(get_client=get_client, skip_instance_cache=True)
+    dfile = served_files[0]
+    assert fs1.cat_file(dfile.url) == dfile.content
+    session1 = sync(fs1.loop, fs1.set_session)
+    session2 = sync(fs2.loop, fs2.set_session)
+    assert session1 is not session2
+    conn = session1._client.connector
+    assert session2._client.connector is conn
+    assert conn.limit_per_host == connection_pool.config.limit_per_host
+    assert fs2.cat_file(dfile.url) == dfile.content
+
+
+def test_pool_close() -> None:
+    pool = ConnectionPool(PoolConfig(limit_per_host=2))
+    fs = HTTPFileSystem(skip_instance_cache=True)
+
+    async def get_connector():
+        return pool.get_connector()
+
+    conn = sync(fs.loop, get_connector)
+    assert conn.limit_per_host == 2
+    assert sync(fs.loop, get_connector) is conn
+    pool.close()
+    assert conn.closed
+    assert sync(fs.loop, get_connector) is not conn
+    pool.close()
+
+
+def test_pool_configure() -> None:
+    pool = ConnectionPool(PoolConfig(limit_per_host=2))
+    fs = HTTPFileSystem(skip_instance_cache=True)
+
+    async def get_connector():
+        return pool.get_connector()
+
+    conn = sync(fs.loop, get_connector)
+    pool.configure(FakeConfig({"datalad.fusefs.http-connections-per-host": "2"}))
+    assert sync(fs.loop, get_connector) is conn
+    pool.configure(FakeConfig({"datalad.fusefs.http-connections-per-host": "4"}))
+    assert pool.config.limit_per_host == 4
+    conn2 = sync(fs.loop, get_connector)
+    assert conn2 is not conn
+    assert conn2.limit_per_host == 4
+    # The old connector is left open for sessions still using it:
+    assert not conn.closed
+    pool.close()
+    assert conn.closed
+    assert conn2.closed
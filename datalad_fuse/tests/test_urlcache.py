@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from pathlib import Path
+import time
+
+import pytest
+
+from datalad_fuse.fsspec import DatasetAdapter
+from datalad_fuse.urlcache import URLCache
+
+KEY = "MD5E-s1064--8804d3d11f17e33bd912f1f0947afdb9.json"
+
+
+def test_urlcache_persistence(tmp_path: Path) -> None:
+    dbpath = tmp_path / "sub" / "urls.sqlite"
+    cache = URLCache(dbpath)
+    assert cache.get_working(KEY) is None
+    cache.record_failure(KEY, "http://example.com/dead")
+    cache.record_success(KEY, "http://example.com/alive")
+    cache.close()
+    cache = URLCache(dbpath)
+    assert cache.get_working(KEY) == "http://example.com/alive"
+    assert cache.is_dead(KEY, "http://example.com/dead")
+    assert not cache.is_dead(KEY, "http://example.com/alive")
+    assert not cache.is_dead("other-key", "http://example.com/dead")
+    cache.clear()
+    assert cache.get_working(KEY) is None
+    cache.close()
+
+
+def test_urlcache_expiry(tmp_path: Path) -> None:
+    cache = URLCache(tmp_path / "urls.sqlite", ttl=60, negative_ttl=0.01)
+    cache.record_failure(KEY, "http://example.com/dead")
+    cache.record_success(KEY, "http://example.com/alive")
+    time.sleep(0.05)
+    assert not cache.is_dead(KEY, "http://example.com/dead")
+    assert cache.get_working(KEY) == "http://example.com/alive"
+    cache.ttl = 0.01
+    assert cache.get_working(KEY) is None
+    cache.close()
+
+
+def test_urlcache_failure_supersedes_success(tmp_path: Path) -> None:
+    cache = URLCache(tmp_path / "urls.sqlite")
+    cache.record_success(KEY, "http://example.com/a")
+    cache.record_failure(KEY, "http://example.com/a")
+    assert cache.get_working(KEY) is None
+    assert cache.is_dead(KEY, "http://example.com/a")
+    cache.close()
+
+
+def test_reopen_uses_cached_url(url_dataset, monkeypatch: pytest.MonkeyPatch) -> None:
+    ds, data_files = url_dataset
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        for fname, blob in data_files.items():
+            with dsap.open(fname) as fp:
+                assert fp.read() == blob
+    finally:
+        dsap.close()
+
+    def fail(*_args, **_kwargs):
+        raise AssertionError("get_urls() should not be called")
+
+    monkeypatch.setattr(DatasetAdapter, "get_urls", fail)
+    dsap = DatasetAdapter(ds.path, caching=False)
+    try:
+        for fname, blob in data_files.items():
+            fstate, _ = dsap.get_file_state(fname)
+            if fstate.name == "NO_CONTENT":
+                with dsap.open(fname) as fp:
+                    assert fp.read() == blob
+    finally:
+        dsap.close()
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Lock
+import time
+from typing import Any, Optional
+
+#: The active `Tracer`, if any
+_active: Optional[Tracer] = None
+
+
+class Tracer:
+    """Records the steps taken to resolve and open a file and the HTTP
+    requests made meanwhile, with their timings, for ``fsspec-explain``.
+
+    Recording is process-wide, as HTTP requests run in fsspec's event loop
+    thread rather than the thread that started them.
+    """
+
+    def __init__(self) -> None:
+        self.start = time.monotonic()
+        self.steps: list[dict[str, Any]] = []
+        self.requests: list[dict[str, Any]] = []
+        self._lock = Lock()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def add_step(self, step: dict[str, Any]) -> None:
+        with self._lock:
+            self.steps.append(step)
+
+    def add_request(self, request: dict[str, Any]) -> None:
+        with self._lock:
+            self.requests.append(request)
+
+    def as_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "steps": sorted(self.steps, key=lambda s: s["start"]),
+                "requests": sorted(self.requests, key=lambda r: r["start"]),
+                "total": round(self.elapsed(), 6),
+            }
+
+
+@contextmanager
+def tracing() -> Iterator[Tracer]:
+    """Record steps and requests made within the ``with`` block"""
+    global _active
+    tracer = _active = Tracer()
+    try:
+        yield tracer
+    finally:
+        _active = None
+
+
+@contextmanager
+def traced(step: str, **info: Any) -> Iterator[dict[str, Any]]:
+    """Time a step of resolving a file if tracing is active.
+
+    Yields a `dict` of details about the step (initially ``info``) that the
+    ``with`` block can add to.  If the block raises, the exception is
+    recorded as the step's ``error``.
+    """
+    tracer = _active
+    if tracer is None:
+        yield info
+        return
+    start = tracer.elapsed()
+    try:
+        yield info
+    except BaseException as e:
+        info["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        tracer.add_step(
+            {
+                "step": step,
+                "start": round(start, 6),
+                "duration": round(tracer.elapsed() - start, 6),
+                **info,
+            }
+        )
+
+
+def trace_request(
+    method: str,
+    url: str,
+    start: float,
+    attempt: int,
+    status: Optional[int] = None,
+    error: Optional[BaseException] = None,
+) -> None:
+    """Record an HTTP request that started at ``start`` (per
+    `time.monotonic()`) if tracing is active"""
+    tracer = _active
+    if tracer is None:
+        return
+    request: dict[str, Any] = {
+        "method": method,
+        "url": url,
+        "start": round(start - tracer.start, 6),
+        "latency": round(time.monotonic() - start, 6),
+        "attempt": attempt,
+    }
+    if status is not None:
+        request["status"] = status
+    if error is not None:
+        request["error"] = f"{type(error).__name__}: {error}"
+    tracer.add_request(request)
@@ -0,0 +1,504 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+from collections.abc import AsyncIterator, Coroutine, Generator
+from dataclasses import dataclass
+import json
+import logging
+from threading import Lock
+import time
+from types import TracebackType
+from typing import Any, Generic, Optional, TypeVar
+import weakref
+
+import aiohttp
+from datalad import cfg
+from datalad.config import anything2bool
+from fsspec.asyn import sync
+from multidict import CIMultiDict, CIMultiDictProxy
+import yarl
+
+from .health import host_health, host_of
+from .limits import HostLimiter, host_limiter
+from .retry import (
+    Response,
+    RetryBudget,
+    RetryPolicy,
+    retry_budget,
+    retry_policy,
+    send_with_retries,
+)
+from .trace import trace_request
+
+try:
+    import h2  # noqa: F401
+    import httpx
+except ImportError:
+    HTTP2_AVAILABLE = False
+else:
+    HTTP2_AVAILABLE = True
+
+lgr = logging.getLogger("datalad.fuse.transport")
+
+#: Default maximum number of simultaneous HTTP connections
+DEFAULT_CONNECTIONS = 100
+
+#: Default maximum number of simultaneous HTTP connections to a single host
+DEFAULT_CONNECTIONS_PER_HOST = 16
+
+#: Default number of seconds for which an idle connection is kept open
+DEFAULT_KEEPALIVE = 60.0
+
+#: Default number of seconds for which DNS lookups are cached
+DEFAULT_DNS_TTL = 300
+
+#: Seconds allowed for establishing a connection
+CONNECT_TIMEOUT = 30.0
+
+#: Seconds allowed for a whole request over aiohttp, and for each read from a
+#: response over HTTP/2
+READ_TIMEOUT = 300.0
+
+R = TypeVar("R", bound=Response)
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    limit: int = DEFAULT_CONNECTIONS
+    limit_per_host: int = DEFAULT_CONNECTIONS_PER_HOST
+    keepalive: float = DEFAULT_KEEPALIVE
+    dns_ttl: int = DEFAULT_DNS_TTL
+    http2: bool = False
+
+    @classmethod
+    def from_config(cls, config: Any = cfg) -> PoolConfig:
+        """Read the pool settings from the ``datalad.fusefs.http-*``
+        configuration options"""
+        return cls(
+            limit=int(
+                config.get("datalad.fusefs.http-connections", DEFAULT_CONNECTIONS)
+            ),
+            limit_per_host=int(
+                config.get(
+                    "datalad.fusefs.http-connections-per-host",
+                    DEFAULT_CONNECTIONS_PER_HOST,
+                )
+            ),
+            keepalive=float(
+                config.get("datalad.fusefs.http-keepalive", DEFAULT_KEEPALIVE)
+            ),
+            dns_ttl=int(config.get("datalad.fusefs.http-dns-ttl", DEFAULT_DNS_TTL)),
+            http2=anything2bool(config.get("datalad.fusefs.http2", False)),
+        )
+
+
+class ConnectionPool:
+    """Process-wide pool of HTTP connections.
+
+    Every client session created by `get_client()` -- and thus every HTTP
+    file system, for whichever dataset -- uses the same connector, so
+    connections (with their TLS sessions) are kept alive and reused across
+    datasets, and DNS lookups are cached, while the number of connections
+    per host is bounded.  As a connector is bound to an event loop, there is
+    one per loop, which in practice means one for fsspec's I/O loop.
+
+    When HTTP/2 is enabled, the pool likewise holds one `httpx.AsyncClient`
+    per loop, over which all concurrent requests to a host are multiplexed.
+
+    The pool is configured from the global configuration on import and can
+    be reconfigured from a dataset's with `configure()`.
+    """
+
+    def __init__(self, config: PoolConfig) -> None:
+        self.config = config
+        self._connectors: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, aiohttp.TCPConnector
+        ] = weakref.WeakKeyDictionary()
+        self._http2_clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, httpx.AsyncClient
+        ] = weakref.WeakKeyDictionary()
+        self._warned_http2 = False
+        # Connectors & clients created with a previous configuration, which
+        # sessions may still be using
+        self._retired: list[
+            tuple[asyncio.AbstractEventLoop, aiohttp.TCPConnector | httpx.AsyncClient]
+        ] = []
+        self._lock = Lock()
+
+    def configure(self, config: Any) -> None:
+        """Set ``config`` from the ``datalad.fusefs.http-*`` and
+        ``datalad.fusefs.http2`` options in ``config``.  Sessions created
+        afterwards use new connections with those settings; the existing
+        connections are closed along with the pool."""
+        new_config = PoolConfig.from_config(config)
+        with self._lock:
+            if new_config == self.config:
+                return
+            lgr.debug("Reconfiguring HTTP connection pool with %s", new_config)
+            self.config = new_config
+            self._retired.extend(self._connectors.items())
+            self._retired.extend(self._http2_clients.items())
+            self._connectors.clear()
+            self._http2_clients.clear()
+
+    def get_connector(self) -> aiohttp.TCPConnector:
+        """Return the connector for the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            conn = self._connectors.get(loop)
+            if conn is None or conn.closed:
+                lgr.debug("Creating HTTP connection pool with %s", self.config)
+                conn = self._connectors[loop] = aiohttp.TCPConnector(
+                    limit=self.config.limit,
+                    limit_per_host=self.config.limit_per_host,
+                    keepalive_timeout=self.config.keepalive,
+                    ttl_dns_cache=self.config.dns_ttl,
+                )
+            return conn
+
+    def get_http2_client(self) -> Optional[httpx.AsyncClient]:
+        """Return the HTTP/2 client for the running event loop, or `None` if
+        the optional dependencies for HTTP/2 are not installed"""
+        if not HTTP2_AVAILABLE:
+            if not self._warned_http2:
+                lgr.warning(
+                    "HTTP/2 requested, but httpx[http2] is not installed;"
+                    " using HTTP/1.1"
+                )
+                self._warned_http2 = True
+            return None
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._http2_clients.get(loop)
+            if client is None or client.is_closed:
+                lgr.debug("Creating HTTP/2 client with %s", self.config)
+                client = self._http2_clients[loop] = new_http2_client(self.config)
+            return client
+
+    def close(self) -> None:
+        with self._lock:
+            conns = list(self._connectors.items())
+            self._connectors.clear()
+            clients = list(self._http2_clients.items())
+            self._http2_clients.clear()
+            for loop, c in self._retired:
+                if isinstance(c, aiohttp.TCPConnector):
+                    conns.append((loop, c))
+                else:
+                    clients.append((loop, c))
+            self._retired.clear()
+        for loop, conn in conns:
+            if loop.is_running() and not conn.closed:
+                try:
+                    sync(loop, conn.close, timeout=0.1)
+                except Exception as e:
+                    lgr.debug("Error closing HTTP connection pool: %s", e)
+        for loop, client in clients:
+            if loop.is_running() and not client.is_closed:
+                try:
+                    sync(loop, client.aclose, timeout=0.1)
+                except Exception as e:
+                    lgr.debug("Error closing HTTP/2 client: %s", e)
+
+
+def new_http2_client(config: PoolConfig, http1: bool = True) -> httpx.AsyncClient:
+    """Create an `httpx.AsyncClient` that negotiates HTTP/2 with servers that
+    support it.
+
+    HTTP/2 is negotiated via TLS (ALPN), so plain ``http://`` URLs are
+    fetched over HTTP/1.1 unless ``http1`` is false, in which case HTTP/2 is
+    spoken to all servers without negotiation ("prior knowledge").
+    """
+    return httpx.AsyncClient(
+        http1=http1,
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=config.limit,
+            max_keepalive_connections=config.limit,
+            keepalive_expiry=config.keepalive,
+        ),
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT, pool=None),
+    )
+
+
+def translate_error(e: Exception) -> Exception:
+    """Convert an httpx exception to the aiohttp exception that callers of a
+    client session expect"""
+    err: Exception
+    if isinstance(e, httpx.TimeoutException):
+        err = aiohttp.ServerTimeoutError(str(e))
+    elif isinstance(e, httpx.TransportError):
+        err = aiohttp.ClientConnectionError(str(e))
+    else:
+        err = aiohttp.ClientError(str(e))
+    return err
+
+
+class RequestContext(Generic[R]):
+    """Result of a session's ``get()`` & ``head()``, which can be awaited or
+    used as an async context manager, like aiohttp's"""
+
+    def __init__(self, coro: Coroutine[Any, Any, R]) -> None:
+        self._coro = coro
+        self._response: Optional[R] = None
+
+    def __await__(self) -> Generator[Any, None, R]:
+        return self._coro.__await__()
+
+    async def __aenter__(self) -> R:
+        self._response = await self._coro
+        return self._response
+
+    async def __aexit__(
+        self,
+        _exc_type: Optional[type[BaseException]],
+        _exc_val: Optional[BaseException],
+        _exc_tb: Optional[TracebackType],
+    ) -> None:
+        if self._response is not None:
+            self._response.release()
+
+
+class RetrySession:
+    """`aiohttp.ClientSession` wrapper that retries requests as specified by
+    a `RetryPolicy` and allowed by a `RetryBudget`.
+
+    Each attempt is numbered in the ``trace_request_ctx`` passed to the
+    session's trace hooks as ``current_attempt``.
+    """
+
+    def __init__(
+        self,
+        client_session: aiohttp.ClientSession,
+        policy: RetryPolicy = retry_policy,
+        budget: RetryBudget = retry_budget,
+        limiter: HostLimiter = host_limiter,
+    ) -> None:
+        self._client = client_session
+        self.policy = policy
+        self.budget = budget
+        self.limiter = limiter
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._client.closed)
+
+    def get(self, url: str | yarl.URL, **kwargs: Any) -> RequestContext:
+        return RequestContext(self.request("GET", url, **kwargs))
+
+    def head(self, url: str | yarl.URL, **kwargs: Any) -> RequestContext:
+        return RequestContext(self.request("HEAD", url, **kwargs))
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    async def request(self, method: str, url: str | yarl.URL, **kwargs: Any) -> Any:
+        async def send(attempt: int) -> Any:
+            return await self._client.request(
+                method, url, trace_request_ctx={"current_attempt": attempt}, **kwargs
+            )
+
+        return await send_with_retries(
+            send, method, str(url), self.policy, self.budget, self.limiter
+        )
+
+
+class HTTP2Session:
+    """Adapter exposing an `httpx.AsyncClient` through the parts of the
+    `aiohttp.ClientSession` interface used by fsspec and this package.
+
+    As with `RetrySession`, requests are retried as specified by ``policy``,
+    and the outcome of each attempt is recorded in `host_health` and traced.
+    The client is shared via `ConnectionPool`, so closing a session leaves
+    it open.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        policy: RetryPolicy = retry_policy,
+        budget: RetryBudget = retry_budget,
+        limiter: HostLimiter = host_limiter,
+    ) -> None:
+        self.client = client
+        self.policy = policy
+        self.budget = budget
+        self.limiter = limiter
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.client.is_closed)
+
+    def get(self, url: str | yarl.URL, **kwargs: Any) -> RequestContext:
+        return RequestContext(self.request("GET", url, **kwargs))
+
+    def head(self, url: str | yarl.URL, **kwargs: Any) -> RequestContext:
+        kwargs.setdefault("allow_redirects", False)
+        return RequestContext(self.request("HEAD", url, **kwargs))
+
+    async def close(self) -> None:
+        pass
+
+    async def request(
+        self,
+        method: str,
+        url: str | yarl.URL,
+        headers: Optional[dict[str, str]] = None,
+        params: Optional[dict[str, str]] = None,
+        allow_redirects: bool = True,
+        **kwargs: Any,
+    ) -> HTTP2Response:
+        if kwargs:
+            raise TypeError(
+                f"Request options not supported over HTTP/2: {', '.join(kwargs)}"
+            )
+        url = str(url)
+        host = host_of(url)
+
+        async def send(attempt: int) -> HTTP2Response:
+            start = time.monotonic()
+            request = self.client.build_request(
+                method, url, headers=headers, params=params
+            )
+            try:
+                r = await self.client.send(
+                    request, stream=True, follow_redirects=allow_redirects
+                )
+            except httpx.HTTPError as e:
+                host_health.record_failure(host)
+                trace_request(method, url, start, attempt, error=e)
+                raise translate_error(e) from e
+            host_health.record_response(host, r.status_code, time.monotonic() - start)
+            trace_request(method, url, start, attempt, status=r.status_code)
+            return HTTP2Response(r)
+
+        r: HTTP2Response = await send_with_retries(
+            send, method, url, self.policy, self.budget, self.limiter
+        )
+        return r
+
+
+class HTTP2Response:
+    """Adapter exposing an `httpx.Response` through the parts of the
+    `aiohttp.ClientResponse` interface used by fsspec and this package"""
+
+    def __init__(self, response: httpx.Response) -> None:
+        self._response = response
+        self.method = response.request.method
+        self.status: int = response.status_code
+        self.reason: str = response.reason_phrase
+        self.version: str = response.http_version
+        self.headers = CIMultiDictProxy(CIMultiDict(response.headers.multi_items()))
+        self.url = yarl.URL(str(response.url), encoded=True)
+        self.history = tuple(response.history)
+        self.content = HTTP2StreamReader(response)
+
+    @property
+    def request_info(self) -> aiohttp.RequestInfo:
+        request = self._response.request
+        return aiohttp.RequestInfo(
+            url=yarl.URL(str(request.url), encoded=True),
+            method=request.method,
+            headers=CIMultiDictProxy(CIMultiDict(request.headers.multi_items())),
+            real_url=self.url,
+        )
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._response.is_closed)
+
+    def raise_for_status(self) -> None:
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(
+                self.request_info,
+                (),
+                status=self.status,
+                message=self.reason,
+                headers=self.headers,
+            )
+
+    async def read(self) -> bytes:
+        return await self.content.read()
+
+    async def text(self, encoding: Optional[str] = None, errors: str = "strict") -> str:
+        data = await self.read()
+        return data.decode(encoding or self._response.encoding or "utf-8", errors)
+
+    async def json(self, **_kwargs: Any) -> Any:
+        return json.loads(await self.read())
+
+    def close(self) -> None:
+        if not self.closed:
+            asyncio.ensure_future(self._response.aclose())
+
+    release = close
+
+    async def aclose(self) -> None:
+        await self._response.aclose()
+
+    async def __aenter__(self) -> HTTP2Response:
+        return self
+
+    async def __aexit__(
+        self,
+        _exc_type: Optional[type[BaseException]],
+        _exc_val: Optional[BaseException],
+        _exc_tb: Optional[TracebackType],
+    ) -> None:
+        await self.aclose()
+
+
+class HTTP2StreamReader:
+    """Adapter exposing the body of a streamed `httpx.Response` through the
+    parts of the `aiohttp.StreamReader` interface used by fsspec and this
+    package"""
+
+    def __init__(self, response: httpx.Response) -> None:
+        self._chunks: AsyncIterator[bytes] = response.aiter_bytes()
+        self._buffer = bytearray()
+        self._eof = False
+
+    async def _fill(self) -> None:
+        """Wait until data is buffered or the end of the body is reached"""
+        while not self._buffer and not self._eof:
+            try:
+                self._buffer += await self._chunks.__anext__()
+            except StopAsyncIteration:
+                self._eof = True
+            except httpx.HTTPError as e:
+                raise translate_error(e) from e
+
+    async def read(self, n: int = -1) -> bytes:
+        """Read up to ``n`` bytes, or everything if ``n`` is negative"""
+        if n < 0:
+            chunks = []
+            while True:
+                await self._fill()
+                if not self._buffer:
+                    break
+                chunks.append(bytes(self._buffer))
+                self._buffer.clear()
+            return b"".join(chunks)
+        await self._fill()
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+    async def readany(self) -> bytes:
+        await self._fill()
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    async def iter_chunked(self, n: int) -> AsyncIterator[bytes]:
+        while data := await self.read(n):
+            yield data
+
+    def at_eof(self) -> bool:
+        return self._eof and not self._buffer
+
+
+connection_pool = ConnectionPool(PoolConfig.from_config())
+
+atexit.register(connection_pool.close)
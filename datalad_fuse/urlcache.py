@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+import sqlite3
+from threading import Lock
+import time
+from typing import Optional
+
+lgr = logging.getLogger("datalad.fuse.urlcache")
+
+#: Default lifetime (in seconds) of a URL known to serve a key
+DEFAULT_TTL = 7 * 24 * 3600
+
+#: Default lifetime (in seconds) of a URL known *not* to serve a key
+DEFAULT_NEGATIVE_TTL = 3600
+
+
+class URLCache:
+    """Persistent mapping from annex keys to the URLs that serve them.
+
+    Both working URLs and URLs that were found not to provide a key (e.g.,
+    because they returned 404) are recorded, each with the time at which
+    this was last observed, so that later opens -- possibly by a different
+    process, e.g. ``fsspec-head`` after ``fusefs`` -- can go straight to a
+    working URL and skip known-dead candidates.
+
+    The cache is stored in an SQLite database; if it cannot be created
+    (e.g., read-only dataset), an in-memory database is used instead.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None,
+        ttl: float = DEFAULT_TTL,
+        negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+    ) -> None:
+        self.path = Path(path) if path is not None else None
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = Lock()
+        self._db = self._connect()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS urls ("
+                " key TEXT NOT NULL,"
+                " url TEXT NOT NULL,"
+                " ok INTEGER NOT NULL,"
+                " checked REAL NOT NULL,"
+                " PRIMARY KEY (key, url)"
+                ")"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS layouts ("
+                " root TEXT PRIMARY KEY,"
+                " layout TEXT NOT NULL,"
+                " checked REAL NOT NULL"
+                ")"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.path is not None:
+            try:
+                os.makedirs(self.path.parent, exist_ok=True)
+                return sqlite3.connect(
+                    str(self.path), timeout=10, check_same_thread=False
+                )
+            except (OSError, sqlite3.Error) as e:
+                lgr.warning(
+                    "Could not open URL cache at %s: %s; using in-memory cache",
+                    self.path,
+                    e,
+                )
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def get_working(self, key: str) -> Optional[str]:
+        """Return the most recently confirmed working URL for ``key``"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT url FROM urls WHERE key = ? AND ok = 1 AND checked >= ?"
+                " ORDER BY checked DESC LIMIT 1",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def is_dead(self, key: str, url: str) -> bool:
+        """Whether ``url`` was recently found not to serve ``key``"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM urls WHERE key = ? AND url = ? AND ok = 0"
+                " AND checked >= ?",
+                (key, url, time.time() - self.negative_ttl),
+            ).fetchone()
+        return row is not None
+
+    def record_success(self, key: str, url: str) -> None:
+        self._record(key, url, True)
+
+    def record_failure(self, key: str, url: str) -> None:
+        self._record(key, url, False)
+
+    def _record(self, key: str, url: str, ok: bool) -> None:
+        lgr.debug("Recording %s as %s for %s", url, "working" if ok else "dead", key)
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO urls (key, url, ok, checked)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, url, int(ok), time.time()),
+                )
+        except sqlite3.Error as e:
+            lgr.debug("Failed to record URL %s for %s: %s", url, key, e)
+
+    def get_layout(self, root: str) -> Optional[str]:
+        """Return the object-path layout last seen served by remote ``root``"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT layout FROM layouts WHERE root = ? AND checked >= ?",
+                (root, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def set_layout(self, root: str, layout: str) -> None:
+        try:
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO layouts (root, layout, checked)"
+                    " VALUES (?, ?, ?)",
+                    (root, layout, time.time()),
+                )
+        except sqlite3.Error as e:
+            lgr.debug("Failed to record layout %s for %s: %s", layout, root, e)
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM urls")
+            self._db.execute("DELETE FROM layouts")
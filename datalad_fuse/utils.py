@@ -20,6 +20,14 @@ class AnnexKey:
     chunk_number: Optional[int] = None
     suffix: Optional[str] = None
 
+    @property
+    def content_size(self) -> Optional[int]:
+        """Size of the key's content -- for a chunk key, of just that chunk"""
+        if self.size is None or self.chunk_size is None or self.chunk_number is None:
+            return self.size
+        start = (self.chunk_number - 1) * self.chunk_size
+        return max(0, min(self.chunk_size, self.size - start))
+
     def __str__(self) -> str:
         s = self.backend
         if self.size is not None: